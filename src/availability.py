@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+
+""" In-memory index of employee availability
+
+For each restaurant and week (Monday to Sunday) the index keeps a bit set of employees
+for every 15 minute slot of the week and availability level. Finding who can work a
+time is then an AND of the bit sets of the slots the time covers, no matter how many
+employees there are.
+
+The index subscribes to the database and re-reads the availability of only the
+employees whose availability changed. Changes committed by other processes are not
+reported, so each lookup also checks the model.DataVersions of the restaurant's
+availability and reloads the restaurant when another process changed it.
+"""
+
+import collections
+import datetime
+import math
+import threading
+
+import intervals
+import model
+import solver
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = intervals.MINUTES_PER_DAY // SLOT_MINUTES
+SLOTS_PER_WEEK = 7 * SLOTS_PER_DAY
+LEVELS = (1, 2, 3)  # want to work, could work, prefer not to work
+WEEKS_CACHED = 64
+AVAILABILITY_TABLES = ("user_availability",)
+
+
+def bits(value):
+    """the indexes of the bits set in value"""
+    while value:
+        lowest = value & -value
+        yield lowest.bit_length() - 1
+        value ^= lowest
+
+
+def slot_mask(first, last):
+    """bit mask of the slots from first up to (not including) last"""
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def employee_masks(availabilities, week):
+    """The slots of the week an employee can work
+    availabilities - the employee's UserAvailability for the restaurant
+    week - the Monday of the week
+    returns [slot mask for each of LEVELS], where the mask for a level has the
+    slots available at that level or better and not marked cannot work
+    """
+    masks = collections.defaultdict(int)
+
+    for availability in availabilities:
+        start, end = intervals.time_range(
+            availability.start_time, availability.end_time
+        )
+        level = min(int(availability.priority), solver.CANNOT_WORK)
+
+        for offset in range(-1, 7):  # the Sunday before may run past midnight
+            date = week + datetime.timedelta(days=offset)
+            if date.weekday() != availability.day_of_week or not solver.in_date_range(
+                availability, date
+            ):
+                continue
+
+            base = offset * SLOTS_PER_DAY
+            if level == solver.CANNOT_WORK:  # any part of a slot blocks the slot
+                first = base + start // SLOT_MINUTES
+                last = base + math.ceil(end / SLOT_MINUTES)
+            else:  # only slots that are completely covered
+                first = base + math.ceil(start / SLOT_MINUTES)
+                last = base + end // SLOT_MINUTES
+            masks[level] |= slot_mask(max(first, 0), min(last, SLOTS_PER_WEEK))
+
+    cannot_work = masks[solver.CANNOT_WORK]
+    cumulative = 0
+    result = []
+    for level in LEVELS:
+        cumulative |= masks[level]
+        result.append(cumulative & ~cannot_work)
+    return result
+
+
+class WeekIndex:
+    """The availability of the employees of a restaurant for one week
+    slots[level - 1][slot] - bit set of the employee indexes that can work the slot
+        at the level or better
+    employees[employee index] - employee_masks() for the employee
+    """
+
+    def __init__(self):
+        """empty week"""
+        self.slots = [[0] * SLOTS_PER_WEEK for _ in LEVELS]
+        self.employees = {}
+
+    def set_employee(self, index, masks):
+        """Replace the availability of an employee
+        index - the employee's bit
+        masks - employee_masks() for the employee
+        """
+        bit = 1 << index
+        previous = self.employees.get(index, [0] * len(LEVELS))
+
+        for column, old, new in zip(self.slots, previous, masks):
+            for slot in bits(old & ~new):
+                column[slot] &= ~bit
+            for slot in bits(new & ~old):
+                column[slot] |= bit
+
+        self.employees[index] = masks
+
+    def available(self, first, last, level):
+        """bit set of the employees that can work every slot from first up to last"""
+        column = self.slots[level - 1]
+        result = column[first] if first < last else 0
+
+        for slot in range(first + 1, last):
+            if not result:
+                break
+            result &= column[slot]
+
+        return result
+
+
+# R0902: Too many instance attributes (8/7) (too-many-instance-attributes)
+class AvailabilityIndex:  # pylint: disable=R0902
+    """Answers who can work when for every restaurant"""
+
+    def __init__(self, database, weeks_cached=WEEKS_CACHED):
+        """database - the model.Database to read from and subscribe to
+        weeks_cached - the number of (restaurant, week) indexes to keep
+        """
+        self.__database = database
+        self.__weeks_cached = weeks_cached
+        self.__lock = threading.Lock()
+        self.__weeks = collections.OrderedDict()
+        self.__employee_bits = collections.defaultdict(dict)
+        self.__employee_ids = collections.defaultdict(list)
+        self.__stale = collections.defaultdict(set)
+        self.__versions = {}  # restaurant_id: the model.DataVersions it was read at
+        database.subscribe(self.__changed)
+
+    def __changed(self, changes):
+        with self.__lock:
+            for change in changes:
+                if change.table != "user_availability":
+                    continue
+                for values in (change.values, dict(change.values, **change.previous)):
+                    self.__stale[values["restaurant_id"]].add(values["user_id"])
+            for versions in self.__versions.values():
+                model.follow_versions(versions, changes)
+
+    def __check(self, restaurant_id, versions):
+        """drop the weeks of a restaurant if another process changed its availability
+        since they were read (lock must be held)
+        versions - the model.DataVersions of the restaurant's availability now
+        """
+        if self.__versions.get(restaurant_id) == versions:
+            return
+        for key in [k for k in self.__weeks if k[0] == restaurant_id]:
+            del self.__weeks[key]
+        self.__stale.pop(restaurant_id, None)
+        self.__versions[restaurant_id] = versions
+
+    def __bit(self, restaurant_id, user_id):
+        employee_bits = self.__employee_bits[restaurant_id]
+        if user_id not in employee_bits:
+            employee_bits[user_id] = len(self.__employee_ids[restaurant_id])
+            self.__employee_ids[restaurant_id].append(user_id)
+        return employee_bits[user_id]
+
+    def __load(self, restaurant_id, weeks, user_ids=None):
+        """(re)load the employees' availability into the restaurant's week indexes"""
+        by_user = collections.defaultdict(list)
+        for availability in self.__database.get_availabilities(restaurant_id, user_ids):
+            by_user[availability.user_id].append(availability)
+
+        for week, week_index in weeks:
+            for user_id in by_user if user_ids is None else user_ids:
+                week_index.set_employee(
+                    self.__bit(restaurant_id, user_id),
+                    employee_masks(by_user[user_id], week),
+                )
+
+    def __week(self, restaurant_id, week):
+        """the up to date WeekIndex for the restaurant (lock must be held)"""
+        stale = self.__stale.pop(restaurant_id, None)
+        if stale:
+            cached = [
+                (w, i) for (r, w), i in self.__weeks.items() if r == restaurant_id
+            ]
+            self.__load(restaurant_id, cached, stale)
+
+        key = (restaurant_id, week)
+        if key in self.__weeks:
+            self.__weeks.move_to_end(key)
+            return self.__weeks[key]
+
+        week_index = WeekIndex()
+        self.__load(restaurant_id, [(week, week_index)])
+        self.__weeks[key] = week_index
+        while len(self.__weeks) > self.__weeks_cached:
+            self.__weeks.popitem(last=False)
+        return week_index
+
+    def __available_bits(self, restaurant_id, date, start, end, level):
+        week = solver.week_start(date)
+        base = solver.as_date(date).weekday() * SLOTS_PER_DAY
+        first = base + start // SLOT_MINUTES
+        last = base + math.ceil(end / SLOT_MINUTES)
+        result = -1
+
+        while True:  # times may run past the end of the week
+            week_index = self.__week(restaurant_id, week)
+            result &= week_index.available(first, min(last, SLOTS_PER_WEEK), level)
+            if last <= SLOTS_PER_WEEK or not result:
+                return result
+            week += datetime.timedelta(days=7)
+            first, last = 0, last - SLOTS_PER_WEEK
+
+    def available(self, restaurant_id, date, start_time, end_time, level=LEVELS[-1]):
+        """The ids of the employees that can work the whole time on the date
+        start_time / end_time - minutes since midnight (end may be past midnight)
+        level - the worst availability to accept (1 want, 2 could, 3 prefer not)
+        """
+        start, end = intervals.time_range(start_time, end_time)
+        versions = self.__database.get_data_versions(
+            AVAILABILITY_TABLES, [restaurant_id]
+        )
+        with self.__lock:
+            self.__check(restaurant_id, versions)
+            employee_ids = self.__employee_ids[restaurant_id]
+            return {
+                employee_ids[b]
+                for b in bits(
+                    self.__available_bits(restaurant_id, date, start, end, level)
+                )
+            }
+
+    def levels(self, restaurant_id, date, start_time, end_time):
+        """{employee id: best level they can work the whole time at} for employees
+        that can work the time on the date"""
+        start, end = intervals.time_range(start_time, end_time)
+        found = {}
+        versions = self.__database.get_data_versions(
+            AVAILABILITY_TABLES, [restaurant_id]
+        )
+        with self.__lock:
+            self.__check(restaurant_id, versions)
+            employee_ids = self.__employee_ids[restaurant_id]
+            for level in LEVELS:
+                available = self.__available_bits(
+                    restaurant_id, date, start, end, level
+                )
+                for bit in bits(available):
+                    found.setdefault(employee_ids[bit], level)
+        return found
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+""" Generating the draft schedules of many restaurants at once
+
+Restaurants are scheduled independently, so generate_all() splits them across a pool of
+worker processes. Each worker opens its own model.Database (engines and sessions cannot
+be shared between processes) and replaces the drafts of a restaurant in one transaction.
+"""
+
+import collections
+import concurrent.futures
+import os
+import time
+
+import model
+import solver
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+WORKER = {}  # "database": the model.Database of a worker process
+
+# error - why the restaurant was not generated, None if it was
+Generated = collections.namedtuple(
+    "Generated", ["restaurant_id", "assigned", "unfilled", "seconds", "error"]
+)
+
+
+def start_worker(storage_url, engine_options):
+    """open the database of a worker process"""
+    WORKER["database"] = model.Database(storage_url, engine_options=engine_options)
+
+
+def generate(restaurant_id, start_date, days):
+    """replace the draft schedule of a restaurant, in a worker process
+    returns Generated
+    """
+    started = time.perf_counter()
+    result = solver.generate_schedule(
+        WORKER["database"], restaurant_id, start_date, days
+    )
+    return Generated(
+        restaurant_id,
+        len(result.assignments),
+        sum(u.count for u in result.unfilled),
+        time.perf_counter() - started,
+        None,
+    )
+
+
+# R0913: Too many arguments (7/5) (too-many-arguments)
+def generate_all(
+    storage_url,
+    start_date,
+    days=7,
+    *,
+    workers=DEFAULT_WORKERS,
+    engine_options=None,
+    restaurant_ids=None,
+    report=None,
+):
+    """generate the draft schedules of restaurants from start_date for days
+    workers - the number of processes (default one per CPU)
+    engine_options - the model.EngineOptions for each worker's database
+    restaurant_ids - the restaurants to generate (default all of them)
+    report - called with the Generated of each restaurant as it finishes
+    returns [Generated, ...] in the order they finished
+    """
+    # pylint: disable=R0913
+    if restaurant_ids is None:
+        database = model.Database(storage_url, engine_options=engine_options)
+        restaurant_ids = [r.id for r in database.get_restaurants()]
+    report = report or (lambda generated: None)
+    finished = []
+
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=start_worker,
+        initargs=(storage_url, engine_options),
+    ) as pool:
+        futures = {
+            pool.submit(generate, r, start_date, days): r for r in restaurant_ids
+        }
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                generated = future.result()
+            # W0703: Catching too general exception Exception (broad-except)
+            except Exception as error:  # pylint: disable=W0703
+                generated = Generated(futures[future], 0, 0, 0.0, repr(error))
+            report(generated)
+            finished.append(generated)
+
+    return finished
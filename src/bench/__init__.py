@@ -0,0 +1,6 @@
+""" Benchmarks of the hot paths against generated data
+
+Run from the src directory:
+    python3 -m bench.run --restaurants 50 --employees 5000 --output bench.json
+    python3 -m bench.run --baseline bench.json
+"""
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+""" Seeded generator of restaurants, employees, availabilities and shifts
+
+The records are in the form Database.bulk_import() takes, so the same data can be
+written out and loaded with `scheduling.py import`.
+"""
+
+import collections
+import datetime
+import random
+
+ROLES = ["Server", "Cook", "Host", "Busser", "Dishwasher", "Bartender"]
+FIRST_NAMES = ["Alex", "Brianna", "Carlos", "Dana", "Eli", "Fatima", "Gus", "Hana"]
+LAST_NAMES = ["Ito", "Jones", "Khan", "Lopez", "Moreau", "Nguyen", "Olsen", "Park"]
+SHIFT_TIMES = [(7, 15), (9, 17), (11, 15), (16, 23), (17, 1), (22, 6)]
+SECOND_RESTAURANT_CHANCE = 0.1  # employees that also work at another restaurant
+
+
+def employee_email(index):
+    """the email of the generated employee"""
+    return f"employee{index}@bench.example.com"
+
+
+def restaurant_of(index, restaurant_ids):
+    """the restaurant a generated employee works at first"""
+    return restaurant_ids[index % len(restaurant_ids)]
+
+
+Sizes = collections.namedtuple("Sizes", ["employees", "availabilities", "shifts"])
+
+
+def monday_midnight(date):
+    """midnight on the Monday of the date's week"""
+    return datetime.datetime.combine(
+        date - datetime.timedelta(days=date.weekday()), datetime.time()
+    )
+
+
+def users(restaurant_ids, employees, randomizer):
+    """user records, each employee joins one (sometimes two) restaurants"""
+    for index in range(0, employees):
+        homes = [restaurant_of(index, restaurant_ids)]
+        if randomizer.random() < SECOND_RESTAURANT_CHANCE:
+            homes.append(randomizer.choice(restaurant_ids))
+        for restaurant_id in homes:
+            yield (
+                "user",
+                {
+                    "email": employee_email(index),
+                    "name": f"{randomizer.choice(FIRST_NAMES)} "
+                    + f"{randomizer.choice(LAST_NAMES)}",
+                    "password": f"password{index}",
+                    "hours_limit": randomizer.choice([None, 20.0, 32.0, 40.0]),
+                    "admin": False,
+                    "restaurant_id": restaurant_id,
+                },
+            )
+
+
+def availabilities(restaurant_ids, sizes, randomizer, start_date):
+    """availability records at each employee's first restaurant"""
+    for index in range(0, sizes.employees):
+        for _ in range(0, sizes.availabilities):
+            begin = randomizer.randrange(6 * 60, 18 * 60, 30)
+            yield (
+                "availability",
+                {
+                    "email": employee_email(index),
+                    "restaurant_id": restaurant_of(index, restaurant_ids),
+                    "day_of_week": randomizer.randrange(0, 7),
+                    "start_time": begin,
+                    "end_time": min(begin + randomizer.randrange(4, 12) * 60, 1439),
+                    "start_date": start_date,
+                    "end_date": start_date + datetime.timedelta(days=365),
+                    "priority": randomizer.choice([1.0, 1.0, 2.0, 3.0, 4.0]),
+                    "note": None,
+                },
+            )
+
+
+def shifts(restaurant_ids, count, randomizer, start_date):
+    """count shift records for each restaurant, spread over the week"""
+    for restaurant_id in restaurant_ids:
+        for index in range(0, count):
+            begin, end = randomizer.choice(SHIFT_TIMES)
+            yield (
+                "shift",
+                {
+                    "restaurant_id": restaurant_id,
+                    "day_of_week": index % 7,
+                    "start_time": begin * 60,
+                    "end_time": end * 60,
+                    "start_date": start_date,
+                    "end_date": start_date + datetime.timedelta(days=365),
+                    "priority": float(randomizer.randint(1, 3)),
+                    "roles": {
+                        r: randomizer.randint(1, 3)
+                        for r in randomizer.sample(ROLES, randomizer.randint(1, 3))
+                    },
+                },
+            )
+
+
+def records(restaurant_ids, sizes, seed=1, start=None):
+    """Generate the records for a set of restaurants
+    restaurant_ids - the restaurants (already created) to fill
+    sizes - Sizes, employees is the total number of employees, spread evenly over the
+        restaurants, availabilities is per employee and shifts is per restaurant
+    seed - the same seed always generates the same records
+    start - the first date entries are in force (default the Monday of this week)
+    yields (kind, fields)
+    """
+    randomizer = random.Random(seed)
+    start_date = monday_midnight(datetime.date.today() if start is None else start)
+
+    for restaurant_id in restaurant_ids:
+        for role in ROLES:
+            yield ("role", {"restaurant_id": restaurant_id, "name": role})
+
+    yield from users(restaurant_ids, sizes.employees, randomizer)
+    yield from availabilities(restaurant_ids, sizes, randomizer, start_date)
+    yield from shifts(restaurant_ids, sizes.shifts, randomizer, start_date)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+""" Time the hot paths of the app against generated data
+
+    python3 -m bench.run [--restaurants N] [--employees M] [--output results.json]
+        [--baseline previous.json]
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import identity
+import model
+import passwords
+import scheduling
+import snapshot
+import solver
+
+from bench import generate
+
+UI_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ui")
+STORM_THREADS = 32  # request threads logging in at once
+
+
+class Timings:
+    """The time taken by each call of each benchmark"""
+
+    def __init__(self):
+        """no timings"""
+        self.seconds = {}
+
+    def time(self, name, function, *args, **kwargs):
+        """call function(*args, **kwargs) and add its time to the named benchmark"""
+        started = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.seconds.setdefault(name, []).append(time.perf_counter() - started)
+        return result
+
+    def summary(self):
+        """{name: {count, total, mean, median, min, max}} in seconds"""
+        return {
+            name: {
+                "count": len(times),
+                "total": sum(times),
+                "mean": statistics.mean(times),
+                "median": statistics.median(times),
+                "min": min(times),
+                "max": max(times),
+            }
+            for name, times in self.seconds.items()
+        }
+
+
+def git_commit():
+    """the commit being benchmarked, if known"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def populate(database, args, timings):
+    """create the restaurants and import the generated records
+    returns {restaurant_id: gm user id}
+    """
+    with database.transaction():
+        restaurant_ids = [
+            database.create_restaurant(f"Restaurant {r}").id
+            for r in range(0, args.restaurants)
+        ]
+    records = list(
+        generate.records(
+            restaurant_ids,
+            generate.Sizes(args.employees, args.availabilities, args.shifts),
+            args.seed,
+        )
+    )
+    counts = timings.time("bulk_import", database.bulk_import, records)
+    print(f"Imported {sum(counts.values())} records", file=sys.stderr)
+
+    gms = {}
+    with database.transaction():
+        for index, restaurant_id in enumerate(restaurant_ids):
+            gm = database.find_user(generate.employee_email(index))
+            database.get_restaurant(restaurant_id).gm_id = gm.id
+            gms[restaurant_id] = gm.id
+    return gms
+
+
+def get_page(client, user_id, url):
+    """fetch a page as a user, fails if the page is not there"""
+    client.set_cookie(
+        scheduling.USER_ID_COOKIE,
+        identity.session_token(client.application.secret_key, user_id),
+    )
+    response = client.get(url)
+    assert response.status_code == 200, f"{url} returned {response.status_code}"
+    return response
+
+
+def bench_model(database, emails, gms, timings):
+    """time the database calls"""
+    randomizer = random.Random(len(emails))
+
+    for email in emails:
+        timings.time("find_user", database.find_user, email)
+
+    for email in emails:
+        user = database.find_user(email)
+        restaurant = database.get_restaurant(randomizer.choice(list(gms)))
+        timings.time(
+            "add_user_to_restaurant", database.add_user_to_restaurant, user, restaurant
+        )
+        database.flush()
+
+    database.remove_session()
+
+
+def bench_pages(database, args, employees, gms, timings):
+    """time logging in and the pages"""
+    app = scheduling.create_app(
+        args.storage, UI_PATH, os.path.join(UI_PATH, "template")
+    )
+    client = app.test_client()
+    admin_id = database.create_user(
+        "admin@bench.example.com", "admin", "Admin", admin=True
+    ).id
+
+    for employee in employees:
+        email = generate.employee_email(employee)
+        timings.time(
+            "login",
+            client.post,
+            "/login",
+            data={"email": email, "password": f"password{employee}"},
+        )
+        user_id = database.find_user(email).id
+        database.remove_session()
+        timings.time("welcome_employee", get_page, client, user_id, "/welcome")
+
+    for restaurant_id, gm_id in list(gms.items())[: args.repeat]:
+        url = f"/restaurant/{restaurant_id}"
+        timings.time("restaurant_page_gm", get_page, client, gm_id, url)
+        timings.time("restaurant_page_admin", get_page, client, admin_id, url)
+
+    for _ in range(0, min(args.repeat, 3)):
+        timings.time("welcome_admin", get_page, client, admin_id, "/welcome")
+
+
+def bench_passwords(args, timings):
+    """time hashing and checking a password at the default cost, one at a time and
+    in a storm of logins from many request threads at once"""
+    hasher = passwords.default_hasher()
+    stored = timings.time("password_hash", hasher.hash, "password")
+    for _ in range(0, args.repeat):
+        timings.time("password_verify", hasher.verify, "password", stored)
+
+    logins = args.repeat * 4
+    with concurrent.futures.ThreadPoolExecutor(max_workers=STORM_THREADS) as threads:
+        timings.time(
+            "login_storm",
+            lambda: list(
+                threads.map(lambda _: hasher.verify("password", stored), range(logins))
+            ),
+        )
+    seconds = timings.seconds["login_storm"][-1]
+    print(
+        f"{logins / seconds:.1f} logins/second ({hasher.scheme.name} "
+        + f"{hasher.scheme.parameters()})",
+        file=sys.stderr,
+    )
+
+
+def bench_schedule(database, args, gms, timings):
+    """time generating a week of schedule"""
+    monday = solver.week_start(datetime.date.today())
+
+    for restaurant_id in list(gms)[: args.repeat]:
+        timings.time(
+            "load_snapshot",
+            snapshot.RestaurantSnapshot.load,
+            database,
+            restaurant_id,
+        )
+        timings.time(
+            "generate_schedule",
+            solver.generate_schedule,
+            database,
+            restaurant_id,
+            monday,
+            7,
+        )
+        database.remove_session()
+
+
+def run(args):
+    """run the benchmarks, returns the results"""
+    randomizer = random.Random(args.seed)
+    timings = Timings()
+    database = model.Database(args.storage)
+    gms = populate(database, args, timings)
+    employees = [randomizer.randrange(0, args.employees) for _ in range(0, args.repeat)]
+
+    bench_model(database, [generate.employee_email(e) for e in employees], gms, timings)
+    bench_pages(database, args, employees, gms, timings)
+    bench_passwords(args, timings)
+    bench_schedule(database, args, gms, timings)
+    database.close()
+
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "when": datetime.datetime.now().isoformat(timespec="seconds"),
+        "parameters": {
+            "restaurants": args.restaurants,
+            "employees": args.employees,
+            "availabilities": args.availabilities,
+            "shifts": args.shifts,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "password_scheme": passwords.default_hasher().scheme.parameters(),
+        },
+        "results": timings.summary(),
+    }
+
+
+def compare(results, baseline):
+    """print the change in median time from a baseline run"""
+    print(f"{'benchmark':26} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, now in sorted(results["results"].items()):
+        before = baseline["results"].get(name)
+        if before is None or before["median"] == 0:
+            print(f"{name:26} {'':>10} {now['median']:10.4f}")
+            continue
+        change = (now["median"] / before["median"] - 1.0) * 100.0
+        print(
+            f"{name:26} {before['median']:10.4f} {now['median']:10.4f} {change:+7.1f}%"
+        )
+
+
+def parse_args():
+    """Parses and returns command line arguments."""
+    parser = argparse.ArgumentParser(description="Benchmark the scheduling app.")
+    parser.add_argument("-r", "--restaurants", type=int, default=5)
+    parser.add_argument("-e", "--employees", type=int, default=500)
+    parser.add_argument(
+        "-a",
+        "--availabilities",
+        type=int,
+        default=7,
+        help="availability entries per employee (default 7)",
+    )
+    parser.add_argument(
+        "--shifts", type=int, default=21, help="shifts per restaurant (default 21)"
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=20, help="calls per benchmark (default 20)"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "-s",
+        "--storage",
+        help="SqlAlchemy url of an empty database (default a temporary sqlite file)",
+    )
+    parser.add_argument("-o", "--output", help="write the results to this json file")
+    parser.add_argument("-b", "--baseline", help="json results to compare against")
+    return parser.parse_args()
+
+
+def main():
+    """Entry point"""
+    args = parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.storage is None:
+            args.storage = "sqlite:///" + os.path.join(directory, "bench.sqlite3")
+        results = run(args)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
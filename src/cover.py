@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+
+""" Ranking the employees that could cover a scheduled shift
+
+Who can work the time comes from the availability.AvailabilityIndex. The rest of what
+the ranking needs (role preferences, hours limits and who is already working when) is
+kept per restaurant, in a snapshot.RestaurantSnapshot and plain Python structures, so a
+request only reads the scheduled shift being covered. The cached data is dropped when
+the database reports a change to the tables it came from. Changes committed by other
+processes are not reported, so each request also checks the model.DataVersions of the
+restaurant's tables.
+"""
+
+import collections
+import datetime
+import threading
+
+import model
+import snapshot
+import solver
+
+WEEKS_CACHED = 8  # weeks of scheduled shifts kept for each restaurant
+# the tables the snapshot of a restaurant and the weeks of scheduled shifts come from
+SNAPSHOT_TABLES = (
+    "role",
+    "shift",
+    "shift_roles",
+    "user",
+    "user_limits",
+    "user_role_preference",
+)
+WEEK_TABLES = ("scheduled_shift",)
+
+Candidate = collections.namedtuple(
+    "Candidate",
+    [
+        "user_id",
+        "name",
+        "availability",
+        "priority",
+        "gm_priority",
+        "hours_remaining",
+        "over_limit",
+    ],
+)
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+class RestaurantCache:  # pylint: disable=R0903
+    """What is needed to rank employees for a restaurant
+    snapshot - the snapshot.RestaurantSnapshot of the restaurant
+    versions - the model.DataVersions of SNAPSHOT_TABLES and WEEK_TABLES they were
+        read at
+    weeks - {Monday: (busy, minutes)} where busy is {user_id: [(start, end), ...]} in
+        minutes since day 1 and minutes is {user_id: minutes scheduled that week} from
+        model.ScheduledMinutes
+    """
+
+    def __init__(self, restaurant, versions):
+        """restaurant - the snapshot.RestaurantSnapshot
+        versions - the model.DataVersions it was read at
+        """
+        self.snapshot = restaurant
+        self.versions = versions
+        self.weeks = collections.OrderedDict()
+
+    def rank(self, scheduled, levels, week, times):
+        """Rank the employees that could take over a scheduled shift
+        scheduled - the ScheduledShift
+        levels - {user_id: availability level} for those that can work the time
+        week - the (busy, minutes) entry of weeks for the week of the shift
+        times - (start, end) of the shift in minutes since day 1
+        returns [Candidate, ...] best first
+        """
+        busy, minutes = week
+        ranked = []
+
+        for gm_priority, priority, user_id, employee in self.snapshot.candidates(
+            scheduled.role_id
+        ):
+            level = levels.get(user_id)
+            if user_id == scheduled.user_id or level is None:
+                continue
+            if any(s < times[1] and e > times[0] for s, e in busy[user_id]):
+                continue
+            limit = self.snapshot.limit(user_id)
+            remaining = None if limit is None else limit - minutes[user_id]
+            ranked.append(
+                Candidate(
+                    user_id,
+                    self.snapshot.names[employee],
+                    level,
+                    priority,
+                    gm_priority,
+                    None if remaining is None else remaining / 60.0,
+                    remaining is not None and remaining < times[1] - times[0],
+                )
+            )
+
+        ranked.sort(
+            key=lambda c: (
+                c.over_limit,
+                c.availability,
+                c.gm_priority,
+                c.priority,
+                -(float("inf") if c.hours_remaining is None else c.hours_remaining),
+                c.user_id,
+            )
+        )
+        return ranked
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+class CoverIndex:  # pylint: disable=R0903
+    """Ranks the employees that could cover a scheduled shift"""
+
+    def __init__(self, database, availability_index):
+        """database - the model.Database to read from and subscribe to
+        availability_index - availability.AvailabilityIndex for the same database
+        """
+        self.__database = database
+        self.__availability = availability_index
+        self.__lock = threading.Lock()
+        self.__restaurants = {}
+        self.__role_restaurant = {}
+        self.__shift_restaurant = {}
+        database.subscribe(self.__changed)
+
+    def __changed(self, changes):
+        with self.__lock:
+            for change in changes:
+                values = dict(change.values, **change.previous)
+
+                if change.table == "scheduled_shift":
+                    restaurant_id = self.__shift_restaurant.get(values["shift_id"])
+                    # a shift not seen yet may be of any restaurant
+                    for cached_id, cache in self.__restaurants.items():
+                        if restaurant_id in (None, cached_id):
+                            cache.weeks.clear()
+                elif change.table in ("shift", "role", "user_limits"):
+                    self.__restaurants.pop(values["restaurant_id"], None)
+                elif change.table == "user_role_preference":
+                    self.__restaurants.pop(
+                        self.__role_restaurant.get(values["role_id"]), None
+                    )
+                elif change.table == "user" and values.get("id") is None:
+                    # bulk inserted users come without their ids
+                    self.__restaurants.clear()
+                elif change.table == "user":
+                    for restaurant_id, cache in list(self.__restaurants.items()):
+                        if cache.snapshot.employee(values["id"]) is not None:
+                            del self.__restaurants[restaurant_id]
+            for cache in self.__restaurants.values():
+                model.follow_versions(cache.versions, changes)
+
+    def __restaurant(self, restaurant_id, versions):
+        """the RestaurantCache for a restaurant (lock must be held)
+        versions - the model.DataVersions of the restaurant's tables now, the cache is
+            reloaded if another process changed them
+        """
+        cache = self.__restaurants.get(restaurant_id)
+        if cache is not None and cache.versions != versions:
+            if any(
+                cache.versions.get(k) != v
+                for k, v in versions.items()
+                if k[1] in SNAPSHOT_TABLES
+            ):
+                del self.__restaurants[restaurant_id]
+            else:
+                cache.weeks.clear()
+                cache.versions = versions
+        if restaurant_id not in self.__restaurants:
+            restaurant = snapshot.RestaurantSnapshot.load(
+                self.__database, restaurant_id
+            )
+            self.__role_restaurant.update(
+                {r: restaurant_id for r in restaurant.role_ids}
+            )
+            self.__shift_restaurant.update(
+                {s: restaurant_id for s in restaurant.shift_ids}
+            )
+            self.__restaurants[restaurant_id] = RestaurantCache(restaurant, versions)
+        return self.__restaurants[restaurant_id]
+
+    def __week(self, restaurant_id, cache, week):
+        """(busy, minutes) for the week (lock must be held)"""
+        if week in cache.weeks:
+            cache.weeks.move_to_end(week)
+            return cache.weeks[week]
+
+        busy = collections.defaultdict(list)
+        first = solver.as_datetime(week)
+        minutes = collections.defaultdict(
+            float,
+            {
+                u: sum(m)
+                for (u, _), m in self.__database.get_scheduled_minutes(
+                    restaurant_id, first, first + datetime.timedelta(days=7)
+                ).items()
+            },
+        )
+        # a day either side for shifts that run past midnight into or out of the week
+        for scheduled in self.__database.get_scheduled_shifts(
+            restaurant_id,
+            first - datetime.timedelta(days=1),
+            first + datetime.timedelta(days=8),
+        ):
+            start, end = solver.absolute_minutes(
+                scheduled.date, scheduled.shift.start_time, scheduled.shift.end_time
+            )
+            busy[scheduled.user_id].append((start, end))
+
+        cache.weeks[week] = (busy, minutes)
+        while len(cache.weeks) > WEEKS_CACHED:
+            cache.weeks.popitem(last=False)
+        return cache.weeks[week]
+
+    def candidates(self, scheduled):
+        """Rank the employees that could cover a scheduled shift
+        scheduled - the ScheduledShift (with its shift) that needs covering
+        returns [Candidate, ...] best first. Employees that cannot work the time, are
+            already working then or do not do the role are left out. Employees the
+            shift would put over their hours limit are ranked after everyone else.
+        """
+        shift = scheduled.shift
+        restaurant_id = shift.restaurant_id
+        date = solver.as_date(scheduled.date)
+        levels = self.__availability.levels(
+            restaurant_id, date, shift.start_time, shift.end_time
+        )
+        versions = self.__database.get_data_versions(
+            SNAPSHOT_TABLES + WEEK_TABLES, [restaurant_id]
+        )
+        with self.__lock:
+            cache = self.__restaurant(restaurant_id, versions)
+            week = self.__week(restaurant_id, cache, solver.week_start(date))
+            return cache.rank(
+                scheduled,
+                levels,
+                week,
+                solver.absolute_minutes(date, shift.start_time, shift.end_time),
+            )
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+""" Exporting published schedules as CSV, iCalendar or JSON lines
+
+The formats are generators of text, one row at a time, so a schedule is written out
+as it is read from the database (see model.Database.iter_published_shifts) and an
+export of any size uses the same memory. chunked() joins the lines into writes of a
+reasonable size.
+"""
+
+import csv
+import datetime
+import io
+import json
+
+import intervals
+
+MIMETYPES = {
+    "csv": "text/csv",
+    "ics": "text/calendar",
+    "ndjson": "application/x-ndjson",
+}
+FORMATS = tuple(MIMETYPES)
+CHUNK_CHARACTERS = 16 * 1024
+CSV_COLUMNS = [
+    "id",
+    "date",
+    "start",
+    "end",
+    "hours",
+    "role",
+    "user_id",
+    "name",
+    "email",
+    "notes",
+]
+ICS_LINE_OCTETS = 75
+ICS_PRODUCT = "-//Restaurant Scheduling//Schedule Export//EN"
+ICS_UID_DOMAIN = "restaurant-scheduling"
+
+
+def shift_times(row):
+    """the start and end datetimes of an exported shift (the end may be the next day)"""
+    day = datetime.datetime(row.date.year, row.date.month, row.date.day)
+    start, end = intervals.time_range(row.start_time, row.end_time)
+    return (
+        day + datetime.timedelta(minutes=start),
+        day + datetime.timedelta(minutes=end),
+    )
+
+
+def fields(row):
+    """the CSV_COLUMNS of an exported shift"""
+    start, end = shift_times(row)
+    return {
+        "id": row.id,
+        "date": start.strftime("%Y-%m-%d"),
+        "start": start.strftime("%Y-%m-%d %H:%M"),
+        "end": end.strftime("%Y-%m-%d %H:%M"),
+        "hours": round((end - start).total_seconds() / 3600.0, 2),
+        "role": row.role,
+        "user_id": row.user_id,
+        "name": row.name,
+        "email": row.email,
+        "notes": row.notes or "",
+    }
+
+
+def csv_lines(rows):
+    """a header line then a CSV line for each exported shift"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, CSV_COLUMNS)
+    writer.writeheader()
+
+    for row in rows:
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(fields(row))
+
+    yield buffer.getvalue()
+
+
+def ndjson_lines(rows):
+    """a JSON object on a line for each exported shift"""
+    for row in rows:
+        yield json.dumps(fields(row)) + "\n"
+
+
+def ics_text(value):
+    """escape a TEXT value"""
+    return (
+        value.replace("\\", "\\\\")
+        .replace(";", "\\;")
+        .replace(",", "\\,")
+        .replace("\n", "\\n")
+    )
+
+
+def ics_line(line):
+    """a content line folded to at most ICS_LINE_OCTETS octets per line"""
+    encoded = line.encode("utf-8")
+    folded = []
+    while len(encoded) > ICS_LINE_OCTETS:
+        cut = ICS_LINE_OCTETS - (1 if folded else 0)
+        while cut > 0 and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1  # do not split a UTF-8 character
+        folded.append(encoded[:cut])
+        encoded = encoded[cut:]
+    folded.append(encoded)
+    return b"\r\n ".join(folded).decode("utf-8") + "\r\n"
+
+
+def ics_lines(rows, title, stamp=None):
+    """an iCalendar (RFC 5545) calendar with an event for each exported shift
+    title - the name of the calendar
+    stamp - the datetime (UTC) the calendar was made (default now)
+    """
+    stamp = (stamp or datetime.datetime.now(datetime.timezone.utc)).strftime(
+        "%Y%m%dT%H%M%SZ"
+    )
+    yield "".join(
+        ics_line(line)
+        for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{ICS_PRODUCT}",
+            "CALSCALE:GREGORIAN",
+            f"X-WR-CALNAME:{ics_text(title)}",
+        ]
+    )
+
+    for row in rows:
+        start, end = shift_times(row)
+        event = [
+            "BEGIN:VEVENT",
+            f"UID:scheduled-shift-{row.id}@{ICS_UID_DOMAIN}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+            f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}",
+            f"SUMMARY:{ics_text(f'{row.role} - {row.name}')}",
+            f"LOCATION:{ics_text(row.restaurant)}",
+        ]
+        if row.notes:
+            event.append(f"DESCRIPTION:{ics_text(row.notes)}")
+        event.append("END:VEVENT")
+        yield "".join(ics_line(line) for line in event)
+
+    yield ics_line("END:VCALENDAR")
+
+
+def lines(export_format, rows, title):
+    """the lines of rows in an export format (one of FORMATS)
+    title - the name of the calendar (iCalendar only)
+    """
+    if export_format == "csv":
+        return csv_lines(rows)
+    if export_format == "ndjson":
+        return ndjson_lines(rows)
+    return ics_lines(rows, title)
+
+
+def chunked(texts, size=CHUNK_CHARACTERS):
+    """join texts into chunks of at least size characters (except the last), the first
+    text is passed on by itself so a download starts right away"""
+    pending = []
+    length = 0
+    first = True
+
+    for text in texts:
+        pending.append(text)
+        length += len(text)
+        if first or length >= size:
+            yield "".join(pending)
+            pending = []
+            length = 0
+            first = False
+
+    if pending:
+        yield "".join(pending)
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+""" Keeping per-process state right in forked worker processes
+
+A production server (gunicorn) may fork workers from a process that already has
+database connections, locks or thread pools. Those cannot be shared with the parent,
+so objects that hold them register a method to be called in the child after a fork.
+"""
+
+import os
+import weakref
+
+
+def after_fork_in_child(method):
+    """call a bound method in the child process after every fork, as long as its object
+    has not been garbage collected (does nothing where fork is not supported)"""
+    if not hasattr(os, "register_at_fork"):
+        return
+    reference = weakref.WeakMethod(method)
+
+    def forked():
+        bound = reference()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=forked)
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+""" Who is making a request
+
+The session cookie holds a signed, expiring token of the user's id instead of the bare
+id, so it cannot be forged or kept forever. IdentityCache keeps what most routes need
+to know about the user (admin, which restaurants they manage and work at) so those
+routes do not need to read the user from the database. Entries expire after a while
+and are dropped as soon as the database reports a change to them. A change made by
+another process (eg another gunicorn worker) shows up in the model.DataVersions of the
+users, restaurants and role preferences, which lookups check (the database reads them
+at most once every model.VERSION_POLL_SECONDS).
+
+Calendar apps cannot log in, so a user's calendar feed url holds its own signed token
+of the user's id, which does not expire.
+"""
+
+import collections
+import threading
+import time
+
+import itsdangerous
+
+import model
+
+SESSION_MAX_AGE_SECONDS = 14 * 24 * 60 * 60
+IDENTITY_TTL_SECONDS = 300
+IDENTITY_CACHE_SIZE = 10000
+IDENTITY_TABLES = ("user", "restaurant", "user_role_preference")
+TOKEN_SALT = "scheduling-session"
+FEED_TOKEN_SALT = "scheduling-feed"
+
+Identity = collections.namedtuple("Identity", ["user_id", "admin", "gm_at", "works_at"])
+
+
+def session_token(secret_key, user_id):
+    """the signed session token for a user"""
+    return itsdangerous.URLSafeTimedSerializer(secret_key, salt=TOKEN_SALT).dumps(
+        user_id
+    )
+
+
+def session_user_id(secret_key, token, max_age=SESSION_MAX_AGE_SECONDS):
+    """the user id in a session token, None if it is missing, forged or expired"""
+    if not token:
+        return None
+    try:
+        user_id = itsdangerous.URLSafeTimedSerializer(
+            secret_key, salt=TOKEN_SALT
+        ).loads(token, max_age=max_age)
+    except itsdangerous.BadData:
+        return None
+    return user_id if isinstance(user_id, int) else None
+
+
+def feed_token(secret_key, user_id):
+    """the signed token in the url of a user's calendar feed"""
+    return itsdangerous.URLSafeSerializer(secret_key, salt=FEED_TOKEN_SALT).dumps(
+        user_id
+    )
+
+
+def feed_user_id(secret_key, token):
+    """the user id in a feed token, None if it is forged"""
+    try:
+        user_id = itsdangerous.URLSafeSerializer(
+            secret_key, salt=FEED_TOKEN_SALT
+        ).loads(token)
+    except itsdangerous.BadData:
+        return None
+    return user_id if isinstance(user_id, int) else None
+
+
+def manages(found, restaurant_id):
+    """is the Identity (may be None) the general manager of the restaurant
+    restaurant_id - the id, as an int or as it is in a url
+    """
+    try:
+        return found is not None and int(restaurant_id) in found.gm_at
+    except ValueError:
+        return False
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+class IdentityCache:  # pylint: disable=R0903
+    """Recently seen Identities by user id"""
+
+    def __init__(self, database, ttl=IDENTITY_TTL_SECONDS, size=IDENTITY_CACHE_SIZE):
+        """database - the model.Database to read from and subscribe to
+        ttl - seconds an identity is used before it is read again
+        size - the most identities kept
+        """
+        self.__database = database
+        self.__ttl = ttl
+        self.__size = size
+        self.__lock = threading.Lock()
+        self.__identities = collections.OrderedDict()  # user_id: (expires, Identity)
+        self.__generation = 0  # goes up with every change, to not cache stale reads
+        self.__versions = {}  # the model.DataVersions the identities were read at
+        database.subscribe(self.__changed)
+
+    def __changed(self, changes):
+        with self.__lock:
+            for change in changes:
+                values = dict(change.values, **change.previous)
+                if change.table == "user":
+                    stale = [change.values.get("id")]
+                elif change.table == "restaurant":
+                    stale = [change.values.get("gm_id"), change.previous.get("gm_id")]
+                elif change.table == "user_role_preference":
+                    stale = [values.get("user_id")]
+                else:
+                    continue
+                self.__generation += 1
+                for user_id in stale:
+                    self.__identities.pop(user_id, None)
+            model.follow_versions(self.__versions, changes)
+
+    def get(self, user_id):
+        """The Identity of a user, None if there is no such user"""
+        if user_id is None:
+            return None
+        now = time.monotonic()
+        versions = self.__database.get_data_versions(IDENTITY_TABLES)
+
+        with self.__lock:
+            if versions != self.__versions:  # changed by another process
+                self.__identities.clear()
+                self.__versions = versions
+                self.__generation += 1
+            entry = self.__identities.get(user_id)
+            if entry is not None and entry[0] > now:
+                self.__identities.move_to_end(user_id)
+                return entry[1]
+            generation = self.__generation
+
+        user = self.__database.get_user(user_id)
+        if user is None:
+            return None
+        found = Identity(
+            user.id,
+            bool(user.admin),
+            frozenset(r.id for r in user.gm_at),
+            frozenset(p.role.restaurant_id for p in user.roles),
+        )
+
+        with self.__lock:
+            if generation != self.__generation:
+                return found  # it may have changed while it was read
+            self.__identities[user_id] = (now + self.__ttl, found)
+            self.__identities.move_to_end(user_id)
+            while len(self.__identities) > self.__size:
+                self.__identities.popitem(last=False)
+
+        return found
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+""" Interval lookups for the weekly shift templates
+
+A Shift repeats every week on its day_of_week from its start_date to its end_date. The
+ShiftIndex keeps an IntervalTree of those date ranges for each day of the week, so
+finding the shifts in force on a date does not look at every shift ever created.
+
+On a date, a newer shift replaces the older shifts it overlaps. Shifts that end at or
+before they start run past midnight into the next day, where they also replace the
+shifts they run into.
+"""
+
+import bisect
+import collections
+import datetime
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def time_range(start_time, end_time):
+    """minutes since midnight (start, end), end extends past midnight if it wraps"""
+    return (
+        (start_time, end_time + MINUTES_PER_DAY)
+        if end_time <= start_time
+        else (start_time, end_time)
+    )
+
+
+class IntervalTree:
+    """Closed intervals [start, end] that can be searched for the ones that overlap a
+    point or range. Built once in O(n log n), each search is O(log n + matches).
+
+    The intervals are kept sorted by start and searched as an implicit balanced binary
+    tree (the middle of a range is the root of that range), where each root also
+    knows the largest end in its range.
+    """
+
+    def __init__(self, intervals):
+        """intervals - iterable of (start, end, value)"""
+        self.__intervals = sorted(intervals, key=lambda i: (i[0], i[1]))
+        self.__max_end = [None] * len(self.__intervals)
+        self.__build(0, len(self.__intervals))
+
+    def __len__(self):
+        return len(self.__intervals)
+
+    def __build(self, low, high):
+        """set the largest end of each root, returns the largest end in the range"""
+        if low >= high:
+            return None
+        middle = (low + high) // 2
+        largest = self.__intervals[middle][1]
+        for child in (self.__build(low, middle), self.__build(middle + 1, high)):
+            if child is not None and child > largest:
+                largest = child
+        self.__max_end[middle] = largest
+        return largest
+
+    def overlapping(self, start, end):
+        """the values of the intervals that overlap [start, end], in start order"""
+        found = []
+        ranges = [(0, len(self.__intervals))]
+
+        while ranges:
+            low, high = ranges.pop()
+            if low >= high:
+                continue
+            middle = (low + high) // 2
+            if self.__max_end[middle] < start:
+                continue  # everything in this range ends before start
+            interval_start, interval_end, value = self.__intervals[middle]
+            if interval_start <= end:  # the right side starts after middle does
+                ranges.append((middle + 1, high))
+                if interval_end >= start:
+                    found.append((middle, value))
+            ranges.append((low, middle))
+
+        found.sort(key=lambda f: f[0])
+        return [v for _, v in found]
+
+    def at(self, point):
+        """the values of the intervals that contain point"""
+        return self.overlapping(point, point)
+
+
+def date_ordinals(shift):
+    """(first, last) day ordinals a shift template is in force (None is unbounded)"""
+    return (
+        (shift.start_date or datetime.date.min).toordinal(),
+        (shift.end_date or datetime.date.max).toordinal(),
+    )
+
+
+class ShiftIndex:
+    """Which shift templates apply on a date"""
+
+    def __init__(self, shifts):
+        """shifts - Shift (or anything with id, day_of_week, start_date, end_date,
+        start_time and end_time)"""
+        by_day = collections.defaultdict(list)
+        for shift in shifts:
+            by_day[shift.day_of_week].append((*date_ordinals(shift), shift))
+        self.__days = {d: IntervalTree(e) for d, e in by_day.items()}
+
+    def in_force(self, date):
+        """all the shifts whose date range includes the date, in start date order"""
+        tree = self.__days.get(date.weekday())
+        return [] if tree is None else tree.at(date.toordinal())
+
+    def on_date(self, date):
+        """The shifts that are worked on a date: newest first, each shift is kept unless
+        it overlaps a newer shift that was kept or a shift of the day before that runs
+        past midnight into it.
+        returns [shift, ...] in start time order
+        """
+        overnight = [
+            (start - MINUTES_PER_DAY, end - MINUTES_PER_DAY, None)
+            for start, end, _ in self.__kept(date - datetime.timedelta(days=1), [])
+            if end > MINUTES_PER_DAY
+        ]
+        return [s for _, _, s in self.__kept(date, overnight) if s is not None]
+
+    def __kept(self, date, kept):
+        """the shifts of a date kept newest first, as (start, end, shift)
+        kept - (start, end, None) of the times already taken, in start order
+        """
+        starts = [s for s, _, _ in kept]  # kept never overlap, so they stay sorted
+
+        for shift in sorted(self.in_force(date), key=lambda s: -s.id):
+            start, end = time_range(shift.start_time, shift.end_time)
+            index = bisect.bisect_right(starts, start)
+            if index > 0 and kept[index - 1][1] > start:
+                continue  # the kept shift before this one runs into it
+            if index < len(kept) and kept[index][0] < end:
+                continue  # this shift runs into the kept shift after it
+            starts.insert(index, start)
+            kept.insert(index, (start, end, shift))
+
+        return kept
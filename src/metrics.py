@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+""" Opt-in request and SQL instrumentation
+
+Metrics watches a Flask app and a SQLAlchemy engine and keeps, for each route, a
+latency histogram, the number of queries and the time spent in SQL, along with the
+slowest statements. prometheus() formats them in the Prometheus text format.
+
+Requests slower than a threshold can also have their cProfile stats written to a
+directory, to be read with pstats or snakeviz.
+"""
+
+import cProfile
+import heapq
+import os
+import re
+import threading
+import time
+
+import sqlalchemy
+from flask import request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOWEST_STATEMENTS = 10
+STATEMENT_LENGTH = 200  # characters of a statement kept
+QUERY_STARTS = "metrics_query_starts"  # connection.info key
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+class Histogram:  # pylint: disable=R0903
+    """Counts of observations at or below each bucket bound"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        """bounds - the upper bound of each bucket, increasing"""
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """add an observation"""
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+# R0903: Too few public methods (0/2) (too-few-public-methods)
+class RouteStats:  # pylint: disable=R0903
+    """What is known about the requests to a route"""
+
+    def __init__(self):
+        """no requests yet"""
+        self.latency = Histogram()
+        self.queries = 0
+        self.sql_seconds = 0.0
+
+
+def label(value):
+    """a Prometheus label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def short_statement(statement):
+    """the statement on one line, cut to STATEMENT_LENGTH characters"""
+    return re.sub(r"\s+", " ", statement).strip()[:STATEMENT_LENGTH]
+
+
+# R0902: Too many instance attributes (9/7) (too-many-instance-attributes)
+class Metrics:  # pylint: disable=R0902
+    """Request and SQL metrics for an app"""
+
+    def __init__(self, profile_dir=None, profile_threshold=1.0):
+        """profile_dir - write cProfile stats of slow requests here (None to not profile)
+        profile_threshold - seconds a request must take to have its profile written
+        """
+        self.__profile_dir = profile_dir
+        self.__profile_threshold = profile_threshold
+        self.__lock = threading.Lock()
+        self.__request = threading.local()
+        self.__routes = {}
+        self.__queries = 0
+        self.__sql_seconds = 0.0
+        self.__slowest = []  # heap of (seconds, statement)
+        self.__profiles_written = 0
+
+    # Mark: SQL
+
+    def watch_engine(self, engine):
+        """time every statement run by a SQLAlchemy engine"""
+
+        def before_cursor_execute(connection, *_):
+            connection.info.setdefault(QUERY_STARTS, []).append(time.perf_counter())
+
+        def after_cursor_execute(connection, _cursor, statement, *_):
+            seconds = time.perf_counter() - connection.info[QUERY_STARTS].pop()
+            self.__query_finished(statement, seconds)
+
+        engine_events = [
+            ("before_cursor_execute", before_cursor_execute),
+            ("after_cursor_execute", after_cursor_execute),
+        ]
+        for name, listener in engine_events:
+            sqlalchemy.event.listen(engine, name, listener)
+
+    def __query_finished(self, statement, seconds):
+        current = self.__request
+        if getattr(current, "started", None) is not None:
+            current.queries += 1
+            current.sql_seconds += seconds
+
+        with self.__lock:
+            self.__queries += 1
+            self.__sql_seconds += seconds
+            entry = (seconds, short_statement(statement))
+            if len(self.__slowest) < SLOWEST_STATEMENTS:
+                heapq.heappush(self.__slowest, entry)
+            elif entry > self.__slowest[0]:
+                heapq.heapreplace(self.__slowest, entry)
+
+    # Mark: Requests
+
+    def watch_app(self, app):
+        """time every request handled by a Flask app"""
+        app.before_request(self.__before_request)
+        app.after_request(self.__after_request)
+        app.teardown_request(self.__teardown_request)
+
+    def __before_request(self):
+        current = self.__request
+        current.queries = 0
+        current.sql_seconds = 0.0
+        current.profile = None
+        if self.__profile_dir is not None:
+            current.profile = cProfile.Profile()
+            current.profile.enable()
+        current.started = time.perf_counter()
+
+    def __after_request(self, response):
+        current = self.__request
+        if getattr(current, "started", None) is None:
+            return response
+
+        seconds = time.perf_counter() - current.started
+        current.started = None
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        key = (route, request.method)
+
+        with self.__lock:
+            stats = self.__routes.setdefault(key, RouteStats())
+            stats.latency.observe(seconds)
+            stats.queries += current.queries
+            stats.sql_seconds += current.sql_seconds
+
+        if current.profile is not None:
+            current.profile.disable()
+            if seconds >= self.__profile_threshold:
+                self.__write_profile(current.profile, route, seconds)
+            current.profile = None
+
+        return response
+
+    def __teardown_request(self, _):
+        current = self.__request
+        if getattr(current, "profile", None) is not None:
+            current.profile.disable()  # the request failed before after_request
+            current.profile = None
+        current.started = None
+
+    def __write_profile(self, profile, route, seconds):
+        with self.__lock:
+            self.__profiles_written += 1
+            number = self.__profiles_written
+        name = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        os.makedirs(self.__profile_dir, exist_ok=True)
+        profile.dump_stats(
+            os.path.join(
+                self.__profile_dir,
+                f"{time.strftime('%Y%m%d-%H%M%S')}-{number}-{name}-{seconds:.3f}s.prof",
+            )
+        )
+
+    # Mark: Reporting
+
+    def prometheus(self):
+        """the metrics in the Prometheus text exposition format"""
+        with self.__lock:
+            routes = [
+                (f'route="{label(r)}",method="{m}"', s)
+                for (r, m), s in sorted(self.__routes.items())
+            ]
+            slowest = sorted(self.__slowest, reverse=True)
+            totals = (self.__queries, self.__sql_seconds)
+        lines = metric_header(
+            "scheduling_request_seconds", "histogram", "Request latency by route"
+        )
+
+        for labels, stats in routes:
+            for bound, count in zip(stats.latency.bounds, stats.latency.counts):
+                lines.append(
+                    f'scheduling_request_seconds_bucket{{{labels},le="{bound}"}} {count}'
+                )
+            lines.append(
+                f'scheduling_request_seconds_bucket{{{labels},le="+Inf"}} '
+                + f"{stats.latency.count}"
+            )
+            lines.append(
+                f"scheduling_request_seconds_sum{{{labels}}} {stats.latency.sum}"
+            )
+            lines.append(
+                f"scheduling_request_seconds_count{{{labels}}} {stats.latency.count}"
+            )
+
+        lines += metric_header(
+            "scheduling_request_queries_total", "counter", "SQL statements by route"
+        )
+        lines += [
+            f"scheduling_request_queries_total{{{labels}}} {stats.queries}"
+            for labels, stats in routes
+        ]
+        lines += metric_header(
+            "scheduling_request_sql_seconds_total", "counter", "Time in SQL by route"
+        )
+        lines += [
+            f"scheduling_request_sql_seconds_total{{{labels}}} {stats.sql_seconds}"
+            for labels, stats in routes
+        ]
+        lines += metric_header(
+            "scheduling_sql_queries_total", "counter", "SQL statements"
+        )
+        lines.append(f"scheduling_sql_queries_total {totals[0]}")
+        lines += metric_header("scheduling_sql_seconds_total", "counter", "Time in SQL")
+        lines.append(f"scheduling_sql_seconds_total {totals[1]}")
+        lines += metric_header(
+            "scheduling_slowest_query_seconds", "gauge", "The slowest SQL statements"
+        )
+        lines += [
+            f'scheduling_slowest_query_seconds{{statement="{label(q)}"}} {t}'
+            for t, q in slowest
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def metric_header(name, kind, description):
+    """the HELP and TYPE lines of a metric"""
+    return [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
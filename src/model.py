@@ -3,14 +3,28 @@
 """ The model of the data
 """
 
+# C0302: Too many lines in module (too-many-lines)
+# pylint: disable=C0302
+
+import collections
+import contextlib
 import datetime
-import hashlib
+import functools
+import itertools
 import threading
 import time
+import weakref
 
 import sqlalchemy
+import sqlalchemy.dialects.mysql
+import sqlalchemy.dialects.postgresql
+import sqlalchemy.dialects.sqlite
 import sqlalchemy.ext.declarative
 
+import forking
+import intervals
+import passwords
+
 
 # W0223: Method 'python_type' is abstract in class 'TypeEngine' but is not overridden
 class Date(sqlalchemy.types.TypeDecorator):  # pylint: disable=W0223
@@ -33,6 +47,58 @@ class Date(sqlalchemy.types.TypeDecorator):  # pylint: disable=W0223
 
 
 Alchemy_Base = sqlalchemy.ext.declarative.declarative_base()
+SESSION_IDLE_SECONDS = 5 * 60.0  # the idle_timeout of the app's request sessions
+VERSION_POLL_SECONDS = 1.0  # DataVersions read from the database are reused this long
+SESSION_REAP_INTERVAL_SECONDS = 60.0
+BULK_BATCH_SIZE = 5000
+USER_PAGE_SIZE = 50
+MAXIMUM_USER_PAGE_SIZE = 200
+IN_CLAUSE_CHUNK = 500  # stay under SQLite's limit on bound parameters
+EXPORT_BATCH_SIZE = 1000  # rows fetched at a time when streaming an export
+IMPORT_KINDS = ("user", "role", "role_preference", "availability", "shift")
+TRANSACTION_DEPTH = "transaction_depth"  # session.info key
+CHANGES = "changes"  # session.info key
+READ_PRIMARY = "read_primary"  # session.info key, read from the primary database
+WROTE = "wrote"  # session.info key, set once the session flushes changes
+REPLICA = "replica"  # session.info key, the replica engine the session reads from
+
+Change = collections.namedtuple("Change", ["table", "action", "values", "previous"])
+EVERYONE = 0  # the ScheduleVersion user_id of changes to every employee's schedule
+# the restaurant_id get_data_versions() reports the sum of a table's DataVersions under,
+# which goes up with every change to the table anywhere (no row is kept for it)
+ANYWHERE = 0
+UNMATCHED = -1  # the DataVersion restaurant_id of changes not matched to a restaurant
+# changes to these tables are matched to a restaurant by their restaurant_id
+RESTAURANT_TABLES = ("role", "shift", "user_availability", "user_limits")
+# What scheduling a restaurant needs as plain rows, see Database.get_schedule_rows()
+ScheduleRows = collections.namedtuple(
+    "ScheduleRows",
+    ["preferences", "availabilities", "shifts", "demand", "hours_limits"],
+)
+
+# How to connect to the database
+# journal_mode, synchronous - SQLite pragmas, WAL lets readers go on while a writer
+#     writes, NORMAL only syncs at checkpoints in WAL mode (None leaves it as it is)
+# busy_timeout - milliseconds a SQLite connection waits for a lock before failing
+# mmap_size - bytes of a SQLite file read through memory mapping (0 for none)
+# pool_size, max_overflow - connections kept open and opened beyond that when busy
+#     (server databases, SQLite files open a connection per session)
+# pool_pre_ping - test pooled connections before using them (server databases)
+# pool_recycle - seconds before a pooled connection is replaced, -1 for never
+EngineOptions = collections.namedtuple(
+    "EngineOptions",
+    [
+        "journal_mode",
+        "synchronous",
+        "busy_timeout",
+        "mmap_size",
+        "pool_size",
+        "max_overflow",
+        "pool_pre_ping",
+        "pool_recycle",
+    ],
+    defaults=["wal", "normal", 5000, 64 * 1024 * 1024, 5, 10, True, -1],
+)
 
 
 # R0903: Too few public methods (0/2) (too-few-public-methods)
@@ -44,8 +110,15 @@ class ShiftRole(Alchemy_Base):  # pylint: disable=R0903
     """
 
     __tablename__ = "shift_roles"
+    __table_args__ = (
+        sqlalchemy.Index(
+            "ix_shift_roles_shift_role", "shift_id", "role_id", unique=True
+        ),
+    )
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    role_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("role.id"))
+    role_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("role.id"), index=True
+    )
     role = sqlalchemy.orm.relationship("Role")
     shift_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("shift.id"))
     shift = sqlalchemy.orm.relationship("Shift")
@@ -77,7 +150,7 @@ class Shift(Alchemy_Base):  # pylint: disable=R0903
     __tablename__ = "shift"
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     restaurant_id = sqlalchemy.Column(
-        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id")
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id"), index=True
     )
     restaurant = sqlalchemy.orm.relationship("Restaurant")
     day_of_week = sqlalchemy.Column(sqlalchemy.Integer)
@@ -113,10 +186,17 @@ class UserRolePreference(Alchemy_Base):  # pylint: disable=R0903
     """
 
     __tablename__ = "user_role_preference"
+    __table_args__ = (
+        sqlalchemy.Index(
+            "ix_user_role_preference_user_role", "user_id", "role_id", unique=True
+        ),
+    )
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"))
     user = sqlalchemy.orm.relationship("User")
-    role_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("role.id"))
+    role_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("role.id"), index=True
+    )
     role = sqlalchemy.orm.relationship("Role")
     priority = sqlalchemy.Column(sqlalchemy.Float)
     gm_priority = sqlalchemy.Column(sqlalchemy.Float)
@@ -142,10 +222,12 @@ class UserLimits(Alchemy_Base):  # pylint: disable=R0903
     __tablename__ = "user_limits"
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     restaurant_id = sqlalchemy.Column(
-        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id")
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id"), index=True
     )
     restaurant = sqlalchemy.orm.relationship("Restaurant")
-    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"))
+    user_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"), index=True
+    )
     user = sqlalchemy.orm.relationship("User")
     hours_limit = sqlalchemy.Column(sqlalchemy.Integer)
     notes = sqlalchemy.Column(sqlalchemy.String(50))
@@ -173,15 +255,36 @@ class ScheduledShift(Alchemy_Base):  # pylint: disable=R0903
     """
 
     __tablename__ = "scheduled_shift"
+    __table_args__ = (
+        sqlalchemy.Index("ix_scheduled_shift_date_shift", "date", "shift_id"),
+        sqlalchemy.Index("ix_scheduled_shift_shift_date", "shift_id", "date"),
+    )
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    date = sqlalchemy.Column(sqlalchemy.DateTime)
-    shift_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("shift.id"))
+    date = sqlalchemy.orm.column_property(
+        sqlalchemy.Column(sqlalchemy.DateTime), active_history=True
+    )
+    shift_id = sqlalchemy.orm.column_property(
+        sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("shift.id")),
+        active_history=True,
+    )
     shift = sqlalchemy.orm.relationship("Shift")
-    role_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("role.id"))
+    role_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("role.id"), index=True
+    )
     role = sqlalchemy.orm.relationship("Role")
-    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"))
+    # the old date, shift, employee and draft are loaded before they change, so the
+    # change reports which employees' published schedules (see ScheduleVersion) and
+    # scheduled hours (see ScheduledMinutes) it touched
+    user_id = sqlalchemy.orm.column_property(
+        sqlalchemy.Column(
+            sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"), index=True
+        ),
+        active_history=True,
+    )
     user = sqlalchemy.orm.relationship("User")
-    draft = sqlalchemy.Column(sqlalchemy.Boolean, default=True)
+    draft = sqlalchemy.orm.column_property(
+        sqlalchemy.Column(sqlalchemy.Boolean, default=True), active_history=True
+    )
     notes = sqlalchemy.Column(sqlalchemy.String(50))
 
     def __repr__(self):
@@ -196,6 +299,66 @@ class ScheduledShift(Alchemy_Base):  # pylint: disable=R0903
         )
 
 
+# R0903: Too few public methods (0/2) (too-few-public-methods)
+class ScheduleVersion(Alchemy_Base):  # pylint: disable=R0903
+    """The version of an employee's published schedule, kept up to date in the same
+    commit as the scheduled shifts so any process can tell if a schedule changed
+    user_id - The employee, EVERYONE for changes that may touch every schedule
+        (shift times, role and restaurant names)
+    version - The number of commits that changed the schedule
+    modified - When the schedule last changed (UTC)
+    """
+
+    __tablename__ = "schedule_version"
+    user_id = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False
+    )
+    version = sqlalchemy.Column(sqlalchemy.Integer)
+    modified = sqlalchemy.Column(sqlalchemy.DateTime)
+
+
+# R0903: Too few public methods (0/2) (too-few-public-methods)
+class DataVersion(Alchemy_Base):  # pylint: disable=R0903
+    """The number of commits that changed the rows of a table for a restaurant, kept up
+    to date in the same commit as the rows so caches in every process can tell when
+    what they hold is out of date (see Database.get_data_versions)
+    restaurant_id - The restaurant, UNMATCHED counts the changes that could not be matched
+        to one (eg users)
+    table_name - The table
+    version - The number of commits that changed the rows
+    """
+
+    __tablename__ = "data_version"
+    restaurant_id = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False
+    )
+    table_name = sqlalchemy.Column(sqlalchemy.String(50), primary_key=True)
+    version = sqlalchemy.Column(sqlalchemy.Integer)
+
+
+# R0903: Too few public methods (0/2) (too-few-public-methods)
+class ScheduledMinutes(Alchemy_Base):  # pylint: disable=R0903
+    """The minutes an employee is scheduled at a restaurant in a week, kept up to date in
+    the same commit as the scheduled shifts (see Database.reconcile_scheduled_minutes)
+    restaurant_id - The restaurant
+    week - The Monday of the week
+    user_id - The employee
+    minutes - The minutes of the employee's published shifts that week
+    draft_minutes - The minutes of the employee's draft shifts that week
+    """
+
+    __tablename__ = "scheduled_minutes"
+    restaurant_id = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False
+    )
+    week = sqlalchemy.Column(sqlalchemy.DateTime, primary_key=True)
+    user_id = sqlalchemy.Column(
+        sqlalchemy.Integer, primary_key=True, autoincrement=False
+    )
+    minutes = sqlalchemy.Column(sqlalchemy.Integer, default=0)
+    draft_minutes = sqlalchemy.Column(sqlalchemy.Integer, default=0)
+
+
 # R0903: Too few public methods (0/2) (too-few-public-methods)
 class UserAvailability(Alchemy_Base):  # pylint: disable=R0903
     """The times available for an employee
@@ -216,10 +379,12 @@ class UserAvailability(Alchemy_Base):  # pylint: disable=R0903
 
     __tablename__ = "user_availability"
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
-    user_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"))
+    user_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"), index=True
+    )
     user = sqlalchemy.orm.relationship("User")
     restaurant_id = sqlalchemy.Column(
-        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id")
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id"), index=True
     )
     restaurant = sqlalchemy.orm.relationship("Restaurant")
     day_of_week = sqlalchemy.Column(sqlalchemy.Integer)
@@ -252,7 +417,7 @@ class Role(Alchemy_Base):  # pylint: disable=R0903
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     name = sqlalchemy.Column(sqlalchemy.String(50))
     restaurant_id = sqlalchemy.Column(
-        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id")
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("restaurant.id"), index=True
     )
     restaurant = sqlalchemy.orm.relationship("Restaurant")
     preferences = sqlalchemy.orm.relationship("UserRolePreference", viewonly=True)
@@ -276,7 +441,9 @@ class Restaurant(Alchemy_Base):  # pylint: disable=R0903
     __tablename__ = "restaurant"
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     name = sqlalchemy.Column(sqlalchemy.String(50))
-    gm_id = sqlalchemy.Column(sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"))
+    gm_id = sqlalchemy.Column(
+        sqlalchemy.Integer, sqlalchemy.ForeignKey("user.id"), index=True
+    )
     gm = sqlalchemy.orm.relationship("User")
     roles = sqlalchemy.orm.relationship("Role", viewonly=True)
     shifts = sqlalchemy.orm.relationship("Shift", viewonly=True)
@@ -294,7 +461,7 @@ class User(Alchemy_Base):  # pylint: disable=R0903
     """Represents an employee
     name - Full employee name
     email - The email to contact the employee at
-    password_hash - sha256 hash of the user's password
+    password_hash - salted hash of the user's password (see passwords)
     hours_limit - The maximum number of hours per week
     admin - true if this is an admin account
     gm_at - list of restaurants this user is a gm at
@@ -305,73 +472,845 @@ class User(Alchemy_Base):  # pylint: disable=R0903
     id = sqlalchemy.Column(sqlalchemy.Integer, primary_key=True, autoincrement=True)
     name = sqlalchemy.Column(sqlalchemy.String(50))
     email = sqlalchemy.Column(sqlalchemy.String(50))
-    password_hash = sqlalchemy.Column(sqlalchemy.String(64))
+    password_hash = sqlalchemy.Column(sqlalchemy.String(255))
     hours_limit = sqlalchemy.Column(sqlalchemy.Integer)
     admin = sqlalchemy.Column(sqlalchemy.Boolean)
     gm_at = sqlalchemy.orm.relationship("Restaurant", viewonly=True)
     roles = sqlalchemy.orm.relationship("UserRolePreference", viewonly=True)
     availabilities = sqlalchemy.orm.relationship("UserAvailability", viewonly=True)
 
-    @staticmethod
-    def hash_password(text):
-        """hash some random text"""
-        hasher = hashlib.new("sha256")
-        hasher.update(text.encode("utf-8"))
-        return hasher.hexdigest()
-
-    def set_password(self, password):
-        """Set the user password hash"""
-        self.password_hash = User.__hash(password)
+    def set_password(self, password, hasher=None):
+        """Set the user password hash
+        hasher - the passwords.PasswordHasher to use (default the shared one)
+        """
+        hasher = passwords.default_hasher() if hasher is None else hasher
+        self.password_hash = hasher.hash(password)
 
-    def password_matches(self, password):
-        """does this match the password"""
-        return User.hash_password(password) == self.password_hash
+    def password_matches(self, password, hasher=None):
+        """does this match the password
+        hasher - the passwords.PasswordHasher to use (default the shared one)
+        """
+        hasher = passwords.default_hasher() if hasher is None else hasher
+        return hasher.verify(password, self.password_hash)
 
     def __repr__(self):
         """display string"""
         return f'User(id={self.id} name="{self.name}" email="{self.email}")'
 
 
-class Database:
+# find_user looks up emails case insensitively
+sqlalchemy.Index("ix_user_email_lower", sqlalchemy.func.lower(User.email))
+
+
+def existing_indexes(engine):
+    """The names of the indexes already in the database"""
+    if engine.dialect.name == "sqlite":  # reflection skips expression indexes
+        with engine.connect() as connection:
+            return {
+                r[0]
+                for r in connection.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'index'"
+                )
+            }
+
+    inspector = sqlalchemy.inspect(engine)
+    return {
+        i["name"] for t in inspector.get_table_names() for i in inspector.get_indexes(t)
+    }
+
+
+def sqlite_pragmas(options):
+    """the PRAGMA statements to run on each new SQLite connection"""
+    pragmas = {
+        "journal_mode": options.journal_mode,
+        "synchronous": options.synchronous,
+        "busy_timeout": options.busy_timeout,
+        "mmap_size": options.mmap_size,
+    }
+    return [f"PRAGMA {n}={v}" for n, v in pragmas.items() if v is not None]
+
+
+def create_engine(db_url, options):
+    """create an engine for the url with the EngineOptions"""
+    if sqlalchemy.engine.make_url(db_url).get_backend_name() != "sqlite":
+        return sqlalchemy.create_engine(
+            db_url,
+            pool_size=options.pool_size,
+            max_overflow=options.max_overflow,
+            pool_pre_ping=options.pool_pre_ping,
+            pool_recycle=options.pool_recycle,
+        )
+
+    engine = sqlalchemy.create_engine(
+        db_url,
+        # sessions of exited threads are closed from other threads
+        connect_args={"check_same_thread": False},
+    )
+    pragmas = sqlite_pragmas(options)
+
+    def connected(connection, _):
+        cursor = connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    sqlalchemy.event.listen(engine, "connect", connected)
+    return engine
+
+
+def create_missing_indexes(engine):
+    """create_all() only creates indexes for new tables, this adds any indexes that
+    databases created by older versions are missing"""
+    existing = existing_indexes(engine)
+    for table in Alchemy_Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            try:
+                index.create(bind=engine)
+            except sqlalchemy.exc.IntegrityError as error:
+                print(f"Unable to create index {index.name}: {error.orig}")
+
+
+def is_published(values):
+    """are the values of a scheduled_shift row those of a published shift"""
+    return values.get("draft") is not None and not values["draft"]
+
+
+def schedule_user_ids(changes):
+    """the ScheduleVersion user_ids whose published schedule a list of Change changed"""
+    user_ids = set()
+    for change in changes:
+        if change.table == ScheduledShift.__tablename__:
+            if is_published(change.values) or is_published(change.previous):
+                user_ids.add(change.values.get("user_id"))
+                user_ids.add(change.previous.get("user_id"))
+        elif change.table in ("shift", "role", "restaurant"):
+            if change.action == "update":
+                user_ids.add(EVERYONE)
+        elif change.table == User.__tablename__ and "name" in change.previous:
+            user_ids.add(change.values["id"])
+    user_ids.discard(None)
+    return user_ids
+
+
+def restaurants_of(session, entity, ids):
+    """{id: restaurant_id} of some Shifts or Roles"""
+    ids = sorted(i for i in ids if i is not None)
+    found = {}
+    for start in range(0, len(ids), IN_CLAUSE_CHUNK):
+        end = start + IN_CLAUSE_CHUNK
+        found.update(
+            session.query(entity.id, entity.restaurant_id).filter(
+                entity.id.in_(ids[start:end])
+            )
+        )
+    return found
+
+
+def upsert(session, table, rows, keys, added=()):
+    """Insert rows, or update the rows already there with the same keys
+    table - the sqlalchemy Table
+    rows - list of dicts of column values
+    keys - the names of the primary key columns
+    added - the names of the columns the new values are added to, the other columns are
+        replaced
+    One statement (INSERT ... ON CONFLICT / ON DUPLICATE KEY UPDATE) on SQLite, PostgreSQL
+    and MySQL, so two transactions inserting the same new row do not fail. Elsewhere a
+    row is updated, else inserted, and updated again if another transaction inserted it
+    first.
+    """
+    if not rows:
+        return
+    columns = [c for c in rows[0] if c not in keys]
+    dialect = session.bind.dialect.name
+
+    if dialect in ("sqlite", "postgresql"):
+        dialects = {
+            "sqlite": sqlalchemy.dialects.sqlite,
+            "postgresql": sqlalchemy.dialects.postgresql,
+        }
+        insert = dialects[dialect].insert(table)
+        session.execute(
+            insert.on_conflict_do_update(
+                index_elements=keys,
+                set_={
+                    c: (
+                        table.c[c] + insert.excluded[c]
+                        if c in added
+                        else insert.excluded[c]
+                    )
+                    for c in columns
+                },
+            ),
+            rows,
+        )
+        return
+    if dialect == "mysql":
+        insert = sqlalchemy.dialects.mysql.insert(table)
+        session.execute(
+            insert.on_duplicate_key_update(
+                {
+                    c: (
+                        table.c[c] + insert.inserted[c]
+                        if c in added
+                        else insert.inserted[c]
+                    )
+                    for c in columns
+                }
+            ),
+            rows,
+        )
+        return
+
+    for row in rows:
+        update = (
+            table.update()
+            .where(sqlalchemy.and_(*[table.c[k] == row[k] for k in keys]))
+            .values({c: table.c[c] + row[c] if c in added else row[c] for c in columns})
+        )
+        if session.execute(update).rowcount > 0:
+            continue
+        try:
+            with session.begin_nested():
+                session.execute(table.insert().values(row))
+        except sqlalchemy.exc.IntegrityError:
+            session.execute(update)
+
+
+def changed_data(session, changes):
+    """the (restaurant_id, table_name) DataVersions a list of Change changed"""
+    shifts = restaurants_of(
+        session,
+        Shift,
+        {
+            v.get("shift_id")
+            for c in changes
+            if c.table in (ShiftRole.__tablename__, ScheduledShift.__tablename__)
+            for v in (c.values, c.previous)
+        },
+    )
+    roles = restaurants_of(
+        session,
+        Role,
+        {
+            v.get("role_id")
+            for c in changes
+            if c.table == UserRolePreference.__tablename__
+            for v in (c.values, c.previous)
+        },
+    )
+    changed = set()
+
+    for change in changes:
+        if change.table == DataVersion.__tablename__:
+            continue
+        restaurant_ids = set()
+        for values in (change.values, dict(change.values, **change.previous)):
+            if change.table == Restaurant.__tablename__:
+                # the restaurant and the lists of restaurants
+                restaurant_ids.update([values.get("id"), UNMATCHED])
+            elif change.table in RESTAURANT_TABLES:
+                restaurant_ids.add(values.get("restaurant_id"))
+            elif change.table in (
+                ShiftRole.__tablename__,
+                ScheduledShift.__tablename__,
+            ):
+                restaurant_ids.add(shifts.get(values.get("shift_id")))
+            elif change.table == UserRolePreference.__tablename__:
+                restaurant_ids.add(roles.get(values.get("role_id")))
+            else:
+                restaurant_ids.add(UNMATCHED)
+        if None in restaurant_ids:
+            restaurant_ids.discard(None)
+            restaurant_ids.add(UNMATCHED)
+        changed.update((r, change.table) for r in restaurant_ids)
+
+    return changed
+
+
+def follow_versions(versions, changes):
+    """Advance the DataVersions a cache entry was read at past a commit made in this
+    process, once the commit's changes have been applied to the entry
+    versions - {(restaurant_id, table_name): version} of the entry, changed in place.
+        A version only advances if the commit is the very next change, otherwise
+        another process committed in between and the entry stays out of date.
+    changes - the list of Change of the commit
+    """
+    bumped = collections.Counter()
+    for change in changes:
+        if change.table != DataVersion.__tablename__:
+            continue
+        key = (change.values["restaurant_id"], change.values["table_name"])
+        if versions.get(key) == change.values["version"] - 1:
+            versions[key] = change.values["version"]
+        bumped[change.values["table_name"]] += 1
+    # the sum of the versions of a table goes up by the number of rows bumped
+    for table_name, count in bumped.items():
+        if (ANYWHERE, table_name) in versions:
+            versions[(ANYWHERE, table_name)] += count
+
+
+def week_of(date):
+    """the Monday (a datetime) of the week of a date"""
+    day = datetime.datetime(date.year, date.month, date.day)
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def shift_minutes(start_time, end_time):
+    """the length in minutes of a shift (it may run past midnight)"""
+    start, end = intervals.time_range(start_time, end_time)
+    return end - start
+
+
+def minutes_deltas(changes, shifts):
+    """the changes to the ScheduledMinutes a list of Change makes
+    shifts - {shift_id: (restaurant_id, minutes)} of the shifts that were scheduled
+    returns {(restaurant_id, week, user_id): [minutes, draft_minutes]}
+    """
+    deltas = collections.defaultdict(lambda: [0, 0])
+    for change in changes:
+        if change.table != ScheduledShift.__tablename__:
+            continue
+        counted = []
+        if change.action != "insert":
+            counted.append((dict(change.values, **change.previous), -1))
+        if change.action != "delete":
+            counted.append((change.values, 1))
+        for values, sign in counted:
+            shift = shifts.get(values.get("shift_id"))
+            if shift is None or values.get("user_id") is None or not values.get("date"):
+                continue
+            delta = deltas[(shift[0], week_of(values["date"]), values["user_id"])]
+            delta[0 if is_published(values) else 1] += sign * shift[1]
+    return {k: d for k, d in deltas.items() if any(d)}
+
+
+def count_scheduled_minutes(session, restaurant_ids=None):
+    """the ScheduledMinutes counted from the scheduled shifts
+    restaurant_ids - the restaurants to count (default all of them)
+    returns {(restaurant_id, week, user_id): [minutes, draft_minutes]}
+    """
+    query = (
+        session.query(
+            Shift.restaurant_id,
+            Shift.start_time,
+            Shift.end_time,
+            ScheduledShift.date,
+            ScheduledShift.user_id,
+            ScheduledShift.draft,
+        )
+        .join(Shift, Shift.id == ScheduledShift.shift_id)
+        .filter(ScheduledShift.user_id.isnot(None))
+    )
+    if restaurant_ids is not None:
+        query = query.filter(Shift.restaurant_id.in_(sorted(restaurant_ids)))
+    totals = collections.defaultdict(lambda: [0, 0])
+
+    for row in query.yield_per(EXPORT_BATCH_SIZE):
+        total = totals[(row.restaurant_id, week_of(row.date), row.user_id)]
+        total[0 if is_published(row._asdict()) else 1] += shift_minutes(
+            row.start_time, row.end_time
+        )
+
+    return totals
+
+
+def rebuild_scheduled_minutes(session, restaurant_ids=None):
+    """replace the ScheduledMinutes with those counted from the scheduled shifts
+    restaurant_ids - the restaurants to rebuild (default all of them)
+    returns the number of (restaurant_id, week, user_id) entries that were wrong
+    """
+    table = ScheduledMinutes.__table__
+    current = session.query(
+        table.c.restaurant_id,
+        table.c.week,
+        table.c.user_id,
+        table.c.minutes,
+        table.c.draft_minutes,
+    )
+    delete = table.delete()
+    if restaurant_ids is not None:
+        current = current.filter(table.c.restaurant_id.in_(sorted(restaurant_ids)))
+        delete = delete.where(table.c.restaurant_id.in_(sorted(restaurant_ids)))
+    current = {
+        (r.restaurant_id, r.week, r.user_id): [r.minutes, r.draft_minutes]
+        for r in current
+    }
+    totals = count_scheduled_minutes(session, restaurant_ids)
+    wrong = sum(
+        1
+        for k in set(current) | set(totals)
+        if current.get(k, [0, 0]) != totals.get(k, [0, 0])
+    )
+
+    session.execute(delete)
+    rows = [
+        {
+            "restaurant_id": k[0],
+            "week": k[1],
+            "user_id": k[2],
+            "minutes": t[0],
+            "draft_minutes": t[1],
+        }
+        for k, t in totals.items()
+        if any(t)
+    ]
+    for start in range(0, len(rows), BULK_BATCH_SIZE):
+        end = start + BULK_BATCH_SIZE
+        session.execute(table.insert(), rows[start:end])
+    return wrong
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+class RoutingSession(sqlalchemy.orm.Session):  # pylint: disable=R0903
+    """A session that writes to the primary database and reads from one of the replicas
+    (round-robin, picked on its first read so all its reads see the same snapshot) until
+    it writes or is told to use_primary(), after that it reads from the primary too so
+    it sees its own writes"""
+
+    def __init__(self, replicas=None, **kwargs):
+        """replicas - itertools.cycle of the replica engines (None to only use the primary)
+        kwargs - Session arguments, bind is the primary
+        """
+        super().__init__(**kwargs)
+        self.__replicas = replicas
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        """the engine to run a statement on"""
+        writing = self._flushing or isinstance(
+            clause, sqlalchemy.sql.expression.UpdateBase
+        )
+        if (
+            self.__replicas is None
+            or writing
+            or self.info.get(READ_PRIMARY)
+            or self.info.get(WROTE)
+        ):
+            return super().get_bind(mapper, clause, **kwargs)
+        if REPLICA not in self.info:
+            self.info[REPLICA] = next(self.__replicas)
+        return self.info[REPLICA]
+
+
+def writer(method):
+    """Database methods that write, the session reads from the primary from then on"""
+
+    @functools.wraps(method)
+    def write(self, *args, **kwargs):
+        self.use_primary()
+        return method(self, *args, **kwargs)
+
+    return write
+
+
+# R0904: Too many public methods (21/20) (too-many-public-methods)
+# R0902: Too many instance attributes (8/7) (too-many-instance-attributes)
+class Database:  # pylint: disable=R0904,R0902
     """stored information"""
 
-    def __init__(self, db_url):
-        """create db"""
+    def __init__(
+        self,
+        db_url,
+        idle_timeout=None,
+        deferred_commit=False,
+        *,
+        hasher=None,
+        engine_options=None,
+        replica_urls=None,
+        version_poll=VERSION_POLL_SECONDS,
+    ):
+        # pylint: disable=R0913
+        """create db
+        idle_timeout - seconds a thread's session may go unused before it is reaped, only
+            for threads that start over with remove_session() (eg request threads).
+            Default None only reaps the sessions of threads that have exited, so a
+            long running thread can keep using what it loaded.
+        deferred_commit - if True, changes are only committed by flush() or close()
+        hasher - the passwords.PasswordHasher for user passwords (default the shared one)
+        engine_options - EngineOptions for the connections (default EngineOptions())
+        replica_urls - read-only copies of db_url kept in sync by the database, reads
+            are spread over them (default none, everything uses db_url)
+        version_poll - seconds get_data_versions() reuses what it read, a commit made by
+            this Database is seen right away and one made by another process after this
+        """
         self.__db_url = db_url
+        self.__hasher = passwords.default_hasher() if hasher is None else hasher
+        self.__deferred_commit = deferred_commit
         self.__sessions = {}
         self.__session_lock = threading.Lock()
-        engine = sqlalchemy.create_engine(self.__db_url)
-        self.__factory = sqlalchemy.orm.sessionmaker(bind=engine)
-        Alchemy_Base.metadata.create_all(engine)
-        self.__session_creator = sqlalchemy.orm.scoped_session(self.__factory)
+        self.__idle_timeout = idle_timeout
+        self.__last_reap = time.time()
+        engine_options = EngineOptions() if engine_options is None else engine_options
+        self.__engine = create_engine(self.__db_url, engine_options)
+        self.__replicas = [create_engine(u, engine_options) for u in replica_urls or []]
+        self.__factory = sqlalchemy.orm.sessionmaker(
+            class_=RoutingSession,
+            bind=self.__engine,
+            replicas=itertools.cycle(self.__replicas) if self.__replicas else None,
+        )
+        self.__subscribers = []
+        self.__version_poll = version_poll
+        self.__polled = {}  # (tables, restaurant ids): (time read, DataVersions)
+        self.__poll_generation = 0  # goes up with every commit made by this Database
+        self.__poll_lock = threading.Lock()
+        sqlalchemy.event.listen(self.__factory, "after_flush", self.__track_flush)
+        sqlalchemy.event.listen(
+            self.__factory, "before_commit", self.__bump_schedule_versions
+        )
+        sqlalchemy.event.listen(
+            self.__factory, "before_commit", self.__account_scheduled_minutes
+        )
+        sqlalchemy.event.listen(
+            self.__factory, "before_commit", self.__bump_data_versions
+        )
+        sqlalchemy.event.listen(self.__factory, "after_commit", self.__publish)
+        sqlalchemy.event.listen(
+            self.__factory, "after_transaction_end", self.__discard_changes
+        )
+        Alchemy_Base.metadata.create_all(self.__engine)
+        create_missing_indexes(self.__engine)
+        self.__inherited = []  # sessions of the parent process, see __forked()
+        forking.after_fork_in_child(self.__forked)
+
+    def __forked(self):
+        """In a forked child, the sessions and pooled connections belong to the parent.
+        Start over with a new pool and no sessions, keeping the parent's sessions
+        referenced so they are never closed (or rolled back) from the child."""
+        self.__inherited.append(self.__sessions)
+        self.__sessions = {}
+        self.__session_lock = threading.Lock()
+        for engine in self.engines():
+            engine.pool = engine.pool.recreate()
 
     def __session(self):
-        thread_id = threading.current_thread().ident
+        thread = threading.current_thread()
+        now = time.time()
 
         with self.__session_lock:
-            if thread_id not in self.__sessions:
-                self.__sessions[thread_id] = {
-                    "session": self.__session_creator(),
-                    "access": time.time(),
+            entry = self.__sessions.get(thread.ident)
+
+            if entry is not None and entry["thread"]() is not thread:
+                entry["session"].close()  # thread id reused, the old thread is gone
+                entry = None
+
+            if entry is None:
+                entry = {
+                    "session": self.__factory(),
+                    "thread": weakref.ref(thread),
+                    "created": now,
+                    "access": now,
                 }
-            else:
-                self.__sessions[thread_id]["access"] = time.time()
-        return self.__sessions[thread_id]["session"]
+                self.__sessions[thread.ident] = entry
+
+            entry["access"] = now
+            reap_due = now - self.__last_reap > SESSION_REAP_INTERVAL_SECONDS
+
+        if reap_due:
+            self.reap()
+
+        return entry["session"]
+
+    # Mark: Change notification
+
+    def subscribe(self, callback):
+        """Call callback(changes) after every commit that changed anything
+        changes - list of Change(table, action, values, previous)
+            table - the name of the table, eg "user_availability"
+            action - "insert", "update" or "delete"
+            values - {column: value} for the row (as it was for "delete")
+            previous - {column: old value} for the columns an "update" changed
+        Rows added by bulk inserts may not have an id.
+        The commit's "data_version" updates come last, see follow_versions().
+        callback is called on the thread that committed and must not use the database.
+        Other processes' commits are not reported, check get_data_versions() for those.
+        """
+        self.__subscribers.append(callback)
+
+    def __record_changes(self, table, action, rows):
+        """record changes made without the ORM (bulk inserts and deletes)"""
+        self.__session().info[WROTE] = True
+        self.__session().info.setdefault(CHANGES, []).extend(
+            Change(table, action, dict(r), {}) for r in rows
+        )
+
+    @staticmethod
+    def __track_flush(session, _):
+        session.info[WROTE] = True
+        changes = session.info.setdefault(CHANGES, [])
+        flushed = [
+            ("insert", session.new),
+            ("update", session.dirty),
+            ("delete", session.deleted),
+        ]
+
+        for action, instances in flushed:
+            for instance in instances:
+                state = sqlalchemy.inspect(instance)
+                columns = [a.key for a in state.mapper.column_attrs]
+                previous = {
+                    c: state.attrs[c].history.deleted[0]
+                    for c in columns
+                    if state.attrs[c].history.deleted
+                }
+                if action == "update" and not any(
+                    state.attrs[c].history.has_changes() for c in columns
+                ):
+                    continue  # relationship only change
+                changes.append(
+                    Change(
+                        instance.__tablename__,
+                        action,
+                        {c: state.dict.get(c) for c in columns},
+                        previous if action == "update" else {},
+                    )
+                )
+
+    @staticmethod
+    def __bump_schedule_versions(session):
+        session.flush()  # so the changes of the last flush are tracked too
+        user_ids = schedule_user_ids(session.info.get(CHANGES, []))
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        upsert(
+            session,
+            ScheduleVersion.__table__,
+            [{"user_id": u, "version": 1, "modified": now} for u in sorted(user_ids)],
+            ["user_id"],
+            added=["version"],
+        )
+
+    @staticmethod
+    def __account_scheduled_minutes(session):
+        session.flush()
+        changes = session.info.get(CHANGES, [])
+        # a shift whose times change changes the minutes of every time it was scheduled
+        # (the old times may not have been loaded, so any change to a shift counts)
+        rebuilt = {
+            r
+            for c in changes
+            if c.table == Shift.__tablename__ and c.action == "update"
+            for r in (c.values.get("restaurant_id"), c.previous.get("restaurant_id"))
+            if r is not None
+        }
+        shift_ids = sorted(
+            {
+                v.get("shift_id")
+                for c in changes
+                if c.table == ScheduledShift.__tablename__
+                for v in (c.values, c.previous)
+                if v.get("shift_id") is not None
+            }
+        )
+        shifts = {}
+        for start in range(0, len(shift_ids), IN_CLAUSE_CHUNK):
+            end = start + IN_CLAUSE_CHUNK
+            shifts.update(
+                (s.id, (s.restaurant_id, shift_minutes(s.start_time, s.end_time)))
+                for s in session.query(
+                    Shift.id, Shift.restaurant_id, Shift.start_time, Shift.end_time
+                ).filter(Shift.id.in_(shift_ids[start:end]))
+            )
+        upsert(
+            session,
+            ScheduledMinutes.__table__,
+            [
+                {
+                    "restaurant_id": k[0],
+                    "week": k[1],
+                    "user_id": k[2],
+                    "minutes": d[0],
+                    "draft_minutes": d[1],
+                }
+                for k, d in sorted(minutes_deltas(changes, shifts).items())
+                if k[0] not in rebuilt
+            ],
+            ["restaurant_id", "week", "user_id"],
+            added=["minutes", "draft_minutes"],
+        )
+        if rebuilt:
+            rebuild_scheduled_minutes(session, rebuilt)
+
+    @staticmethod
+    def __bump_data_versions(session):
+        session.flush()
+        changes = session.info.get(CHANGES, [])
+        changed = sorted(changed_data(session, changes))
+        if not changed:
+            return
+        # the rows are locked (on databases that lock rows) so no other commit can bump
+        # them in between, a row another commit inserts first is still bumped by the
+        # upsert and the version reported here is then too low, which only makes the
+        # caches of this process read it again
+        restaurant_ids = sorted({r for r, _ in changed})
+        versions = {}
+        for start in range(0, len(restaurant_ids), IN_CLAUSE_CHUNK):
+            end = start + IN_CLAUSE_CHUNK
+            versions.update(
+                ((v.restaurant_id, v.table_name), v.version)
+                for v in session.query(
+                    DataVersion.restaurant_id,
+                    DataVersion.table_name,
+                    DataVersion.version,
+                )
+                .filter(DataVersion.restaurant_id.in_(restaurant_ids[start:end]))
+                .filter(DataVersion.table_name.in_({t for _, t in changed}))
+                .with_for_update()
+            )
+        upsert(
+            session,
+            DataVersion.__table__,
+            [{"restaurant_id": r, "table_name": t, "version": 1} for r, t in changed],
+            ["restaurant_id", "table_name"],
+            added=["version"],
+        )
+
+        # so subscribers can tell which versions their own process' commit made
+        changes.extend(
+            Change(
+                DataVersion.__tablename__,
+                "update",
+                {
+                    "restaurant_id": r,
+                    "table_name": t,
+                    "version": versions.get((r, t), 0) + 1,
+                },
+                {},
+            )
+            for r, t in changed
+        )
+
+    def __publish(self, session):
+        changes = session.info.pop(CHANGES, None)
+        if changes:
+            with self.__poll_lock:
+                self.__poll_generation += 1
+                self.__polled = {}
+        for subscriber in self.__subscribers if changes else []:
+            subscriber(changes)
+
+    @staticmethod
+    def __discard_changes(session, transaction):
+        if transaction.parent is None:  # rolled back or closed without a commit
+            session.info.pop(CHANGES, None)
+
+    # Mark: Transactions
+
+    def __in_transaction(self):
+        return self.__session().info.get(TRANSACTION_DEPTH, 0) > 0
+
+    def __commit(self):
+        """commit, unless in a transaction() or deferred mode, then just flush"""
+        if self.__deferred_commit or self.__in_transaction():
+            self.__session().flush()  # still assigns ids to new entries
+        else:
+            self.__session().commit()
 
     def __add(self, entry):
         self.__session().add(entry)
-        self.__session().commit()
+        self.__commit()
         return entry
 
-    def sessions(self):
-        """Return the number of active sessions"""
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group all changes made in the with block into a single commit
+            with database.transaction():
+                database.create_role(restaurant.id, "Server")
+                database.create_role(restaurant.id, "Cook")
+        Everything is rolled back if an exception is raised.
+        Nested transactions are part of the outermost transaction.
+        """
+        session = self.__session()
+        session.info[READ_PRIMARY] = True
+        depth = session.info.get(TRANSACTION_DEPTH, 0)
+        session.info[TRANSACTION_DEPTH] = depth + 1
+
+        try:
+            yield self
+            session.info[TRANSACTION_DEPTH] = depth
+            if depth == 0:
+                session.commit()
+        except BaseException:
+            session.info[TRANSACTION_DEPTH] = depth
+            if depth == 0:
+                session.rollback()
+            raise
+
+    def remove_session(self):
+        """Close the current thread's session (call at the end of each request).
+        Uncommitted changes are rolled back, the next call creates a new session."""
+        with self.__session_lock:
+            entry = self.__sessions.pop(threading.current_thread().ident, None)
+
+        if entry is not None:
+            entry["session"].close()
+
+    def reap(self, idle_timeout=None):
+        """Close sessions whose thread has exited or that have not been used in
+        idle_timeout seconds (default is the timeout given when created, None for no
+        timeout)
+        returns the number of sessions closed"""
+        idle_timeout = self.__idle_timeout if idle_timeout is None else idle_timeout
+        idle_timeout = float("inf") if idle_timeout is None else idle_timeout
         now = time.time()
+
         with self.__session_lock:
-            return [now - s["access"] for s in self.__sessions.values()]
+            self.__last_reap = now
+            expired = [
+                i
+                for i, e in self.__sessions.items()
+                if e["thread"]() is None
+                or not e["thread"]().is_alive()
+                or now - e["access"] > idle_timeout
+            ]
+            reaped = [self.__sessions.pop(i) for i in expired]
 
+        for entry in reaped:
+            entry["session"].close()
+
+        return len(reaped)
+
+    def sessions(self):
+        """Return statistics about the live sessions and the connection pool
+        sessions - the number of open sessions
+        oldest - age in seconds of the oldest session
+        idle - seconds since the least recently used session was used
+        pool - the connection pool status
+        """
+        now = time.time()
+        with self.__session_lock:
+            entries = list(self.__sessions.values())
+        return {
+            "sessions": len(entries),
+            "oldest": max((now - e["created"] for e in entries), default=0.0),
+            "idle": max((now - e["access"] for e in entries), default=0.0),
+            "pool": self.__engine.pool.status(),
+        }
+
+    @writer
     def flush(self):
-        """flush all changes to the database"""
-        self.__session().commit()
+        """flush all changes to the database
+        (committed at the end of the transaction() if in one)"""
+        if self.__in_transaction():
+            self.__session().flush()
+        else:
+            self.__session().commit()
+
+    def engine(self):
+        """The SQLAlchemy engine of the primary database"""
+        return self.__engine
+
+    def engines(self):
+        """The SQLAlchemy engines of the primary and the replicas, for instrumentation"""
+        return [self.__engine] + self.__replicas
+
+    def use_primary(self):
+        """Read from the primary database for the rest of the current thread's session,
+        eg for a request soon after the same user wrote, before replicas catch up"""
+        self.__session().info[READ_PRIMARY] = True
+
+    def wrote(self):
+        """has the current thread's session written anything"""
+        return bool(self.__session().info.get(WROTE))
 
     def close(self):
         """close down the connection to the database"""
@@ -380,6 +1319,7 @@ class Database:
 
     # Mark: User API
 
+    @writer
     def create_user(self, email, password, name, **kwargs):
         """create a new employee entry"""
         found = self.find_user(email)
@@ -387,7 +1327,7 @@ class Database:
             self.__add(
                 User(
                     email=email,
-                    password_hash=User.hash_password(password),
+                    password_hash=self.__hasher.hash(password),
                     name=name,
                     **kwargs,
                 )
@@ -396,6 +1336,16 @@ class Database:
             else found
         )
 
+    def check_password(self, user, password):
+        """does the password match the user's, if it does and the hash was made with
+        an older scheme or cost it is replaced with a hash at the current cost"""
+        if not user.password_matches(password, self.__hasher):
+            return False
+        if self.__hasher.needs_rehash(user.password_hash):
+            user.set_password(password, self.__hasher)
+            self.flush()
+        return True
+
     def get_user(self, user_id):
         """Get a user by its id"""
         return (
@@ -404,11 +1354,12 @@ class Database:
             else None
         )
 
+    @writer
     def add_user_to_restaurant(self, user, restaurant):
         """Makes sure the employee has a UserRolePreference for
         every restaurant role"""
         priority = 1.0 + (max([r.priority for r in user.roles]) if user.roles else 0.0)
-        preferred_roles = [r.id for r in user.roles]
+        preferred_roles = [r.role_id for r in user.roles]
 
         for role in restaurant.roles:
             if role.id not in preferred_roles:
@@ -435,8 +1386,30 @@ class Database:
         """Get list of all users"""
         return self.__session().query(User).all()
 
+    def search_users(self, prefix="", limit=USER_PAGE_SIZE, cursor=None):
+        """Get a page of the users whose email starts with prefix (case insensitive),
+        in email order, using the index on lower(email)
+        limit - the most users in the page (1 to MAXIMUM_USER_PAGE_SIZE)
+        cursor - the cursor returned with the previous page (None for the first page)
+        returns (users, cursor of the next page or None if this is the last page)
+        """
+        limit = min(max(limit, 1), MAXIMUM_USER_PAGE_SIZE)
+        email = sqlalchemy.func.lower(User.email)
+        prefix = prefix.lower()
+        query = self.__session().query(User)
+        if prefix:
+            after_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+            query = query.filter(email >= prefix, email < after_prefix)
+        if cursor is not None:
+            query = query.filter(email > cursor)
+        users = query.order_by(email).limit(limit + 1).all()
+        if len(users) <= limit:
+            return (users, None)
+        return (users[:limit], users[limit - 1].email.lower())
+
     # Mark: Availability API
 
+    @writer
     def create_availability(self, user, restaurant, day_of_week, **kwargs):
         """Create an availability"""
         return self.__add(
@@ -455,6 +1428,7 @@ class Database:
 
     # Mark: Restaurant API
 
+    @writer
     def create_restaurant(self, name):
         """Create a new restaurant"""
         return self.__add(Restaurant(name=name))
@@ -472,18 +1446,43 @@ class Database:
             else None
         )
 
+    def load_restaurant_view(self, restaurant_id):
+        """Get a restaurant by id with everything the restaurant page shows
+        (roles, employee preferences, shifts and their roles) loaded up front in a
+        fixed number of queries"""
+        if restaurant_id is None:
+            return None
+
+        return (
+            self.__session()
+            .query(Restaurant)
+            .options(
+                sqlalchemy.orm.joinedload(Restaurant.gm),
+                sqlalchemy.orm.selectinload(Restaurant.roles)
+                .selectinload(Role.preferences)
+                .joinedload(UserRolePreference.user),
+                sqlalchemy.orm.selectinload(Restaurant.shifts)
+                .selectinload(Shift.roles)
+                .joinedload(ShiftRole.role),
+            )
+            .filter(Restaurant.id == restaurant_id)
+            .one_or_none()
+        )
+
     def get_restaurants(self):
         """Get list of all restaurants"""
         return self.__session().query(Restaurant).all()
 
+    @writer
     def create_role(self, restaurant_id, name):
         """Create a new role for a restaurant"""
         return (
-            self.__add(Role(name=name, restaurant_id=restaurant_id))
+            self.__add(Role(name=name, restaurant_id=int(restaurant_id)))
             if len(name) > 0
             else None
         )
 
+    @writer
     def create_shift(self, restaurant, day_of_week, **kwargs):
         """Create a new shift"""
         return self.__add(
@@ -498,6 +1497,7 @@ class Database:
             )
         )
 
+    @writer
     def add_role_to_shift(self, shift, role, number=1):
         """Add roles to a shift"""
         shift_role = (
@@ -517,3 +1517,716 @@ class Database:
                 ShiftRole(role_id=role.id, shift_id=shift.id, number=number)
             )
         return shift_role
+
+    # Mark: Schedule API
+
+    def get_shifts(self, restaurant_id):
+        """Get all the shifts of a restaurant with their roles"""
+        return (
+            self.__session()
+            .query(Shift)
+            .options(
+                sqlalchemy.orm.selectinload(Shift.roles).joinedload(ShiftRole.role)
+            )
+            .filter(Shift.restaurant_id == restaurant_id)
+            .all()
+        )
+
+    def get_shift_roles(self, restaurant_id):
+        """Get all (shift, shift role) pairs for a restaurant"""
+        return (
+            self.__session()
+            .query(Shift, ShiftRole)
+            .join(ShiftRole, ShiftRole.shift_id == Shift.id)
+            .filter(Shift.restaurant_id == restaurant_id)
+            .all()
+        )
+
+    def get_role_preferences(self, restaurant_id):
+        """Get all the employee role preferences for a restaurant"""
+        return (
+            self.__session()
+            .query(UserRolePreference)
+            .join(Role, Role.id == UserRolePreference.role_id)
+            .options(sqlalchemy.orm.joinedload(UserRolePreference.user))
+            .filter(Role.restaurant_id == restaurant_id)
+            .all()
+        )
+
+    def get_availabilities(self, restaurant_id, user_ids=None):
+        """Get all the employee availabilities for a restaurant
+        user_ids - only get the availabilities of these employees (default everyone)
+        """
+        query = (
+            self.__session()
+            .query(UserAvailability)
+            .filter(UserAvailability.restaurant_id == restaurant_id)
+        )
+        return (
+            query.all()
+            if user_ids is None
+            else self.__in_chunks(query, UserAvailability.user_id, user_ids)
+        )
+
+    def get_hours_limits(self, restaurant_id):
+        """Get the weekly hours limit for each employee of a restaurant
+        returns {user_id: hours_limit}, a restaurant UserLimits overrides User.hours_limit
+        """
+        limits = dict(
+            self.__session()
+            .query(User.id, User.hours_limit)
+            .join(UserRolePreference, UserRolePreference.user_id == User.id)
+            .join(Role, Role.id == UserRolePreference.role_id)
+            .filter(Role.restaurant_id == restaurant_id)
+            .distinct()
+            .all()
+        )
+        limits.update(
+            self.__session()
+            .query(UserLimits.user_id, UserLimits.hours_limit)
+            .filter(UserLimits.restaurant_id == restaurant_id)
+            .all()
+        )
+        return limits
+
+    def get_schedule_rows(self, restaurant_id):
+        """Read what scheduling a restaurant needs with column queries (no ORM objects)
+        returns ScheduleRows of lists of rows
+            preferences - user_id, role_id, priority, gm_priority, name
+            availabilities - user_id, day_of_week, start_time, end_time, priority,
+                start_date, end_date
+            shifts - id, day_of_week, start_time, end_time, priority, start_date,
+                end_date
+            demand - shift_id, role_id, number
+            hours_limits - {user_id: weekly hours limit}, see get_hours_limits()
+        """
+        session = self.__session()
+        return ScheduleRows(
+            preferences=session.query(
+                UserRolePreference.user_id,
+                UserRolePreference.role_id,
+                UserRolePreference.priority,
+                UserRolePreference.gm_priority,
+                User.name,
+            )
+            .join(User, User.id == UserRolePreference.user_id)
+            .join(Role, Role.id == UserRolePreference.role_id)
+            .filter(Role.restaurant_id == restaurant_id)
+            .all(),
+            availabilities=session.query(
+                UserAvailability.user_id,
+                UserAvailability.day_of_week,
+                UserAvailability.start_time,
+                UserAvailability.end_time,
+                UserAvailability.priority,
+                UserAvailability.start_date,
+                UserAvailability.end_date,
+            )
+            .filter(UserAvailability.restaurant_id == restaurant_id)
+            .all(),
+            shifts=session.query(
+                Shift.id,
+                Shift.day_of_week,
+                Shift.start_time,
+                Shift.end_time,
+                Shift.priority,
+                Shift.start_date,
+                Shift.end_date,
+            )
+            .filter(Shift.restaurant_id == restaurant_id)
+            .all(),
+            demand=session.query(
+                ShiftRole.shift_id, ShiftRole.role_id, ShiftRole.number
+            )
+            .join(Shift, Shift.id == ShiftRole.shift_id)
+            .filter(Shift.restaurant_id == restaurant_id)
+            .all(),
+            hours_limits=self.get_hours_limits(restaurant_id),
+        )
+
+    def get_scheduled_shifts(self, restaurant_id, start_date, end_date):
+        """Get the scheduled shifts for a restaurant from start_date up to (not including)
+        end_date"""
+        return (
+            self.__session()
+            .query(ScheduledShift)
+            .join(Shift, Shift.id == ScheduledShift.shift_id)
+            .options(
+                sqlalchemy.orm.contains_eager(ScheduledShift.shift),
+                sqlalchemy.orm.joinedload(ScheduledShift.role),
+                sqlalchemy.orm.joinedload(ScheduledShift.user),
+            )
+            .filter(Shift.restaurant_id == restaurant_id)
+            .filter(ScheduledShift.date >= start_date)
+            .filter(ScheduledShift.date < end_date)
+            .all()
+        )
+
+    def iter_published_shifts(self, restaurant_id, start_date, end_date, user_id=None):
+        """Yield the published scheduled shifts of a restaurant from start_date up to
+        (not including) end_date in date and start time order, EXPORT_BATCH_SIZE rows
+        at a time from a server side cursor (so memory does not grow with the range)
+        restaurant_id - None for every restaurant
+        user_id - only the shifts of this employee (default everyone)
+        yields rows of id, date, start_time, end_time, role, restaurant, user_id, name,
+            email, notes
+        """
+        query = (
+            self.__session()
+            .query(
+                ScheduledShift.id,
+                ScheduledShift.date,
+                Shift.start_time,
+                Shift.end_time,
+                Role.name.label("role"),
+                Restaurant.name.label("restaurant"),
+                User.id.label("user_id"),
+                User.name,
+                User.email,
+                ScheduledShift.notes,
+            )
+            .join(Shift, Shift.id == ScheduledShift.shift_id)
+            .join(Restaurant, Restaurant.id == Shift.restaurant_id)
+            .join(Role, Role.id == ScheduledShift.role_id)
+            .join(User, User.id == ScheduledShift.user_id)
+            .filter(ScheduledShift.date >= start_date)
+            .filter(ScheduledShift.date < end_date)
+            .filter(ScheduledShift.draft.is_(False))
+        )
+        if restaurant_id is not None:
+            query = query.filter(Shift.restaurant_id == restaurant_id)
+        if user_id is not None:
+            query = query.filter(ScheduledShift.user_id == user_id)
+        yield from (
+            query.order_by(ScheduledShift.date, Shift.start_time, ScheduledShift.id)
+            .execution_options(stream_results=True)
+            .yield_per(EXPORT_BATCH_SIZE)
+        )
+
+    def get_data_versions(self, tables, restaurant_ids=None):
+        """Get the DataVersions of some tables, they go up with every commit (by any
+        process) that changes the rows
+        restaurant_ids - count the changes to these restaurants and the changes not
+            matched to a restaurant (default count the changes anywhere, as the sum of
+            the versions of every restaurant under ANYWHERE)
+        returns {(restaurant_id, table_name): version}, read from the database at most
+            once every version_poll seconds
+        """
+        ids = (
+            [ANYWHERE]
+            if restaurant_ids is None
+            else sorted({int(r) for r in restaurant_ids}) + [UNMATCHED]
+        )
+        key = (tuple(tables), tuple(ids))
+        now = time.monotonic()
+        with self.__poll_lock:
+            generation = self.__poll_generation
+            polled = self.__polled.get(key)
+        if polled is not None and now - polled[0] < self.__version_poll:
+            return dict(polled[1])
+
+        versions = {(r, t): 0 for r in ids for t in tables}
+        if restaurant_ids is None:
+            versions.update(
+                ((ANYWHERE, v.table_name), v.version)
+                for v in self.__session()
+                .query(
+                    DataVersion.table_name,
+                    sqlalchemy.func.sum(DataVersion.version).label("version"),
+                )
+                .filter(DataVersion.restaurant_id != ANYWHERE)
+                .filter(DataVersion.table_name.in_(tables))
+                .group_by(DataVersion.table_name)
+            )
+        else:
+            versions.update(
+                ((v.restaurant_id, v.table_name), v.version)
+                for v in self.__session()
+                .query(
+                    DataVersion.restaurant_id,
+                    DataVersion.table_name,
+                    DataVersion.version,
+                )
+                .filter(DataVersion.restaurant_id.in_(ids))
+                .filter(DataVersion.table_name.in_(tables))
+            )
+        with self.__poll_lock:
+            if generation == self.__poll_generation:  # not older than a commit since
+                self.__polled[key] = (now, versions)
+        return dict(versions)
+
+    def get_schedule_version(self, user_id):
+        """The version of an employee's published schedule
+        returns ((employee version, EVERYONE version), when either last changed or None)
+        """
+        found = {
+            v.user_id: v
+            for v in self.__session()
+            .query(
+                ScheduleVersion.user_id,
+                ScheduleVersion.version,
+                ScheduleVersion.modified,
+            )
+            .filter(ScheduleVersion.user_id.in_([user_id, EVERYONE]))
+        }
+        changed = [v.modified for v in found.values()]
+        return (
+            tuple(found[u].version if u in found else 0 for u in (user_id, EVERYONE)),
+            max(changed) if changed else None,
+        )
+
+    def get_scheduled_minutes(self, restaurant_id, start_date, end_date):
+        """Get the minutes the employees of a restaurant are scheduled in the weeks from
+        the week of start_date up to (not including) end_date
+        returns {(user_id, Monday): (published minutes, draft minutes)}
+        """
+        return {
+            (m.user_id, m.week): (m.minutes, m.draft_minutes)
+            for m in self.__session()
+            .query(
+                ScheduledMinutes.user_id,
+                ScheduledMinutes.week,
+                ScheduledMinutes.minutes,
+                ScheduledMinutes.draft_minutes,
+            )
+            .filter(ScheduledMinutes.restaurant_id == restaurant_id)
+            .filter(ScheduledMinutes.week >= week_of(start_date))
+            .filter(ScheduledMinutes.week < end_date)
+        }
+
+    def get_hours_remaining(self, restaurant_id, user_id, date):
+        """Get the hours an employee can still be scheduled at a restaurant in the week
+        of date, counting published and draft shifts (None if they have no limit)"""
+        limits = (
+            self.__session()
+            .query(UserLimits.hours_limit)
+            .filter(UserLimits.restaurant_id == restaurant_id)
+            .filter(UserLimits.user_id == user_id)
+            .first()
+        ) or (
+            self.__session()
+            .query(User.hours_limit)
+            .filter(User.id == user_id)
+            .one_or_none()
+        )
+        if limits is None or not limits.hours_limit or limits.hours_limit < 0:
+            return None
+        scheduled = (
+            self.__session()
+            .query(ScheduledMinutes.minutes, ScheduledMinutes.draft_minutes)
+            .filter(ScheduledMinutes.restaurant_id == restaurant_id)
+            .filter(ScheduledMinutes.week == week_of(date))
+            .filter(ScheduledMinutes.user_id == user_id)
+            .one_or_none()
+        )
+        minutes = 0 if scheduled is None else sum(scheduled)
+        return limits.hours_limit - minutes / 60.0
+
+    @writer
+    def reconcile_scheduled_minutes(self, restaurant_id=None):
+        """Rebuild the ScheduledMinutes of a restaurant (default all of them) from the
+        scheduled shifts
+        returns the number of (restaurant, week, employee) entries that were wrong
+        """
+        wrong = rebuild_scheduled_minutes(
+            self.__session(), None if restaurant_id is None else [restaurant_id]
+        )
+        self.__commit()
+        return wrong
+
+    def get_scheduled_rows(self, restaurant_id, start_date, end_date):
+        """Get the scheduled shifts for a restaurant from start_date up to (not including)
+        end_date as rows of id, date, shift_id, role_id, user_id, draft"""
+        return (
+            self.__session()
+            .query(
+                ScheduledShift.id,
+                ScheduledShift.date,
+                ScheduledShift.shift_id,
+                ScheduledShift.role_id,
+                ScheduledShift.user_id,
+                ScheduledShift.draft,
+            )
+            .join(Shift, Shift.id == ScheduledShift.shift_id)
+            .filter(Shift.restaurant_id == restaurant_id)
+            .filter(ScheduledShift.date >= start_date)
+            .filter(ScheduledShift.date < end_date)
+            .all()
+        )
+
+    def get_scheduled_shift(self, scheduled_shift_id):
+        """Get a scheduled shift (with its shift) by id"""
+        return (
+            self.__session()
+            .query(ScheduledShift)
+            .options(sqlalchemy.orm.joinedload(ScheduledShift.shift))
+            .filter(ScheduledShift.id == scheduled_shift_id)
+            .one_or_none()
+        )
+
+    @writer
+    def replace_draft_shifts(self, restaurant_id, start_date, end_date, assignments):
+        """Replace the draft scheduled shifts for a restaurant in a date range
+        assignments - list of dicts with date, shift_id, role_id, user_id
+        Published (non-draft) shifts are left alone.
+        """
+        shift_ids = (
+            self.__session()
+            .query(Shift.id)
+            .filter(Shift.restaurant_id == restaurant_id)
+            .scalar_subquery()
+        )
+        drafts = (
+            self.__session()
+            .query(ScheduledShift)
+            .filter(
+                ScheduledShift.shift_id.in_(shift_ids),
+                ScheduledShift.date >= start_date,
+                ScheduledShift.date < end_date,
+                ScheduledShift.draft.is_(True),
+            )
+        )
+        self.__record_changes(
+            ScheduledShift.__tablename__,
+            "delete",
+            [r._asdict() for r in drafts.with_entities(*ScheduledShift.__table__.c)],
+        )
+        drafts.delete(synchronize_session=False)
+        inserted = [dict(a, draft=True) for a in assignments]
+        self.__session().bulk_insert_mappings(ScheduledShift, inserted)
+        self.__record_changes(ScheduledShift.__tablename__, "insert", inserted)
+        self.__commit()
+
+    @writer
+    def update_draft_shifts(self, restaurant_id, removed_ids, assignments):
+        """Remove some draft scheduled shifts of a restaurant and add others
+        removed_ids - ids of the draft ScheduledShifts to remove
+        assignments - list of dicts with date, shift_id, role_id, user_id to add
+        """
+        shift_ids = (
+            self.__session()
+            .query(Shift.id)
+            .filter(Shift.restaurant_id == restaurant_id)
+            .scalar_subquery()
+        )
+        for start in range(0, len(removed_ids), IN_CLAUSE_CHUNK):
+            end = start + IN_CLAUSE_CHUNK
+            drafts = (
+                self.__session()
+                .query(ScheduledShift)
+                .filter(
+                    ScheduledShift.id.in_(removed_ids[start:end]),
+                    ScheduledShift.shift_id.in_(shift_ids),
+                    ScheduledShift.draft.is_(True),
+                )
+            )
+            self.__record_changes(
+                ScheduledShift.__tablename__,
+                "delete",
+                [
+                    r._asdict()
+                    for r in drafts.with_entities(*ScheduledShift.__table__.c)
+                ],
+            )
+            drafts.delete(synchronize_session=False)
+        inserted = [dict(a, draft=True) for a in assignments]
+        self.__session().bulk_insert_mappings(ScheduledShift, inserted)
+        self.__record_changes(ScheduledShift.__tablename__, "insert", inserted)
+        self.__commit()
+
+    # Mark: Bulk Import API
+
+    @writer
+    def bulk_import(self, records, batch_size=BULK_BATCH_SIZE):
+        """Insert many records, up to batch_size of a kind per transaction
+        records - iterable of (kind, fields), kind is one of IMPORT_KINDS:
+            user - email, name, password, hours_limit, admin,
+                restaurant_id (optional, adds the user to the restaurant's roles)
+            role - restaurant_id, name
+            role_preference - email, restaurant_id, role (name), priority, gm_priority
+            availability - email, restaurant_id, day_of_week, start_time, end_time,
+                start_date, end_date, priority, note
+            shift - restaurant_id, day_of_week, start_time, end_time, start_date,
+                end_date, priority, roles ({role name: number})
+        Users and roles that already exist are not duplicated, records that refer to
+        unknown users or roles are skipped.
+        returns collections.Counter of the records imported per kind and "skipped"
+        """
+        counts = collections.Counter()
+        batch = []
+
+        for kind, fields in records:
+            if kind not in IMPORT_KINDS:
+                raise ValueError(f"Unknown import kind: {kind}")
+            if batch and (kind != batch[0][0] or len(batch) >= batch_size):
+                self.__import_batch(batch, counts)
+                batch = []
+            batch.append((kind, fields))
+
+        if batch:
+            self.__import_batch(batch, counts)
+
+        return counts
+
+    def __import_batch(self, batch, counts):
+        kind = batch[0][0]
+        rows = [f for _, f in batch]
+        importer = {
+            "user": self.__import_users,
+            "role": self.__import_roles,
+            "role_preference": self.__import_role_preferences,
+            "availability": self.__import_availabilities,
+            "shift": self.__import_shifts,
+        }[kind]
+
+        with self.transaction():
+            imported = importer(rows)
+
+        counts[kind] += imported
+        counts["skipped"] += len(rows) - imported
+
+    def __in_chunks(self, query, column, values):
+        """run query filtered on column in values, a chunk of values at a time"""
+        values = list(values)
+        results = []
+        for start in range(0, len(values), IN_CLAUSE_CHUNK):
+            end = start + IN_CLAUSE_CHUNK
+            results.extend(query.filter(column.in_(values[start:end])).all())
+        return results
+
+    def __user_ids(self, emails):
+        """{lowercase email: user id}"""
+        lower_email = sqlalchemy.func.lower(User.email)
+        return dict(
+            self.__in_chunks(
+                self.__session().query(lower_email, User.id),
+                lower_email,
+                {e.lower() for e in emails},
+            )
+        )
+
+    def __role_ids(self, restaurant_ids):
+        """{(restaurant id, lowercase role name): role id}"""
+        return {
+            (r, n.lower()): i
+            for i, r, n in self.__in_chunks(
+                self.__session().query(Role.id, Role.restaurant_id, Role.name),
+                Role.restaurant_id,
+                set(restaurant_ids),
+            )
+        }
+
+    def __import_users(self, rows):
+        existing = self.__user_ids(r["email"] for r in rows)
+        new_users = {}
+        new_passwords = []
+
+        for row in rows:
+            email = row["email"].lower()
+            if email not in existing and email not in new_users:
+                new_users[email] = {
+                    "email": row["email"],
+                    "name": row["name"],
+                    "hours_limit": row.get("hours_limit"),
+                    "admin": bool(row.get("admin", False)),
+                }
+                new_passwords.append(row["password"])
+
+        hashes = self.__hasher.hash_all(new_passwords)
+        for fields, password_hash in zip(new_users.values(), hashes):
+            fields["password_hash"] = password_hash
+
+        if new_users:
+            self.__session().execute(
+                sqlalchemy.insert(User.__table__), list(new_users.values())
+            )
+            self.__record_changes(User.__tablename__, "insert", new_users.values())
+
+        self.__import_memberships(
+            [
+                (r["email"], r["restaurant_id"])
+                for r in rows
+                if r.get("restaurant_id") is not None
+            ]
+        )
+        return len(new_users)
+
+    def __import_memberships(self, memberships):
+        """Give each (email, restaurant id) user a preference for every restaurant role"""
+        if not memberships:
+            return
+
+        user_ids = self.__user_ids(e for e, _ in memberships)
+        role_ids = self.__role_ids(r for _, r in memberships)
+        roles_by_restaurant = collections.defaultdict(list)
+        for (restaurant_id, _), role_id in role_ids.items():
+            roles_by_restaurant[restaurant_id].append(role_id)
+        preferred = collections.defaultdict(dict)
+        for user_id, role_id, priority in self.__in_chunks(
+            self.__session().query(
+                UserRolePreference.user_id,
+                UserRolePreference.role_id,
+                UserRolePreference.priority,
+            ),
+            UserRolePreference.user_id,
+            set(user_ids.values()),
+        ):
+            preferred[user_id][role_id] = priority
+        new_preferences = []
+
+        for email, restaurant_id in memberships:
+            user_id = user_ids[email.lower()]
+            roles = preferred[user_id]
+            priority = 1.0 + max(roles.values(), default=0.0)
+            for role_id in sorted(roles_by_restaurant[restaurant_id]):
+                if role_id not in roles:
+                    roles[role_id] = priority
+                    new_preferences.append(
+                        {
+                            "user_id": user_id,
+                            "role_id": role_id,
+                            "priority": priority,
+                            "gm_priority": priority,
+                        }
+                    )
+                    priority += 1.0
+
+        if new_preferences:
+            self.__session().execute(
+                sqlalchemy.insert(UserRolePreference.__table__), new_preferences
+            )
+            self.__record_changes(
+                UserRolePreference.__tablename__, "insert", new_preferences
+            )
+
+    def __import_roles(self, rows):
+        existing = self.__role_ids(r["restaurant_id"] for r in rows)
+        new_roles = {}
+
+        for row in rows:
+            key = (row["restaurant_id"], row["name"].lower())
+            if row["name"] and key not in existing and key not in new_roles:
+                new_roles[key] = {
+                    "restaurant_id": row["restaurant_id"],
+                    "name": row["name"],
+                }
+
+        if new_roles:
+            self.__session().execute(
+                sqlalchemy.insert(Role.__table__), list(new_roles.values())
+            )
+            self.__record_changes(Role.__tablename__, "insert", new_roles.values())
+
+        return len(new_roles)
+
+    def __import_role_preferences(self, rows):
+        user_ids = self.__user_ids(r["email"] for r in rows)
+        role_ids = self.__role_ids(r["restaurant_id"] for r in rows)
+        preferences = {}
+
+        for row in rows:
+            user_id = user_ids.get(row["email"].lower())
+            role_id = role_ids.get((row["restaurant_id"], row["role"].lower()))
+            if user_id is not None and role_id is not None:
+                preferences[(user_id, role_id)] = {
+                    "user_id": user_id,
+                    "role_id": role_id,
+                    "priority": row["priority"],
+                    "gm_priority": row.get("gm_priority", row["priority"]),
+                }
+
+        existing = {
+            (u, r): i
+            for i, u, r in self.__in_chunks(
+                self.__session().query(
+                    UserRolePreference.id,
+                    UserRolePreference.user_id,
+                    UserRolePreference.role_id,
+                ),
+                UserRolePreference.user_id,
+                {u for u, _ in preferences},
+            )
+        }
+        updates = [
+            dict(p, id=existing[k]) for k, p in preferences.items() if k in existing
+        ]
+        inserts = [p for k, p in preferences.items() if k not in existing]
+
+        if updates:
+            self.__session().bulk_update_mappings(UserRolePreference, updates)
+            self.__record_changes(UserRolePreference.__tablename__, "update", updates)
+
+        if inserts:
+            self.__session().execute(
+                sqlalchemy.insert(UserRolePreference.__table__), inserts
+            )
+            self.__record_changes(UserRolePreference.__tablename__, "insert", inserts)
+
+        return len(preferences)
+
+    def __import_availabilities(self, rows):
+        user_ids = self.__user_ids(r["email"] for r in rows)
+        availabilities = [
+            {
+                "user_id": user_ids[r["email"].lower()],
+                "restaurant_id": r["restaurant_id"],
+                "day_of_week": r["day_of_week"],
+                "start_time": r["start_time"],
+                "end_time": r["end_time"],
+                "start_date": r["start_date"],
+                "end_date": r["end_date"],
+                "priority": r["priority"],
+                "note": r.get("note"),
+            }
+            for r in rows
+            if r["email"].lower() in user_ids
+        ]
+
+        if availabilities:
+            self.__session().execute(
+                sqlalchemy.insert(UserAvailability.__table__), availabilities
+            )
+            self.__record_changes(
+                UserAvailability.__tablename__, "insert", availabilities
+            )
+
+        return len(availabilities)
+
+    def __import_shifts(self, rows):
+        role_ids = self.__role_ids(r["restaurant_id"] for r in rows)
+        shifts = [
+            Shift(
+                restaurant_id=r["restaurant_id"],
+                day_of_week=r["day_of_week"],
+                start_time=r["start_time"],
+                end_time=r["end_time"],
+                start_date=r["start_date"],
+                end_date=r["end_date"],
+                priority=r["priority"],
+            )
+            for r in rows
+        ]
+        self.__session().add_all(shifts)
+        self.__session().flush()  # assigns the shift ids
+        shift_roles = {}
+
+        for shift, row in zip(shifts, rows):
+            for name, number in (row.get("roles") or {}).items():
+                role_id = role_ids.get((shift.restaurant_id, name.lower()))
+                if role_id is not None:
+                    key = (shift.id, role_id)
+                    shift_roles[key] = {
+                        "shift_id": shift.id,
+                        "role_id": role_id,
+                        "number": number + shift_roles.get(key, {}).get("number", 0),
+                    }
+
+        if shift_roles:
+            self.__session().execute(
+                sqlalchemy.insert(ShiftRole.__table__), list(shift_roles.values())
+            )
+            self.__record_changes(
+                ShiftRole.__tablename__, "insert", shift_roles.values()
+            )
+
+        return len(shifts)
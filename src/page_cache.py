@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+""" Cache of rendered pages
+
+Pages are cached by a key of what they show: the kind of page, the viewer, the day and
+the model.DataVersions of the tables on the page for each restaurant on it. Every
+commit, made by any process, updates those versions, so a changed restaurant gets new
+keys in every worker and stale pages are never served. They just age out of the LRU.
+
+Each page has an ETag made from its key. A browser that sends the ETag back in
+If-None-Match gets a 304 without the page being rendered, or even looked up.
+"""
+
+import collections
+import hashlib
+import threading
+
+from flask import make_response, request
+
+PAGE_CACHE_SIZE = 1000
+# the tables whose rows are shown on the pages
+PAGE_TABLES = (
+    "restaurant",
+    "role",
+    "shift",
+    "shift_roles",
+    "user",
+    "user_availability",
+    "user_limits",
+    "user_role_preference",
+    "scheduled_shift",
+)
+
+
+class PageCache:
+    """Recently rendered pages by key"""
+
+    def __init__(self, database, size=PAGE_CACHE_SIZE):
+        """database - the model.Database to read the data versions from
+        size - the most pages kept
+        """
+        self.__database = database
+        self.__size = size
+        self.__lock = threading.Lock()
+        self.__pages = collections.OrderedDict()  # key: body
+
+    def key(self, kind, restaurant_ids, *details):
+        """the key of a page
+        kind - the name of the page
+        restaurant_ids - the restaurants whose data is on the page
+        details - anything else the page depends on (the viewer, the date, ...)
+        """
+        versions = self.__database.get_data_versions(PAGE_TABLES, restaurant_ids)
+        return (kind, tuple(sorted(versions.items()))) + details
+
+    def etag(self, key):
+        """the ETag of the page with a key"""
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def respond(self, key, render):
+        """the response for a page, 304 if the browser has it
+        render - returns the page body, or a whole response to send uncached (eg 404)
+        """
+        etag = self.etag(key)
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            with self.__lock:
+                body = self.__pages.get(key)
+                if body is not None:
+                    self.__pages.move_to_end(key)
+
+            if body is None:
+                body = render()
+                if not isinstance(body, str):
+                    return body
+                with self.__lock:
+                    self.__pages[key] = body
+                    while len(self.__pages) > self.__size:
+                        self.__pages.popitem(last=False)
+
+            response = make_response(body)
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
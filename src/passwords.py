@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+""" Salted, tunable password hashing
+
+Hashes are stored as "scheme$parameters$salt$hash" so a password can always be checked
+with the cost it was hashed with. When the configured scheme or cost changes,
+PasswordHasher.needs_rehash() says so and the hash can be replaced the next time the
+password is known (on login). Hashes from before this module (unsalted SHA-256 hex)
+are still accepted and always need a rehash.
+
+The hashing runs in a small, bounded pool of threads (hashlib releases the GIL while it
+works) so a burst of logins queues for the CPU instead of every request thread doing
+memory hungry scrypt work at once.
+"""
+
+import base64
+import concurrent.futures
+import hashlib
+import hmac
+import os
+import threading
+
+import forking
+
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600000
+SALT_BYTES = 16
+HASH_BYTES = 32
+HASH_WORKERS = min(4, os.cpu_count() or 1)
+
+
+def encode(data):
+    """bytes as unpadded url safe base64"""
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def decode(text):
+    """bytes from unpadded url safe base64"""
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class Scrypt:
+    """hashlib.scrypt with a cost of n, block size r and parallelism p"""
+
+    name = "scrypt"
+
+    def __init__(self, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        """n - CPU/memory cost, a power of 2
+        r - block size
+        p - parallelism
+        """
+        self.n = n
+        self.r = r
+        self.p = p
+
+    @staticmethod
+    def from_parameters(text):
+        """the Scrypt described by parameters()"""
+        values = dict(p.split("=", 1) for p in text.split(","))
+        return Scrypt(int(values["n"]), int(values["r"]), int(values["p"]))
+
+    def parameters(self):
+        """the parameters as stored in a hash"""
+        return f"n={self.n},r={self.r},p={self.p}"
+
+    def derive(self, password, salt):
+        """the hash of the password"""
+        return hashlib.scrypt(
+            password.encode("utf-8"),
+            salt=salt,
+            n=self.n,
+            r=self.r,
+            p=self.p,
+            maxmem=256 * self.n * self.r * self.p,
+            dklen=HASH_BYTES,
+        )
+
+
+class Pbkdf2:
+    """hashlib.pbkdf2_hmac of SHA-256 with a number of iterations"""
+
+    name = "pbkdf2_sha256"
+
+    def __init__(self, iterations=PBKDF2_ITERATIONS):
+        """iterations - the number of rounds of HMAC"""
+        self.iterations = iterations
+
+    @staticmethod
+    def from_parameters(text):
+        """the Pbkdf2 described by parameters()"""
+        return Pbkdf2(int(dict([text.split("=", 1)])["i"]))
+
+    def parameters(self):
+        """the parameters as stored in a hash"""
+        return f"i={self.iterations}"
+
+    def derive(self, password, salt):
+        """the hash of the password"""
+        return hashlib.pbkdf2_hmac(
+            "sha256", password.encode("utf-8"), salt, self.iterations, HASH_BYTES
+        )
+
+
+SCHEMES = {s.name: s for s in (Scrypt, Pbkdf2)}
+
+
+def legacy_hash(password):
+    """the unsalted SHA-256 hex digest older versions stored"""
+    return hashlib.sha256(password.encode("utf-8")).hexdigest()
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with a scheme, on a bounded pool of threads"""
+
+    def __init__(self, scheme=None, workers=HASH_WORKERS):
+        """scheme - Scrypt or Pbkdf2 with the cost to hash new passwords with
+            (default Scrypt())
+        workers - the most passwords hashed at once
+        """
+        self.scheme = Scrypt() if scheme is None else scheme
+        self.__workers = workers
+        self.__pool = None
+        self.__start_pool()
+        # the pool's threads do not exist in a forked child
+        forking.after_fork_in_child(self.__start_pool)
+
+    def __start_pool(self):
+        self.__pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.__workers, thread_name_prefix="password"
+        )
+
+    def hash(self, password):
+        """a new salted hash of the password"""
+        return self.__pool.submit(self.__hash, password).result()
+
+    def hash_all(self, passwords):
+        """new salted hashes of a list of passwords, in order"""
+        return list(self.__pool.map(self.__hash, passwords))
+
+    def __hash(self, password):
+        salt = os.urandom(SALT_BYTES)
+        digest = self.scheme.derive(password, salt)
+        return "$".join(
+            [self.scheme.name, self.scheme.parameters(), encode(salt), encode(digest)]
+        )
+
+    def verify(self, password, stored):
+        """does the password match the stored hash"""
+        if not stored:
+            return False
+        if "$" not in stored:
+            return hmac.compare_digest(legacy_hash(password), stored)
+        return self.__pool.submit(self.__verify, password, stored).result()
+
+    @staticmethod
+    def __verify(password, stored):
+        try:
+            name, parameters, salt, digest = stored.split("$")
+            scheme = SCHEMES[name].from_parameters(parameters)
+            expected = decode(digest)
+            return hmac.compare_digest(scheme.derive(password, decode(salt)), expected)
+        except (KeyError, ValueError):
+            return False
+
+    def needs_rehash(self, stored):
+        """was the stored hash made with a different scheme or cost"""
+        parts = (stored or "").split("$")
+        return len(parts) != 4 or parts[:2] != [
+            self.scheme.name,
+            self.scheme.parameters(),
+        ]
+
+    def close(self):
+        """stop the hashing threads"""
+        self.__pool.shutdown()
+
+
+DEFAULT_HASHER = {}  # "hasher": the shared PasswordHasher, made when first needed
+DEFAULT_HASHER_LOCK = threading.Lock()
+
+
+def default_hasher():
+    """the PasswordHasher shared by everything that does not pass its own"""
+    with DEFAULT_HASHER_LOCK:
+        if "hasher" not in DEFAULT_HASHER:
+            DEFAULT_HASHER["hasher"] = PasswordHasher()
+        return DEFAULT_HASHER["hasher"]
+
+
+def configure(scheme=None, workers=HASH_WORKERS):
+    """change the scheme, cost or number of threads of the shared PasswordHasher
+    used by Databases created after this (stored hashes made with another scheme or
+    cost are rehashed on login)"""
+    with DEFAULT_HASHER_LOCK:
+        DEFAULT_HASHER["hasher"] = PasswordHasher(scheme, workers)
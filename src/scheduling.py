@@ -3,15 +3,36 @@
 """ scheduling restaurant staff
 """
 
+# C0302: Too many lines in module (too-many-lines)
+# pylint: disable=C0302
+
 import argparse
+import csv
 import datetime
+import functools
+import json
 import os
 import platform
+import sys
 import time
+import urllib.parse
 
-from flask import Flask, render_template, request, redirect, make_response
+from flask import Flask, render_template, request, redirect, make_response, jsonify
+from flask import Response, stream_with_context
+from werkzeug.http import is_resource_modified
 
+import availability
+import batch
+import cover
+import export
+import identity
+import metrics
 import model
+import page_cache
+import passwords
+import serving
+import shift_calendar
+import solver
 import tests.prepopulate
 
 # TODO: template # pylint: disable=W0511
@@ -29,7 +50,13 @@ else:
 
 STORAGE = "sqlite:///" + STORAGE_PATH
 USER_ID_COOKIE = "session"
+READ_PRIMARY_COOKIE = "read_primary"
+REPLICA_LAG_SECONDS = 10  # a browser reads from the primary this long after a write
 MAXIMUM_FUTURE_DATE_IN_SECONDS = 1 * 365 * 24 * 60 * 60.0
+SCHEDULE_DAYS_SHOWN = 14
+EXPORT_DAYS = 28  # the dates exported when no end is given
+FEED_PAST_DAYS = 31  # the days before today in a calendar feed
+FEED_FUTURE_DAYS = 366  # the days from today on in a calendar feed
 
 
 def convert_from_html_date(html_date):
@@ -48,25 +75,169 @@ def convert_from_html_time(html_time):
     return parsed.tm_hour * 60 + parsed.tm_min
 
 
+# imported files repeat the same few dates and times, parsing them is the slow part
+IMPORT_PARSE_CACHE_SIZE = 4096
+parse_import_date = functools.lru_cache(IMPORT_PARSE_CACHE_SIZE)(convert_from_html_date)
+parse_import_time = functools.lru_cache(IMPORT_PARSE_CACHE_SIZE)(convert_from_html_time)
+
+
+def convert_import_fields(fields):
+    """Converts the text values of an imported record to database values
+    times may be minutes since midnight or 9:00 AM, dates are 2021-12-31,
+    shift roles may be Server:2;Cook:1 or {"Server": 2, "Cook": 1}
+    """
+    converted = {}
+
+    for name, value in fields.items():
+        if value == "" or value is None:
+            converted[name] = None
+        elif not isinstance(value, str):
+            converted[name] = value
+        elif name in ("restaurant_id", "day_of_week"):
+            converted[name] = int(value)
+        elif name in ("priority", "gm_priority", "hours_limit"):
+            converted[name] = float(value)
+        elif name in ("start_time", "end_time"):
+            converted[name] = (
+                int(value) if value.isdigit() else parse_import_time(value)
+            )
+        elif name in ("start_date", "end_date"):
+            converted[name] = parse_import_date(value)
+        elif name == "admin":
+            converted[name] = value.lower() in ("1", "true", "yes")
+        elif name == "roles":
+            converted[name] = {
+                r.split(":")[0].strip(): int(r.split(":")[1])
+                for r in value.split(";")
+                if r.strip()
+            }
+        else:
+            converted[name] = value
+
+    return converted
+
+
+def read_import_file(path, kind=None):
+    """Reads (kind, fields) records one at a time from a file for Database.bulk_import
+    path - .csv, .json (a list of records) or json lines (one record per line) file
+    kind - the kind of record for records that do not have a kind field
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    with open(path, newline="", encoding="utf-8") as file:
+        if extension == ".csv":
+            rows = csv.DictReader(file)
+        elif extension == ".json":
+            rows = json.load(file)
+        else:
+            rows = (json.loads(line) for line in file if line.strip())
+
+        for row in rows:
+            fields = dict(row)
+            yield (fields.pop("kind", None) or kind, convert_import_fields(fields))
+
+
 # R0915: Too many statements (51/50) (too-many-statements)
 # R0914: Too many local variables (16/15) (too-many-locals)
-def create_app(storage_url, source_dir, template_dir):
-    # pylint: disable=R0914,R0915
-    """create the flask app"""
+# R0913: Too many arguments (7/5) (too-many-arguments)
+def create_app(
+    storage_url,
+    source_dir,
+    template_dir,
+    instrumentation=None,
+    *,
+    secret_key=None,
+    engine_options=None,
+    replica_urls=None,
+):
+    # pylint: disable=R0913,R0914,R0915
+    """create the flask app
+    instrumentation - a metrics.Metrics to record the app and database with (optional)
+    secret_key - signs the session cookies, every process serving the app must use the
+        same key (default $SCHEDULING_SECRET_KEY or a random key)
+    engine_options - model.EngineOptions for the database (optional)
+    replica_urls - read replicas of storage_url to spread reads over (optional)
+    """
     app = Flask(
         __name__,
         static_url_path="",
         static_folder=source_dir,
         template_folder=template_dir,
     )
-    database = model.Database(storage_url)
+    app.secret_key = (
+        secret_key or os.environ.get("SCHEDULING_SECRET_KEY") or os.urandom(32)
+    )
+    database = model.Database(
+        storage_url,
+        idle_timeout=model.SESSION_IDLE_SECONDS,  # requests start a new session
+        engine_options=engine_options,
+        replica_urls=replica_urls,
+    )
+    identities = identity.IdentityCache(database)
+    if instrumentation is not None:
+        for engine in database.engines():
+            instrumentation.watch_engine(engine)
+        instrumentation.watch_app(app)
+    cover_index = cover.CoverIndex(database, availability.AvailabilityIndex(database))
+    calendar = shift_calendar.ShiftCalendar(database)
+    pages = page_cache.PageCache(database)
+
+    @app.teardown_appcontext
+    def remove_session(_):
+        """Release the database session used by the request"""
+        database.remove_session()
+
+    if replica_urls:
+
+        @app.before_request
+        def read_own_writes():
+            """Read from the primary for a while after this browser wrote, so the page
+            it is redirected to shows the change even if the replicas are behind"""
+            if READ_PRIMARY_COOKIE in request.cookies:
+                database.use_primary()
+
+        @app.after_request
+        def remember_writes(response):
+            """Have the browser read from the primary for a while if this request wrote"""
+            if database.wrote():
+                response.set_cookie(
+                    READ_PRIMARY_COOKIE,
+                    "1",
+                    max_age=REPLICA_LAG_SECONDS,
+                    httponly=True,
+                )
+            return response
+
+    def current_identity():
+        """The identity.Identity of the logged in user (None if not logged in)"""
+        return identities.get(
+            identity.session_user_id(
+                app.secret_key, request.cookies.get(USER_ID_COOKIE)
+            )
+        )
+
+    def current_user():
+        """The logged in User (None if not logged in)"""
+        found = current_identity()
+        return None if found is None else database.get_user(found.user_id)
+
+    def log_in(response, user):
+        """Set the session cookie for the user on the response"""
+        response.set_cookie(
+            USER_ID_COOKIE,
+            identity.session_token(app.secret_key, user.id),
+            max_age=identity.SESSION_MAX_AGE_SECONDS,
+            httponly=True,
+            secure=False,
+        )
+        return response
 
     # Mark: Root
 
     @app.route("/")
     def home():
         """default location for the server, home"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_user()
         return render_template("index.html", user=user)
 
     # Mark: Generic Actions
@@ -85,13 +256,13 @@ def create_app(storage_url, source_dir, template_dir):
         password = request.form["password"]
         user = database.find_user(email)
 
-        if user is None and not database.get_users():
+        if user is None and not database.search_users(limit=1)[0]:
             # Creates Employee in the database if not exists
             user = database.create_user(
                 email, password, "Admin", hours_limit=0.0, admin=True
             )
-        elif user is None:
-            # Redirects the user if not found in the database
+        elif user is None or not database.check_password(user, password):
+            # Redirects the user if not found in the database (or the wrong password)
             return redirect("/#user_not_found")
         restaurants = {r.id: r for r in user.gm_at}
         restaurants.update(
@@ -103,8 +274,7 @@ def create_app(storage_url, source_dir, template_dir):
             )
         else:
             response = make_response(redirect("/welcome"))
-        response.set_cookie(USER_ID_COOKIE, str(user.id), secure=False)
-        return response
+        return log_in(response, user)
 
     # Mark: User Actions
 
@@ -114,27 +284,27 @@ def create_app(storage_url, source_dir, template_dir):
         name = request.form["name"]
         email = request.form["email"]
         password = request.form["password"]
-        user = database.create_user(
-            email, password, name, hours_limit=40.0, admin=False
-        )
+        user = database.find_user(email)
+        if user is not None and not database.check_password(user, password):
+            return redirect("/#user_account_already_exists")
+        if user is None:
+            user = database.create_user(
+                email, password, name, hours_limit=40.0, admin=False
+            )
         restaurant = database.get_restaurant(request.form["restaurant_id"])
         if restaurant is not None:
             # Adds Employee to restaurant in the database
             database.add_user_to_restaurant(user, restaurant)
-
-        if not user.password_matches(password):
-            return redirect("/#user_account_already_exists")
         if restaurant is None:
             response = make_response(redirect("/welcome"))
         else:
             response = make_response(redirect(f"/restaurant/{restaurant.id}"))
-        response.set_cookie(USER_ID_COOKIE, str(user.id), secure=False)
-        return response
+        return log_in(response, user)
 
     @app.route("/set_role_priority", methods=["POST"])
     def set_role_priority():
         """Route to set_role_priority using 'POST'"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_user()
         if user is None:
             return (render_template("404.html", path="???"), 404)
         for role in user.roles:
@@ -150,6 +320,7 @@ def create_app(storage_url, source_dir, template_dir):
             new_gm_priority = request.form.get(f"{role.id}_gm_priority", None)
             if new_gm_priority is not None:
                 role.gm_priority = float(new_gm_priority)
+        database.flush()
         return redirect(f"/restaurant/{restaurant.id}")
 
     # Mark: Restaurant Actions
@@ -157,7 +328,7 @@ def create_app(storage_url, source_dir, template_dir):
     @app.route("/create_restaurant", methods=["POST"])
     def create_restaurant():
         """Creates a restaurant object"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_identity()
 
         if user is None or not user.admin:
             # If user is not both EMPLOYEE OR ADMIN
@@ -170,24 +341,22 @@ def create_app(storage_url, source_dir, template_dir):
     @app.route("/restaurant/<restaurant_id>/set_gm", methods=["POST"])
     def set_restaurant_gm(restaurant_id):
         """Sets the gm for a restaurant"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_identity()
         gm_id = request.form["gm_id"]
         general_manager = database.get_user(gm_id)
         if user is None or not user.admin or general_manager is None:
             return (render_template("404.html", path="???"), 404)
         found = database.get_restaurant(restaurant_id)
-        found.gm = general_manager
+        found.gm_id = general_manager.id
         database.flush()
         return redirect(f"/restaurant/{restaurant_id}")
 
     @app.route("/restaurant/<restaurant_id>/add_role", methods=["POST"])
     def add_restaurant_role(restaurant_id):
         """Adds restaurant role taking 'restaurant_id' as parameter"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
-        restaurant = database.get_restaurant(restaurant_id)
+        user = current_identity()
         name = request.form["name"]
-        required_field_empty = user is None or restaurant is None
-        if required_field_empty or restaurant.gm_id != user.id:
+        if not identity.manages(user, restaurant_id):
             return (render_template("404.html", path="???"), 404)
         database.create_role(restaurant_id, name)
         return redirect(f"/restaurant/{restaurant_id}")
@@ -195,7 +364,7 @@ def create_app(storage_url, source_dir, template_dir):
     @app.route("/restaurant/<restaurant_id>/add_availability", methods=["POST"])
     def add_restaurant_availability(restaurant_id):
         """adds user availability for a restaurant"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_user()
         restaurant = database.get_restaurant(restaurant_id)
         day_of_week = int(request.form["day_of_week"])
         priority = request.form["priority"]
@@ -218,13 +387,19 @@ def create_app(storage_url, source_dir, template_dir):
             priority=priority,
             note=note if note else None,
         )
+        solver.repair_schedule(
+            database,
+            restaurant.id,
+            [solver.AvailabilityChanged(user.id, day_of_week, start_date, end_date)],
+            datetime.date.today(),
+        )
 
         return redirect(f"/restaurant/{restaurant_id}")
 
     @app.route("/restaurant/<restaurant_id>/add_shift", methods=["POST"])
     def add_restaurant_shift(restaurant_id):
         """adds shifts to a restaurant"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_identity()
         restaurant = database.get_restaurant(restaurant_id)
         if user is None or restaurant is None:
             return (render_template("404.html", path="???"), 404)
@@ -252,7 +427,7 @@ def create_app(storage_url, source_dir, template_dir):
     )
     def add_restaurant_shift_role(restaurant_id, shift_id):
         """adds shifts to a restaurant"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        user = current_identity()
         restaurant = database.get_restaurant(restaurant_id)
         shifts = [s for s in restaurant.shifts if s.id == int(shift_id)]
         role_id = int(request.form["role_id"])
@@ -264,16 +439,276 @@ def create_app(storage_url, source_dir, template_dir):
         role = roles[0]  # TODO: assert only one role # pylint: disable=W0511
         database.add_role_to_shift(shift, role, number)
         database.flush()
+        solver.repair_schedule(
+            database,
+            restaurant.id,
+            [solver.DemandChanged(shift.id, role.id, shift.start_date, shift.end_date)],
+            datetime.date.today(),
+        )
+        return redirect(f"/restaurant/{restaurant_id}")
+
+    @app.route("/restaurant/<restaurant_id>/generate_schedule", methods=["POST"])
+    def generate_restaurant_schedule(restaurant_id):
+        """Generates a draft schedule for a restaurant"""
+        user = current_identity()
+        if not identity.manages(user, restaurant_id):
+            return (render_template("404.html", path="???"), 404)
+        start_date = convert_from_html_date(request.form["start_date"])
+        days = int(request.form.get("days", 7))
+        solver.generate_schedule(database, int(restaurant_id), start_date, days)
         return redirect(f"/restaurant/{restaurant_id}")
 
+    # Mark: JSON
+
+    @app.route(
+        "/restaurant/<restaurant_id>/scheduled_shift/<scheduled_shift_id>/cover_candidates"
+    )
+    def cover_candidates(restaurant_id, scheduled_shift_id):
+        """The employees that could cover a scheduled shift, best first"""
+        user = current_identity()
+        scheduled = database.get_scheduled_shift(scheduled_shift_id)
+        if (
+            user is None
+            or scheduled is None
+            or str(scheduled.shift.restaurant_id) != restaurant_id
+        ):
+            return (render_template("404.html", path="???"), 404)
+        allowed = user.admin or user.user_id == scheduled.user_id
+        if not allowed and scheduled.shift.restaurant_id not in user.gm_at:
+            return (render_template("404.html", path="???"), 404)
+        return jsonify(
+            {
+                "scheduled_shift": {
+                    "id": scheduled.id,
+                    "date": scheduled.date.strftime("%Y-%m-%d"),
+                    "start_time": scheduled.shift.start_time,
+                    "end_time": scheduled.shift.end_time,
+                    "role_id": scheduled.role_id,
+                    "user_id": scheduled.user_id,
+                },
+                "candidates": [c._asdict() for c in cover_index.candidates(scheduled)],
+            }
+        )
+
+    @app.route("/restaurant/<restaurant_id>/hours")
+    def restaurant_hours(restaurant_id):
+        """The hours each employee of a restaurant is scheduled in a week and has left
+        under their limit
+        week - a date in the week (default today)
+        """
+        user = current_identity()
+        if not identity.manages(user, restaurant_id):
+            return (render_template("404.html", path="???"), 404)
+        day = (
+            convert_from_html_date(request.args["week"])
+            if "week" in request.args
+            else datetime.date.today()
+        )
+        monday = solver.as_datetime(solver.week_start(day))
+        scheduled = database.get_scheduled_minutes(
+            int(restaurant_id), monday, monday + datetime.timedelta(days=7)
+        )
+        employees = []
+        for user_id, limit in sorted(
+            database.get_hours_limits(int(restaurant_id)).items()
+        ):
+            minutes, draft_minutes = scheduled.get((user_id, monday), (0, 0))
+            limit = limit if limit is not None and limit > 0 else None
+            employees.append(
+                {
+                    "user_id": user_id,
+                    "hours": minutes / 60.0,
+                    "draft_hours": draft_minutes / 60.0,
+                    "hours_limit": limit,
+                    "hours_remaining": (
+                        None
+                        if limit is None
+                        else limit - (minutes + draft_minutes) / 60.0
+                    ),
+                }
+            )
+        return jsonify({"week": monday.strftime("%Y-%m-%d"), "employees": employees})
+
+    @app.route("/restaurant/<restaurant_id>/shifts")
+    def restaurant_shifts(restaurant_id):
+        """The shifts of a restaurant on each date, one page of dates at a time
+        start - the first date (default today)
+        days - the number of dates in the page (default SCHEDULE_DAYS_SHOWN)
+        """
+        user = current_identity()
+        if not identity.manages(user, restaurant_id) and not (
+            user is not None
+            and user.admin
+            and database.get_restaurant(restaurant_id) is not None
+        ):
+            return (render_template("404.html", path="???"), 404)
+        start = (
+            convert_from_html_date(request.args["start"])
+            if "start" in request.args
+            else datetime.date.today()
+        )
+        days = min(
+            int(request.args.get("days", SCHEDULE_DAYS_SHOWN)),
+            shift_calendar.MAXIMUM_DAYS,
+        )
+        version, expanded = calendar.expand_shifts(int(restaurant_id), start, days)
+        next_start = solver.as_date(start) + datetime.timedelta(days=days)
+        return jsonify(
+            {
+                "version": version,
+                "dates": [shift_calendar.as_json(d, s) for d, s in expanded],
+                "next": f"/restaurant/{restaurant_id}/shifts"
+                + f"?start={next_start.strftime('%Y-%m-%d')}&days={days}",
+            }
+        )
+
+    def users_page(prefix="", cursor=None, limit=model.USER_PAGE_SIZE):
+        """(users, url of the next page or None) of the users matching a prefix"""
+        limit = min(max(limit, 1), model.MAXIMUM_USER_PAGE_SIZE)
+        users, next_cursor = database.search_users(prefix, limit, cursor)
+        query = {"prefix": prefix, "limit": limit, "cursor": next_cursor}
+        return (
+            users,
+            None if next_cursor is None else "/users?" + urllib.parse.urlencode(query),
+        )
+
+    @app.route("/restaurant/<restaurant_id>/export.<export_format>")
+    def export_schedule(restaurant_id, export_format):
+        """The published schedule of a restaurant as csv, ics or ndjson, streamed
+        start - the first date (default today)
+        end - the day after the last date (default EXPORT_DAYS after start)
+        user - only this employee's shifts, employees can only export their own
+        """
+        user = current_identity()
+        restaurant_found = (
+            database.get_restaurant(restaurant_id) if restaurant_id.isdigit() else None
+        )
+        if user is None or restaurant_found is None:
+            return (render_template("404.html", path="???"), 404)
+        user_id = int(request.args["user"]) if "user" in request.args else None
+        if not user.admin and not identity.manages(user, restaurant_id):
+            if restaurant_found.id not in user.works_at or user_id not in (
+                None,
+                user.user_id,
+            ):
+                return (render_template("404.html", path="???"), 404)
+            user_id = user.user_id
+        if export_format not in export.FORMATS:
+            return (render_template("404.html", path="???"), 404)
+        start = (
+            convert_from_html_date(request.args["start"])
+            if "start" in request.args
+            else solver.as_datetime(datetime.date.today())
+        )
+        end = (
+            convert_from_html_date(request.args["end"])
+            if "end" in request.args
+            else start + datetime.timedelta(days=EXPORT_DAYS)
+        )
+        rows = database.iter_published_shifts(restaurant_found.id, start, end, user_id)
+        filename = f"schedule-{restaurant_found.id}-{start:%Y%m%d}.{export_format}"
+        return Response(
+            stream_with_context(
+                export.chunked(export.lines(export_format, rows, restaurant_found.name))
+            ),
+            mimetype=export.MIMETYPES[export_format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    @app.route("/feed/<token>.ics")
+    def schedule_feed(token):
+        """A user's published shifts at every restaurant as an iCalendar feed, for
+        calendar apps to poll. Whether it changed is answered from the user's schedule
+        version alone, without reading any shifts."""
+        user_id = identity.feed_user_id(app.secret_key, token)
+        if user_id is None:
+            return (render_template("404.html", path="???"), 404)
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        today = solver.as_datetime(now)  # the feed's dates move on once a day
+        versions, modified = database.get_schedule_version(user_id)
+        etag = f"{user_id}-{versions[0]}-{versions[1]}-{today:%Y%m%d}"
+        last_modified = max(modified or today, today)
+        if not is_resource_modified(
+            request.environ, etag=etag, last_modified=last_modified
+        ):
+            response = make_response("", 304)
+        else:
+            user = database.get_user(user_id)
+            if user is None:
+                return (render_template("404.html", path="???"), 404)
+            rows = database.iter_published_shifts(
+                None,
+                today - datetime.timedelta(days=FEED_PAST_DAYS),
+                today + datetime.timedelta(days=FEED_FUTURE_DAYS),
+                user_id,
+            )
+            response = Response(
+                stream_with_context(
+                    export.chunked(
+                        export.ics_lines(rows, f"{user.name} shifts", last_modified)
+                    )
+                ),
+                mimetype=export.MIMETYPES["ics"],
+            )
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    @app.route("/users")
+    def search_users():
+        """A page of the users whose email starts with a prefix (admin only)
+        prefix - the start of the email (default all users)
+        limit - the number of users in the page (default model.USER_PAGE_SIZE, at most
+            model.MAXIMUM_USER_PAGE_SIZE)
+        cursor - from the next url of the previous page
+        """
+        user = current_identity()
+        if user is None or not user.admin:
+            return (render_template("404.html", path="???"), 404)
+        users, next_url = users_page(
+            request.args.get("prefix", ""),
+            request.args.get("cursor"),
+            request.args.get("limit", model.USER_PAGE_SIZE, type=int),
+        )
+        return jsonify(
+            {
+                "users": [
+                    {"id": u.id, "name": u.name, "email": u.email} for u in users
+                ],
+                "next": next_url,
+            }
+        )
+
+    @app.route("/metrics")
+    def app_metrics():
+        """Request and SQL metrics in the Prometheus text format (admin only)"""
+        user = current_identity()
+        if instrumentation is None or user is None or not user.admin:
+            return (render_template("404.html", path="???"), 404)
+        response = make_response(instrumentation.prometheus())
+        response.mimetype = "text/plain"
+        response.headers["Content-Type"] = "text/plain; version=0.0.4; charset=utf-8"
+        return response
+
     # Mark: Actual websites
 
     @app.route("/welcome")
     def welcome():
         """Fetches Employee from database"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
+        viewer = current_identity()
+        if viewer is None or viewer.admin:
+            return render_welcome()  # the admin page shows live session statistics
+        return pages.respond(
+            pages.key("welcome", viewer.works_at | viewer.gm_at, viewer.user_id),
+            render_welcome,
+        )
+
+    def render_welcome():
+        """The welcome page of the logged in user"""
+        user = current_user()
         admin_user = user.admin if user is not None else False
-        user_list = database.get_users() if admin_user else []
+        user_list, more_users = users_page() if admin_user else ([], None)
         if admin_user:
             restaurant_list = database.get_restaurants()
         else:
@@ -296,23 +731,44 @@ def create_app(storage_url, source_dir, template_dir):
             "welcome.html",
             user=user,
             user_list=user_list,
+            more_users=more_users,
             restaurant_list=restaurant_list,
             user_restaurants=restaurants,
             sorted_roles=sorted_roles,
-            sessions=", ".join([f"{s:.1f}" for s in database.sessions()]),
+            sessions=database.sessions(),
+            feed_url=(
+                f"/feed/{identity.feed_token(app.secret_key, user.id)}.ics"
+                if user is not None
+                else None
+            ),
         )
 
     @app.route("/restaurant/<restaurant_id>")
     def restaurant(restaurant_id):
         """Fetches Employee "USER_ID_COOKIE' from database"""
-        user = database.get_user(request.cookies.get(USER_ID_COOKIE))
-        found = database.get_restaurant(restaurant_id)
+        if not restaurant_id.isdigit():
+            return (render_template("404.html", path="???"), 404)
+        viewer = current_identity()
+        key = pages.key(
+            "restaurant",
+            [int(restaurant_id)],
+            None if viewer is None else viewer.user_id,
+            datetime.date.today(),
+        )
+        return pages.respond(key, functools.partial(render_restaurant, restaurant_id))
+
+    def render_restaurant(restaurant_id):
+        """The restaurant page for the logged in user"""
+        user = current_user()
+        found = database.load_restaurant_view(restaurant_id)
 
         if not found:
             return (render_template("404.html", path="???"), 404)
 
         admin_user = user.admin if user is not None else False
-        user_list = database.get_users() if admin_user else []
+        user_list = users_page()[0] if admin_user else []
+        if admin_user and found.gm is not None and found.gm not in user_list:
+            user_list.insert(0, found.gm)
         gm_user_roles = [p for r in found.roles for p in r.preferences]
         gm_user_roles.sort(key=lambda r: r.gm_priority)
         user_restaurant_roles = (
@@ -324,6 +780,19 @@ def create_app(storage_url, source_dir, template_dir):
         employees_by_id = {
             p.user.id: p.user for r in found.roles for p in r.preferences
         }
+        schedule_start = datetime.datetime.combine(
+            datetime.date.today(), datetime.time()
+        )
+        scheduled_shifts = (
+            database.get_scheduled_shifts(
+                found.id,
+                schedule_start,
+                schedule_start + datetime.timedelta(days=SCHEDULE_DAYS_SHOWN),
+            )
+            if user is not None and found.gm_id == user.id
+            else []
+        )
+        scheduled_shifts.sort(key=lambda s: (s.date, s.shift.start_time, s.role_id))
         return render_template(
             "restaurant.html",
             restaurant=found,
@@ -334,6 +803,7 @@ def create_app(storage_url, source_dir, template_dir):
             today=time.strftime("%Y-%m-%d"),
             now=datetime.datetime.now(),
             employees=list(employees_by_id.values()),
+            scheduled_shifts=scheduled_shifts,
             latest_date=time.strftime(
                 "%Y-%m-%d", time.localtime(time.time() + MAXIMUM_FUTURE_DATE_IN_SECONDS)
             ),
@@ -362,6 +832,11 @@ def parse_args():
     parser.add_argument(
         "-s", "--storage", default=STORAGE, help="SqlAlchemy url to store information"
     )
+    parser.add_argument(
+        "--replica",
+        action="append",
+        help="SqlAlchemy url of a read replica of --storage (repeat for more)",
+    )
     parser.add_argument(
         "-t", "--test", action="store_true", help="Preload data into the database"
     )
@@ -372,7 +847,151 @@ def parse_args():
         default="ui",
         help="Path to the directory with ui files.",
     )
-    parser.add_argument("-d", "--debug", default=False, help="Run debug server.")
+    parser.add_argument("-d", "--debug", action="store_true", help="Run debug server.")
+    parser.add_argument(
+        "--server",
+        choices=serving.SERVERS,
+        default="dev",
+        help="dev is Flask's debug server, gunicorn runs --workers processes and "
+        + "waitress one process, each of --threads threads (default dev)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=serving.DEFAULT_WORKERS,
+        help=f"gunicorn worker processes (default {serving.DEFAULT_WORKERS})",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=serving.DEFAULT_THREADS,
+        help=f"Threads per worker (default {serving.DEFAULT_THREADS})",
+    )
+    parser.add_argument(
+        "--keep-alive",
+        type=int,
+        default=serving.DEFAULT_KEEP_ALIVE_SECONDS,
+        help="Seconds to keep an idle connection open "
+        + f"(default {serving.DEFAULT_KEEP_ALIVE_SECONDS})",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=serving.DEFAULT_GRACEFUL_TIMEOUT_SECONDS,
+        help="Seconds workers have to finish their requests when reloaded or stopped "
+        + f"(default {serving.DEFAULT_GRACEFUL_TIMEOUT_SECONDS})",
+    )
+    parser.add_argument(
+        "-m",
+        "--metrics",
+        action="store_true",
+        help="Record request and SQL metrics, shown to admins at /metrics "
+        + "(kept by each worker process)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Write cProfile stats of slow requests to this directory (implies -m)",
+    )
+    parser.add_argument(
+        "--profile-threshold",
+        type=float,
+        default=1.0,
+        help="Seconds a request must take to be profiled (default 1.0)",
+    )
+    parser.add_argument(
+        "--password-cost",
+        type=int,
+        default=passwords.SCRYPT_N,
+        help="scrypt cost (n) for new password hashes, older hashes are upgraded "
+        + f"on login (default {passwords.SCRYPT_N})",
+    )
+    parser.add_argument(
+        "--password-workers",
+        type=int,
+        default=passwords.HASH_WORKERS,
+        help="Passwords hashed at once, more logins wait "
+        + f"(default {passwords.HASH_WORKERS})",
+    )
+    add_engine_arguments(parser)
+    commands = parser.add_subparsers(dest="command")
+    importer = commands.add_parser(
+        "import", help="Bulk import users, roles, availabilities and shifts"
+    )
+    importer.add_argument(
+        "file", help="csv, json or json lines (.ndjson, .jsonl) file to import"
+    )
+    importer.add_argument(
+        "-k",
+        "--kind",
+        choices=model.IMPORT_KINDS,
+        help="The kind of record for files without a kind column",
+    )
+    importer.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=model.BULK_BATCH_SIZE,
+        help=f"Records per transaction (default {model.BULK_BATCH_SIZE})",
+    )
+    generator = commands.add_parser(
+        "generate", help="Generate draft schedules for many restaurants in parallel"
+    )
+    which = generator.add_mutually_exclusive_group(required=True)
+    which.add_argument("--all", action="store_true", help="Every restaurant")
+    which.add_argument(
+        "-r",
+        "--restaurant",
+        type=int,
+        action="append",
+        help="The id of a restaurant (repeat for more)",
+    )
+    generator.add_argument(
+        "--week",
+        type=convert_from_html_date,
+        required=True,
+        help="The first date to schedule (YYYY-MM-DD)",
+    )
+    generator.add_argument(
+        "--days", type=int, default=7, help="The number of days (default 7)"
+    )
+    generator.add_argument(
+        "--workers",
+        dest="generate_workers",
+        type=int,
+        default=batch.DEFAULT_WORKERS,
+        help=f"Worker processes (default {batch.DEFAULT_WORKERS})",
+    )
+    exporter = commands.add_parser(
+        "export", help="Write a restaurant's published schedule as csv, ics or ndjson"
+    )
+    exporter.add_argument(
+        "-r", "--restaurant", type=int, required=True, help="The id of the restaurant"
+    )
+    exporter.add_argument(
+        "--start",
+        type=convert_from_html_date,
+        required=True,
+        help="The first date (YYYY-MM-DD)",
+    )
+    exporter.add_argument(
+        "--end",
+        type=convert_from_html_date,
+        required=True,
+        help="The day after the last date (YYYY-MM-DD)",
+    )
+    exporter.add_argument(
+        "-f", "--format", choices=export.FORMATS, default="csv", help="(default csv)"
+    )
+    exporter.add_argument("--user", type=int, help="Only this employee's shifts")
+    exporter.add_argument("-o", "--output", help="The file to write (default stdout)")
+    reconciler = commands.add_parser(
+        "reconcile",
+        help="Rebuild the hours employees are scheduled each week from the schedules",
+    )
+    reconciler.add_argument(
+        "-r", "--restaurant", type=int, help="Only this restaurant (default all)"
+    )
     args = parser.parse_args()
 
     if args.test:
@@ -381,14 +1000,186 @@ def parse_args():
     return args
 
 
+def add_engine_arguments(parser):
+    """Add the model.EngineOptions command line arguments"""
+    defaults = model.EngineOptions()
+    engine = parser.add_argument_group("database connections")
+    engine.add_argument(
+        "--sqlite-journal-mode",
+        choices=["wal", "delete", "truncate", "persist", "memory", "off"],
+        default=defaults.journal_mode,
+        help=f"SQLite journal mode (default {defaults.journal_mode})",
+    )
+    engine.add_argument(
+        "--sqlite-synchronous",
+        choices=["off", "normal", "full", "extra"],
+        default=defaults.synchronous,
+        help=f"SQLite synchronous setting (default {defaults.synchronous})",
+    )
+    engine.add_argument(
+        "--sqlite-busy-timeout",
+        type=int,
+        default=defaults.busy_timeout,
+        help="Milliseconds to wait for a SQLite lock "
+        + f"(default {defaults.busy_timeout})",
+    )
+    engine.add_argument(
+        "--sqlite-mmap-size",
+        type=int,
+        default=defaults.mmap_size,
+        help=f"Bytes of SQLite file to memory map (default {defaults.mmap_size})",
+    )
+    engine.add_argument(
+        "--pool-size",
+        type=int,
+        default=defaults.pool_size,
+        help=f"Connections kept open per process (default {defaults.pool_size})",
+    )
+    engine.add_argument(
+        "--max-overflow",
+        type=int,
+        default=defaults.max_overflow,
+        help="Connections opened beyond --pool-size when busy "
+        + f"(default {defaults.max_overflow})",
+    )
+    engine.add_argument(
+        "--pool-pre-ping",
+        action=argparse.BooleanOptionalAction,
+        default=defaults.pool_pre_ping,
+        help="Test pooled connections before using them",
+    )
+    engine.add_argument(
+        "--pool-recycle",
+        type=int,
+        default=defaults.pool_recycle,
+        help="Seconds before a pooled connection is replaced (default never)",
+    )
+
+
+def engine_options_from(args):
+    """The model.EngineOptions from the command line arguments"""
+    return model.EngineOptions(
+        args.sqlite_journal_mode,
+        args.sqlite_synchronous,
+        args.sqlite_busy_timeout,
+        args.sqlite_mmap_size,
+        args.pool_size,
+        args.max_overflow,
+        args.pool_pre_ping,
+        args.pool_recycle,
+    )
+
+
+def print_generated(generated):
+    """Print the outcome of generating a restaurant's schedule"""
+    if generated.error is None:
+        print(
+            f"restaurant {generated.restaurant_id}: {generated.assigned} assigned, "
+            + f"{generated.unfilled} unfilled in {generated.seconds:.2f} seconds"
+        )
+    else:
+        print(f"restaurant {generated.restaurant_id}: failed {generated.error}")
+
+
+def generate_schedules(args):
+    """The generate command, exits with an error if any restaurant failed"""
+    started = time.time()
+    finished = batch.generate_all(
+        args.storage,
+        args.week,
+        args.days,
+        workers=args.generate_workers,
+        engine_options=engine_options_from(args),
+        restaurant_ids=None if args.all else args.restaurant,
+        report=print_generated,
+    )
+    failed = [g.restaurant_id for g in finished if g.error is not None]
+    print(
+        f"Generated {len(finished) - len(failed)} schedules "
+        + f"in {time.time() - started:.1f} seconds"
+    )
+    if failed:
+        raise SystemExit(f"Failed restaurants: {', '.join(map(str, failed))}")
+
+
+def write_export(args):
+    """The export command"""
+    database = model.Database(args.storage, engine_options=engine_options_from(args))
+    restaurant = database.get_restaurant(args.restaurant)
+    if restaurant is None:
+        raise SystemExit(f"There is no restaurant {args.restaurant}")
+    rows = database.iter_published_shifts(
+        restaurant.id, args.start, args.end, args.user
+    )
+    chunks = export.chunked(export.lines(args.format, rows, restaurant.name))
+
+    if args.output is None:
+        sys.stdout.writelines(chunks)
+        return
+
+    with open(args.output, "w", newline="", encoding="utf-8") as file:
+        file.writelines(chunks)
+
+
 def main():
     """Entry point. Loop forever unless we are told not to."""
 
     args = parse_args()
+    passwords.configure(passwords.Scrypt(args.password_cost), args.password_workers)
+    if args.command == "import":
+        started = time.time()
+        counts = model.Database(
+            args.storage, engine_options=engine_options_from(args)
+        ).bulk_import(read_import_file(args.file, args.kind), args.batch_size)
+        summary = ", ".join(f"{k}: {c}" for k, c in sorted(counts.items()))
+        print(f"Imported {summary} in {time.time() - started:.1f} seconds")
+        return
+    if args.command == "generate":
+        generate_schedules(args)
+        return
+    if args.command == "export":
+        write_export(args)
+        return
+    if args.command == "reconcile":
+        started = time.time()
+        wrong = model.Database(
+            args.storage, engine_options=engine_options_from(args)
+        ).reconcile_scheduled_minutes(args.restaurant)
+        print(f"Corrected {wrong} weekly totals in {time.time() - started:.1f} seconds")
+        return
     if args.test:
         tests.prepopulate.load(args.storage)
-    app = create_app(args.storage, args.ui, os.path.join(args.ui, "template"))
-    app.run(host="0.0.0.0", debug=args.debug, port=args.port)
+    # every worker process must sign sessions with the same key
+    secret_key = os.environ.get("SCHEDULING_SECRET_KEY") or os.urandom(32)
+    factory = functools.partial(
+        create_app,
+        args.storage,
+        args.ui,
+        os.path.join(args.ui, "template"),
+        instrumentation=(
+            metrics.Metrics(args.profile_dir, args.profile_threshold)
+            if args.metrics or args.profile_dir
+            else None
+        ),
+        secret_key=secret_key,
+        engine_options=engine_options_from(args),
+        replica_urls=args.replica,
+    )
+    if args.server == "dev":
+        factory().run(host="0.0.0.0", debug=args.debug, port=args.port)
+        return
+    serving.serve(
+        args.server,
+        factory,
+        serving.ServerOptions(
+            "0.0.0.0",
+            args.port,
+            args.workers,
+            args.threads,
+            args.keep_alive,
+            args.graceful_timeout,
+        ),
+    )
 
 
 if __name__ == "__main__":
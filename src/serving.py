@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+""" Serving the app with a production WSGI server
+
+gunicorn runs a number of worker processes, each with a pool of threads (unix only).
+Each worker calls the app factory after it is forked, so it has its own database
+engine, sessions and caches. The caches hear about the changes their own worker commits
+right away and check the model.DataVersion rows, which every commit updates, for the
+changes other workers commit. The rows are read at most once every
+model.VERSION_POLL_SECONDS, so every worker gives the same answers shortly after a write.
+
+Send the gunicorn master SIGHUP to gracefully replace the workers (eg after deploying
+new code) and SIGTERM to stop after the requests in flight.
+
+waitress runs a pool of threads in a single process and works everywhere.
+
+Neither server is required by the app, only the one asked for must be installed.
+"""
+
+import collections
+import importlib
+import os
+
+SERVERS = ["dev", "gunicorn", "waitress"]
+DEFAULT_WORKERS = 2 * (os.cpu_count() or 1) + 1
+DEFAULT_THREADS = 4
+DEFAULT_KEEP_ALIVE_SECONDS = 5
+DEFAULT_GRACEFUL_TIMEOUT_SECONDS = 30
+
+ServerOptions = collections.namedtuple(
+    "ServerOptions", ["host", "port", "workers", "threads", "keep_alive", "graceful"]
+)
+
+
+def server_module(name):
+    """import an optional server package, exits with a hint if it is not installed"""
+    try:
+        return importlib.import_module(name)
+    except ImportError as error:
+        package = name.split(".")[0]
+        raise SystemExit(
+            f"{package} is not installed (pip3 install {package})"
+        ) from error
+
+
+def run_gunicorn(factory, options):
+    """serve factory() from options.workers gunicorn processes of options.threads"""
+    base = server_module("gunicorn.app.base")
+    settings = {
+        "bind": f"{options.host}:{options.port}",
+        "workers": options.workers,
+        "threads": options.threads,
+        "keepalive": options.keep_alive,
+        "graceful_timeout": options.graceful,
+        "preload_app": False,  # create the app (and database) in each worker
+    }
+
+    class Application(base.BaseApplication):  # pylint: disable=W0223
+        """gunicorn's application with the settings from the command line"""
+
+        def load_config(self):
+            """set the command line settings"""
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            """create the app in the worker"""
+            return factory()
+
+    Application().run()
+
+
+def run_waitress(factory, options):
+    """serve factory() from options.threads waitress threads"""
+    server_module("waitress").serve(
+        factory(),
+        host=options.host,
+        port=options.port,
+        threads=options.threads,
+        channel_timeout=max(options.keep_alive, 1),
+    )
+
+
+def serve(name, factory, options):
+    """serve the app from factory() with a production server
+    name - "gunicorn" or "waitress"
+    factory - creates the flask app, called in every worker process
+    options - the ServerOptions
+    """
+    servers = {"gunicorn": run_gunicorn, "waitress": run_waitress}
+    servers[name](factory, options)
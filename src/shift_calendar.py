@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+""" The shifts of a restaurant on each date
+
+Shift entries are weekly templates (day of the week, times and the dates they are in
+force). Expanding them into the shifts on each date resolves overlaps: the newest shift
+wins and older shifts that overlap it are left out (see intervals.ShiftIndex).
+
+The templates of a restaurant are read once per shift version. The version of a
+restaurant is the sum of the model.DataVersions of its shifts, the roles of its shifts
+and its roles. Every commit that changes them, made by any process, makes it go up, so
+expanded dates are cached until then.
+"""
+
+import collections
+import datetime
+import threading
+
+import intervals
+import solver
+
+MAXIMUM_DAYS = 62  # the most days returned at once
+DATES_CACHED = 366  # expanded dates kept for each restaurant
+SHIFT_TABLES = ("shift", "shift_roles", "role")
+
+ShiftTemplate = collections.namedtuple(
+    "ShiftTemplate",
+    [
+        "id",
+        "day_of_week",
+        "start_date",
+        "end_date",
+        "start_time",
+        "end_time",
+        "priority",
+        "roles",
+    ],
+)
+ShiftRoleTemplate = collections.namedtuple(
+    "ShiftRoleTemplate", ["id", "role", "number"]
+)
+
+
+def shift_template(shift):
+    """plain copy of a Shift (with its roles) that is safe to share between threads"""
+    return ShiftTemplate(
+        shift.id,
+        shift.day_of_week,
+        shift.start_date,
+        shift.end_date,
+        shift.start_time,
+        shift.end_time,
+        shift.priority,
+        tuple(ShiftRoleTemplate(r.role_id, r.role.name, r.number) for r in shift.roles),
+    )
+
+
+def as_json(date, shifts):
+    """The JSON for the shifts on a date"""
+    return {
+        "date": date.strftime("%Y-%m-%d"),
+        "shifts": [
+            {
+                "id": s.id,
+                "start_time": s.start_time,
+                "end_time": s.end_time,
+                "priority": s.priority,
+                "roles": [r._asdict() for r in s.roles],
+            }
+            for s in shifts
+        ],
+    }
+
+
+class ShiftCalendar:
+    """Expands and caches the shifts of every restaurant"""
+
+    def __init__(self, database):
+        """database - the model.Database to read from"""
+        self.__database = database
+        self.__lock = threading.Lock()
+        self.__restaurants = {}  # restaurant_id: (versions, ShiftIndex, {date: shifts})
+
+    def version(self, restaurant_id):
+        """The shift version of the restaurant"""
+        return sum(
+            self.__database.get_data_versions(SHIFT_TABLES, [restaurant_id]).values()
+        )
+
+    def __restaurant(self, restaurant_id, versions):
+        """(ShiftIndex, {date: shifts}) for a restaurant at some model.DataVersions
+        (lock must be held)"""
+        entry = self.__restaurants.get(restaurant_id)
+        if entry is None or entry[0] != versions:
+            shifts = [
+                shift_template(s) for s in self.__database.get_shifts(restaurant_id)
+            ]
+            entry = (
+                versions,
+                intervals.ShiftIndex(shifts),
+                collections.OrderedDict(),
+            )
+            self.__restaurants[restaurant_id] = entry
+        return entry[1:]
+
+    def expand_shifts(self, restaurant_id, start, days):
+        """The shifts of a restaurant on each date
+        start - the first date
+        days - the number of dates (at most MAXIMUM_DAYS)
+        returns (version, [(date, [ShiftTemplate, ...]), ...])
+        """
+        first = solver.as_date(start)
+        dates = [
+            first + datetime.timedelta(days=d)
+            for d in range(0, max(0, min(days, MAXIMUM_DAYS)))
+        ]
+        expanded = []
+        # read before the shifts, so a change made meanwhile is never cached as older
+        versions = self.__database.get_data_versions(SHIFT_TABLES, [restaurant_id])
+
+        with self.__lock:
+            shift_index, cached = self.__restaurant(restaurant_id, versions)
+
+            for date in dates:
+                if date in cached:
+                    cached.move_to_end(date)
+                else:
+                    cached[date] = shift_index.on_date(date)
+                expanded.append((date, cached[date]))
+
+            while len(cached) > DATES_CACHED:
+                cached.popitem(last=False)
+
+            return (sum(versions.values()), expanded)
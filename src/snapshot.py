@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+""" A compact copy of what scheduling a restaurant needs
+
+RestaurantSnapshot reads a restaurant's employees, role preferences, availabilities,
+hours limits and shift demand with a few column queries (no ORM instances) into
+array.array columns, which take a fraction of the memory of ORM objects and are quick
+to scan. Employees and roles are numbered from 0 within the snapshot, so the role
+preferences are employee x role matrices, the demand of each shift is a run of the
+demand columns and each employee's availabilities on a day of the week are a run of
+the availability columns.
+
+A snapshot pickles as its arrays, so it can be handed to worker processes.
+"""
+
+import array
+import collections
+import datetime
+import math
+
+import intervals
+
+NO_PREFERENCE = math.nan  # the priority of an employee for a role they do not do
+UNBOUNDED_FIRST = datetime.date.min.toordinal()
+UNBOUNDED_LAST = datetime.date.max.toordinal()
+DAYS_PER_WEEK = 7
+
+# what solver and intervals.ShiftIndex need of a Shift and a ShiftRole
+ShiftRow = collections.namedtuple(
+    "ShiftRow",
+    [
+        "id",
+        "day_of_week",
+        "start_time",
+        "end_time",
+        "priority",
+        "start_date",
+        "end_date",
+    ],
+)
+Demand = collections.namedtuple("Demand", ["role_id", "number"])
+
+
+def ordinal(value, unbounded):
+    """the day ordinal of a date (or datetime), unbounded for None"""
+    return unbounded if value is None else value.toordinal()
+
+
+def from_ordinal(value, unbounded):
+    """the datetime of a day ordinal, None for unbounded"""
+    if value == unbounded:
+        return None
+    date = datetime.date.fromordinal(value)
+    return datetime.datetime(date.year, date.month, date.day)
+
+
+def offsets(keys, size):
+    """where each key's run starts in a list of keys sorted by key (0 <= key < size),
+    with one more entry for the end of the last run"""
+    starts = array.array("l", [0] * (size + 1))
+    for key in keys:
+        starts[key + 1] += 1
+    for index in range(1, size + 1):
+        starts[index] += starts[index - 1]
+    return starts
+
+
+# R0902: Too many instance attributes (23/7) (too-many-instance-attributes)
+class RestaurantSnapshot:  # pylint: disable=R0902
+    """A restaurant's scheduling inputs in arrays, employee e and role r are numbered
+    user_ids, role_ids - the user id of each employee, the role id of each role
+    names - list of the name of each employee
+    limits - the weekly hours limit of each employee in minutes (0.0 for none)
+    priority, gm_priority - employee x role matrices (index e * len(role_ids) + r) of
+        the employee's and the GM's priority, NO_PREFERENCE if e does not do r
+    availability_offsets - the availabilities of employee e on day d are the indexes
+        from availability_offsets[e * 7 + d] up to availability_offsets[e * 7 + d + 1]
+    availability_start, availability_end - minutes since midnight (past a day if the
+        availability runs past midnight)
+    availability_priority - the priority of each availability
+    availability_first, availability_last - the day ordinals of the date range
+    shift_ids, shift_day, shift_start, shift_end, shift_priority, shift_first,
+        shift_last - the Shift templates' columns (dates as day ordinals)
+    demand_offsets - the demand of shift s is demand_offsets[s] up to
+        demand_offsets[s + 1] of demand_role (role number) and demand_number
+    """
+
+    def __init__(self, rows):
+        """rows - model.ScheduleRows of the restaurant"""
+        employees = sorted({p.user_id: p.name for p in rows.preferences}.items())
+        self.user_ids = array.array("q", [u for u, _ in employees])
+        self.names = [n for _, n in employees]
+        self.role_ids = array.array(
+            "q",
+            sorted(
+                {p.role_id for p in rows.preferences} | {d.role_id for d in rows.demand}
+            ),
+        )
+        self.__load_shifts(rows.shifts)
+        self.__index()
+        self.limits = array.array(
+            "d", [max(rows.hours_limits.get(u) or 0, 0) * 60.0 for u in self.user_ids]
+        )
+        self.__load_preferences(rows.preferences)
+        self.__load_availabilities(rows.availabilities)
+        self.__load_demand(rows.demand)
+
+    def __index(self):
+        """the user_id, role_id and shift id to number lookups"""
+        self.__employees = {u: e for e, u in enumerate(self.user_ids)}
+        self.__roles = {r: i for i, r in enumerate(self.role_ids)}
+        self.__shifts = {s: i for i, s in enumerate(self.shift_ids)}
+
+    def __load_shifts(self, shifts):
+        shifts = sorted(shifts, key=lambda s: s.id)
+        self.shift_ids = array.array("q", [s.id for s in shifts])
+        self.shift_day = array.array("b", [s.day_of_week for s in shifts])
+        self.shift_start = array.array("l", [s.start_time for s in shifts])
+        self.shift_end = array.array("l", [s.end_time for s in shifts])
+        self.shift_priority = array.array("d", [s.priority for s in shifts])
+        self.shift_first = array.array(
+            "l", [ordinal(s.start_date, UNBOUNDED_FIRST) for s in shifts]
+        )
+        self.shift_last = array.array(
+            "l", [ordinal(s.end_date, UNBOUNDED_LAST) for s in shifts]
+        )
+
+    def __load_preferences(self, preferences):
+        roles = len(self.role_ids)
+        self.priority = array.array("d", [NO_PREFERENCE] * (len(self.user_ids) * roles))
+        self.gm_priority = array.array("d", self.priority)
+        for preference in preferences:
+            employee = self.__employees[preference.user_id]
+            cell = employee * roles + self.__roles[preference.role_id]
+            self.priority[cell] = preference.priority
+            self.gm_priority[cell] = preference.gm_priority
+
+    def __load_availabilities(self, availabilities):
+        keyed = sorted(
+            (
+                (self.__employees[a.user_id] * DAYS_PER_WEEK + a.day_of_week, a)
+                for a in availabilities
+                if a.user_id in self.__employees
+            ),
+            key=lambda k: k[0],
+        )
+        self.availability_offsets = offsets(
+            [k for k, _ in keyed], len(self.user_ids) * DAYS_PER_WEEK
+        )
+        times = [intervals.time_range(a.start_time, a.end_time) for _, a in keyed]
+        self.availability_start = array.array("l", [s for s, _ in times])
+        self.availability_end = array.array("l", [e for _, e in times])
+        self.availability_priority = array.array("d", [a.priority for _, a in keyed])
+        self.availability_first = array.array(
+            "l", [ordinal(a.start_date, UNBOUNDED_FIRST) for _, a in keyed]
+        )
+        self.availability_last = array.array(
+            "l", [ordinal(a.end_date, UNBOUNDED_LAST) for _, a in keyed]
+        )
+
+    def __load_demand(self, demand):
+        needed = sorted(
+            (self.__shifts[d.shift_id], self.__roles[d.role_id], d.number)
+            for d in demand
+            if d.shift_id in self.__shifts
+        )
+        self.demand_offsets = offsets([s for s, _, _ in needed], len(self.shift_ids))
+        self.demand_role = array.array("l", [r for _, r, _ in needed])
+        self.demand_number = array.array("l", [n for _, _, n in needed])
+
+    @staticmethod
+    def load(database, restaurant_id):
+        """the snapshot of a restaurant in a model.Database"""
+        return RestaurantSnapshot(database.get_schedule_rows(restaurant_id))
+
+    def __getstate__(self):
+        """pickle the arrays, the lookups are rebuilt from them"""
+        return {
+            k: v
+            for k, v in self.__dict__.items()
+            if not k.startswith("_RestaurantSnapshot__")
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__index()
+
+    def employee(self, user_id):
+        """the number of an employee, None if they do not work here"""
+        return self.__employees.get(user_id)
+
+    def limit(self, user_id):
+        """an employee's weekly hours limit in minutes, None for no limit"""
+        employee = self.__employees.get(user_id)
+        limit = 0.0 if employee is None else self.limits[employee]
+        return limit if limit > 0 else None
+
+    def candidates(self, role_id):
+        """the employees that do a role
+        returns [(gm_priority, priority, user_id, employee number), ...]
+        """
+        role = self.__roles.get(role_id)
+        if role is None:
+            return []
+        roles = len(self.role_ids)
+        return [
+            (self.gm_priority[cell], self.priority[cell], self.user_ids[e], e)
+            for e, cell in enumerate(range(role, len(self.priority), roles))
+            if not math.isnan(self.priority[cell])
+        ]
+
+    def roles_of(self, user_id):
+        """the role ids an employee does"""
+        employee = self.__employees.get(user_id)
+        if employee is None:
+            return set()
+        roles = len(self.role_ids)
+        return {
+            self.role_ids[r]
+            for r in range(0, roles)
+            if not math.isnan(self.priority[employee * roles + r])
+        }
+
+    def availabilities(self, employee, day_of_week):
+        """the range of availability indexes of an employee number on a day"""
+        key = employee * DAYS_PER_WEEK + day_of_week
+        return range(self.availability_offsets[key], self.availability_offsets[key + 1])
+
+    def shift_rows(self):
+        """the ShiftRow of every shift"""
+        return [
+            ShiftRow(
+                self.shift_ids[s],
+                self.shift_day[s],
+                self.shift_start[s],
+                self.shift_end[s],
+                self.shift_priority[s],
+                from_ordinal(self.shift_first[s], UNBOUNDED_FIRST),
+                from_ordinal(self.shift_last[s], UNBOUNDED_LAST),
+            )
+            for s in range(0, len(self.shift_ids))
+        ]
+
+    def shift_times(self, shift_id):
+        """the (start_time, end_time) of a shift"""
+        shift = self.__shifts[shift_id]
+        return (self.shift_start[shift], self.shift_end[shift])
+
+    def demand(self, shift_id):
+        """the [Demand, ...] of a shift in role id order"""
+        shift = self.__shifts.get(shift_id)
+        if shift is None:
+            return []
+        return sorted(
+            Demand(self.role_ids[self.demand_role[d]], self.demand_number[d])
+            for d in range(self.demand_offsets[shift], self.demand_offsets[shift + 1])
+        )
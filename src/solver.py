@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+
+""" Automatic schedule generation
+
+Fills draft ScheduledShift entries for a restaurant from the shift demand (Shift/ShiftRole),
+the employee availability (UserAvailability), the role preferences (UserRolePreference)
+and the weekly hours limits (UserLimits / User).
+
+The shifts worked on each date are the ones the restaurant page shows, a newer shift
+replaces the older shifts it overlaps (see intervals.ShiftIndex). They are filled
+greedily in shift priority order. For each shift on a date, every
+candidate is ranked once by (availability priority, gm priority, employee priority) and
+the best candidates that are not already working and still have hours left are assigned.
+All lookups are indexed by role, day of the week and employee so the cost is roughly
+proportional to the number of (shift, role) slots times the number of employees that
+can do that role. The inputs are read into a snapshot.RestaurantSnapshot, compact
+arrays that are quick to scan, rather than ORM objects.
+
+When one input changes (an employee's availability on a day of the week between two
+dates, or the number of a role a shift needs) resolve() repairs the existing draft
+instead of starting over. Only the dates the changed entry is in force are repaired.
+The drafts outside the slots the change can affect are kept as they are, the drafts in
+the affected slots are kept while the employee can still work them, and only the
+positions left open are filled. The work is proportional to the affected slots and the
+result is the drafts to remove and the assignments to add.
+"""
+
+import collections
+import datetime
+import itertools
+
+import intervals
+import snapshot
+
+CANNOT_WORK = 4
+
+Assignment = collections.namedtuple(
+    "Assignment", ["date", "shift_id", "role_id", "user_id"]
+)
+Unfilled = collections.namedtuple("Unfilled", ["date", "shift_id", "role_id", "count"])
+ScheduleResult = collections.namedtuple("ScheduleResult", ["assignments", "unfilled"])
+# snapshot - the snapshot.RestaurantSnapshot of the restaurant
+# existing - the scheduled shifts that are kept, rows with date, shift_id, role_id and
+#     user_id (see model.Database.get_scheduled_rows)
+# minutes - {(user_id, Monday): minutes scheduled, published and draft} of the weeks
+#     (see model.Database.get_scheduled_minutes)
+ScheduleInputs = collections.namedtuple(
+    "ScheduleInputs", ["snapshot", "existing", "minutes"]
+)
+# start_date, end_date - the dates the changed entry is in force (None is unbounded),
+#     only those dates are repaired
+AvailabilityChanged = collections.namedtuple(
+    "AvailabilityChanged",
+    ["user_id", "day_of_week", "start_date", "end_date"],
+    defaults=(None, None),
+)
+DemandChanged = collections.namedtuple(
+    "DemandChanged",
+    ["shift_id", "role_id", "start_date", "end_date"],
+    defaults=(None, None),
+)
+Removed = collections.namedtuple(
+    "Removed", ["id", "date", "shift_id", "role_id", "user_id"]
+)
+Repair = collections.namedtuple("Repair", ["added", "removed", "unfilled"])
+REPAIR_DAYS = 28
+
+
+def as_date(value):
+    """Convert a datetime (or date) to a date"""
+    return value.date() if isinstance(value, datetime.datetime) else value
+
+
+def as_datetime(value):
+    """Convert a date (or datetime) to a datetime at midnight"""
+    return datetime.datetime(value.year, value.month, value.day)
+
+
+def week_start(date):
+    """The Monday of the week the date is in"""
+    return as_date(date) - datetime.timedelta(days=date.weekday())
+
+
+def in_date_range(entry, date):
+    """is the date within the entry's start_date / end_date (either may be None)"""
+    return (entry.start_date is None or as_date(entry.start_date) <= date) and (
+        entry.end_date is None or date <= as_date(entry.end_date)
+    )
+
+
+def availability_on(restaurant, employee, date, start, end):
+    """The best availability priority an employee has for a time on a date
+    restaurant - the RestaurantSnapshot
+    employee - the employee's number in the snapshot
+    returns None if the employee is not available
+    """
+    best = None
+    day = date.toordinal()
+    for index in restaurant.availabilities(employee, date.weekday()):
+        if not (
+            restaurant.availability_first[index]
+            <= day
+            <= restaurant.availability_last[index]
+        ):
+            continue
+        avail_start = restaurant.availability_start[index]
+        avail_end = restaurant.availability_end[index]
+        if avail_start >= end or avail_end <= start:
+            continue
+        priority = restaurant.availability_priority[index]
+        if priority >= CANNOT_WORK:
+            return None
+        if avail_start <= start and avail_end >= end:
+            best = priority if best is None else min(best, priority)
+    return best
+
+
+def absolute_minutes(date, start_time, end_time):
+    """(start, end) in minutes since day 1 for a time on a date"""
+    start, end = intervals.time_range(start_time, end_time)
+    offset = as_date(date).toordinal() * intervals.MINUTES_PER_DAY
+    return (offset + start, offset + end)
+
+
+def minutes_besides(inputs, replaced):
+    """{(user_id, Monday): minutes} scheduled each week apart from some scheduled shifts
+    inputs - ScheduleInputs for the restaurant
+    replaced - the scheduled shifts (with date, shift_id and user_id) to leave out
+    """
+    minutes = collections.defaultdict(float, inputs.minutes)
+    for scheduled in replaced:
+        start, end = intervals.time_range(
+            *inputs.snapshot.shift_times(scheduled.shift_id)
+        )
+        minutes[(scheduled.user_id, week_start(as_date(scheduled.date)))] -= end - start
+    return minutes
+
+
+# R0903: Too few public methods (1/2) (too-few-public-methods)
+class Solver:  # pylint: disable=R0903
+    """Greedy schedule builder for a single restaurant"""
+
+    def __init__(self, restaurant, existing, minutes):
+        """restaurant - the RestaurantSnapshot
+        existing - the scheduled shifts that are kept in the range, with date,
+            shift_id, role_id and user_id
+        minutes - {(user_id, Monday): minutes} already scheduled each week, not counting
+            the shifts the solver books
+        """
+        self.__restaurant = restaurant
+        self.__candidates = {}  # role_id: RestaurantSnapshot.candidates(role_id)
+        self.__minutes = collections.defaultdict(float, minutes)
+        self.__busy = collections.defaultdict(list)
+        self.__filled = collections.Counter()
+
+        for scheduled in existing:
+            self.__busy[scheduled.user_id].append(
+                absolute_minutes(
+                    as_date(scheduled.date), *restaurant.shift_times(scheduled.shift_id)
+                )
+            )
+            self.__filled[
+                (as_date(scheduled.date), scheduled.shift_id, scheduled.role_id)
+            ] += 1
+
+    def __book(self, date, times, user_id):
+        """times - the (start_time, end_time) of the shift"""
+        start, end = absolute_minutes(date, *times)
+        self.__busy[user_id].append((start, end))
+        self.__minutes[(user_id, week_start(date))] += end - start
+
+    def __can_work(self, user_id, date, start, end):
+        offset = date.toordinal() * intervals.MINUTES_PER_DAY
+        if any(
+            s < offset + end and e > offset + start for s, e in self.__busy[user_id]
+        ):
+            return False
+        limit = self.__restaurant.limit(user_id)
+        return (
+            limit is None
+            or self.__minutes[(user_id, week_start(date))] + end - start <= limit
+        )
+
+    def __ranked(self, role_id, date, start, end):
+        if role_id not in self.__candidates:
+            self.__candidates[role_id] = self.__restaurant.candidates(role_id)
+        ranked = []
+        for gm_priority, priority, user_id, employee in self.__candidates[role_id]:
+            available = availability_on(self.__restaurant, employee, date, start, end)
+            if available is not None:
+                ranked.append((available, gm_priority, priority, user_id))
+        ranked.sort()
+        return ranked
+
+    def keep(self, date, shift, shift_role, user_ids):
+        """book the employees already assigned to a role of a shift on a date that can
+        still work it, best ranked first and no more than are needed
+        returns the user_ids kept
+        """
+        start, end = intervals.time_range(shift.start_time, shift.end_time)
+        slot = (date, shift.id, shift_role.role_id)
+        assigned = set(user_ids)
+        kept = []
+
+        for *_, user_id in self.__ranked(shift_role.role_id, date, start, end):
+            if self.__filled[slot] >= shift_role.number:
+                break
+            if user_id in assigned and self.__can_work(user_id, date, start, end):
+                self.__book(date, (shift.start_time, shift.end_time), user_id)
+                self.__filled[slot] += 1
+                kept.append(user_id)
+
+        return kept
+
+    def fill(self, date, shift, shift_role):
+        """assign employees to a role of a shift on a date
+        returns (list of Assignment, number of positions left unfilled)
+        """
+        start, end = intervals.time_range(shift.start_time, shift.end_time)
+        needed = shift_role.number - self.__filled[(date, shift.id, shift_role.role_id)]
+        assigned = []
+
+        for *_, user_id in self.__ranked(shift_role.role_id, date, start, end):
+            if len(assigned) >= needed:
+                break
+            if self.__can_work(user_id, date, start, end):
+                self.__book(date, (shift.start_time, shift.end_time), user_id)
+                assigned.append(
+                    Assignment(as_datetime(date), shift.id, shift_role.role_id, user_id)
+                )
+
+        return (assigned, max(0, needed - len(assigned)))
+
+
+def shifts_and_roles(restaurant):
+    """Index the shift demand
+    restaurant - the RestaurantSnapshot
+    returns (intervals.ShiftIndex of ShiftRow, {shift_id: [Demand, ...]})
+    """
+    shifts = restaurant.shift_rows()
+    roles_by_shift = {s.id: restaurant.demand(s.id) for s in shifts}
+    return (
+        intervals.ShiftIndex(shifts),
+        {s: d for s, d in roles_by_shift.items() if d},
+    )
+
+
+def work_order(shift_index, roles_by_shift, dates):
+    """the (shift, date) pairs worked on the dates in the order they are filled"""
+    work = [
+        (s, d) for d in dates for s in shift_index.on_date(d) if s.id in roles_by_shift
+    ]
+    work.sort(key=lambda w: (w[0].priority, w[1], w[0].start_time, w[0].id))
+    return work
+
+
+def solve(inputs, dates, replaced=()):
+    """Build a schedule for the given dates
+    inputs - ScheduleInputs for the restaurant
+    dates - the dates to schedule
+    replaced - the draft scheduled shifts the schedule replaces
+    returns ScheduleResult
+    """
+    solver = Solver(inputs.snapshot, inputs.existing, minutes_besides(inputs, replaced))
+    shift_index, roles_by_shift = shifts_and_roles(inputs.snapshot)
+    result = ScheduleResult([], [])
+
+    for shift, date in work_order(shift_index, roles_by_shift, dates):
+        for shift_role in roles_by_shift[shift.id]:
+            assigned, missing = solver.fill(date, shift, shift_role)
+            result.assignments.extend(assigned)
+            if missing:
+                result.unfilled.append(
+                    Unfilled(as_datetime(date), shift.id, shift_role.role_id, missing)
+                )
+
+    return result
+
+
+def slot_of(scheduled):
+    """the (date, shift_id, role_id) a ScheduledShift fills"""
+    return (as_date(scheduled.date), scheduled.shift_id, scheduled.role_id)
+
+
+def affected_slots(inputs, dates, drafts, changes):
+    """the set of (date, shift_id, role_id) slots a list of changes can affect"""
+    shift_index = intervals.ShiftIndex(inputs.snapshot.shift_rows())
+    slots = set()
+
+    for change in changes:
+        changed_dates = [d for d in dates if in_date_range(change, d)]
+        if isinstance(change, DemandChanged):
+            slots.update(
+                (d, change.shift_id, change.role_id)
+                for d in changed_dates
+                if any(s.id == change.shift_id for s in shift_index.on_date(d))
+            )
+            continue
+        on_day = {d for d in changed_dates if d.weekday() == change.day_of_week}
+        roles = inputs.snapshot.roles_of(change.user_id)
+        slots.update(
+            (d, s.id, r.role_id)
+            for d in on_day
+            for s in shift_index.on_date(d)
+            for r in inputs.snapshot.demand(s.id)
+            if r.role_id in roles
+        )
+        slots.update(
+            slot_of(s)
+            for s in drafts
+            if s.user_id == change.user_id and as_date(s.date) in on_day
+        )
+
+    return slots
+
+
+def removed(scheduled):
+    """the Removed for a ScheduledShift"""
+    return Removed(
+        scheduled.id,
+        scheduled.date,
+        scheduled.shift_id,
+        scheduled.role_id,
+        scheduled.user_id,
+    )
+
+
+def split_drafts(drafts, slots):
+    """the drafts in the slots as Removed by slot, and the ScheduledShifts of the rest"""
+    in_slots = collections.defaultdict(list)
+    kept = []
+    for scheduled in drafts:
+        if slot_of(scheduled) in slots:
+            in_slots[slot_of(scheduled)].append(removed(scheduled))
+        else:
+            kept.append(scheduled)
+    return (in_slots, kept)
+
+
+def refill(solver, work, assigned, repair):
+    """keep the assigned employees that can still work a slot and fill the rest
+    work - the (date, shift, shift role) of the slot
+    assigned - the Removed drafts of the slot
+    repair - the Repair to add the changes to
+    """
+    date, shift, shift_role = work
+    still = solver.keep(date, shift, shift_role, [s.user_id for s in assigned])
+    repair.removed.extend(s for s in assigned if s.user_id not in still)
+    added, missing = solver.fill(date, shift, shift_role)
+    repair.added.extend(added)
+    if missing:
+        repair.unfilled.append(
+            Unfilled(as_datetime(date), shift.id, shift_role.role_id, missing)
+        )
+
+
+def resolve(inputs, dates, drafts, changes):
+    """Repair a draft schedule after some of its inputs changed
+    inputs - ScheduleInputs for the restaurant (existing are the published shifts)
+    dates - the dates the drafts are for
+    drafts - the draft ScheduledShifts of the weeks the dates are in
+    changes - list of AvailabilityChanged / DemandChanged
+    returns Repair, added is a list of Assignment and removed of Removed
+    """
+    slots = affected_slots(inputs, dates, drafts, changes)
+    in_slots, kept = split_drafts(drafts, slots)
+    solver = Solver(
+        inputs.snapshot,
+        list(inputs.existing) + kept,
+        minutes_besides(inputs, itertools.chain.from_iterable(in_slots.values())),
+    )
+    shift_index, roles_by_shift = shifts_and_roles(inputs.snapshot)
+    repair = Repair([], [], [])
+
+    dates = sorted({s[0] for s in slots})  # only the dates with affected slots
+    for shift, date in work_order(shift_index, roles_by_shift, dates):
+        for shift_role in roles_by_shift[shift.id]:
+            slot = (date, shift.id, shift_role.role_id)
+            if slot in slots:
+                refill(
+                    solver, (date, shift, shift_role), in_slots.pop(slot, []), repair
+                )
+
+    # drafts for slots that are no longer worked
+    repair.removed.extend(itertools.chain.from_iterable(in_slots.values()))
+
+    return repair
+
+
+def load_inputs(database, restaurant_id, range_start, range_end):
+    """the ScheduleInputs (with the published shifts as existing) and the draft
+    scheduled shifts of a restaurant from range_start up to (not including) range_end"""
+    scheduled = database.get_scheduled_rows(restaurant_id, range_start, range_end)
+    minutes = database.get_scheduled_minutes(restaurant_id, range_start, range_end)
+    inputs = ScheduleInputs(
+        snapshot.RestaurantSnapshot.load(database, restaurant_id),
+        [s for s in scheduled if not s.draft],
+        {(u, as_date(w)): sum(m) for (u, w), m in minutes.items()},
+    )
+    return (inputs, [s for s in scheduled if s.draft])
+
+
+def repair_schedule(database, restaurant_id, changes, start_date, days=REPAIR_DAYS):
+    """Update the draft schedule of a restaurant from start_date for days after some of
+    its inputs changed. Dates without drafts have not been generated and are left alone.
+    changes - list of AvailabilityChanged / DemandChanged, only the dates they are in
+        force are loaded when they all have start and end dates
+    returns Repair
+    """
+    first = as_date(start_date)
+    end = first + datetime.timedelta(days=days)
+    if changes and all(c.start_date is not None for c in changes):
+        first = max(first, min(as_date(c.start_date) for c in changes))
+    if changes and all(c.end_date is not None for c in changes):
+        last = max(as_date(c.end_date) for c in changes)
+        end = min(end, last + datetime.timedelta(days=1))
+    if first >= end:
+        return Repair([], [], [])
+    # the whole first week is loaded so the drafts before start_date keep their
+    # employees busy (the hours scheduled come from the weekly totals), and the day
+    # after so do the drafts a shift past midnight would run into
+    inputs, drafts = load_inputs(
+        database,
+        restaurant_id,
+        as_datetime(week_start(first)),
+        as_datetime(end + datetime.timedelta(days=1)),
+    )
+    drafted = {as_date(s.date) for s in drafts if first <= as_date(s.date) < end}
+    repair = resolve(inputs, sorted(drafted), drafts, changes)
+    if repair.added or repair.removed:
+        database.update_draft_shifts(
+            restaurant_id,
+            [s.id for s in repair.removed],
+            [a._asdict() for a in repair.added],
+        )
+    return repair
+
+
+def generate_schedule(database, restaurant_id, start_date, days=7):
+    """Replace the draft schedule for a restaurant starting at start_date for days
+    returns ScheduleResult
+    """
+    first = as_date(start_date)
+    dates = [first + datetime.timedelta(days=d) for d in range(0, days)]
+    range_start = as_datetime(first)
+    range_end = as_datetime(first + datetime.timedelta(days=days))
+    inputs, drafts = load_inputs(database, restaurant_id, range_start, range_end)
+    result = solve(inputs, dates, drafts)
+    database.replace_draft_shifts(
+        restaurant_id,
+        range_start,
+        range_end,
+        [a._asdict() for a in result.assignments],
+    )
+    return result
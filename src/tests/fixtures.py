@@ -0,0 +1,86 @@
+#!/user/bin/env python3
+
+""" Databases and entries shared by the tests
+"""
+
+import datetime
+import os
+
+import model
+
+STORAGE_PATH = os.path.join("bin", "tests", "scheduling_%s.sqlite3")
+STORAGE_URL = f"sqlite:///{STORAGE_PATH}"
+UI_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ui")
+MONDAY = datetime.datetime(2022, 1, 3)
+START_DATE = datetime.datetime(2022, 1, 1)
+END_DATE = datetime.datetime(2023, 1, 1)
+
+if not os.path.isdir(os.path.split(STORAGE_PATH)[0]):
+    os.makedirs(os.path.split(STORAGE_PATH)[0])
+
+
+def remove_db(test_function_name):
+    """delete a test's database file, with its WAL files"""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.isfile(STORAGE_PATH % (test_function_name) + suffix):
+            os.unlink(STORAGE_PATH % (test_function_name) + suffix)
+
+
+def open_db(test_function_name, **kwargs):
+    """a new empty model.Database for a test, kwargs are passed to model.Database"""
+    remove_db(test_function_name)
+    return model.Database(STORAGE_URL % (test_function_name), **kwargs)
+
+
+def create_restaurant(database, employee_count, hours_limit=40.0):
+    """a restaurant with a server and a cook role and employees that do both
+    returns (restaurant, server, cook, users)
+    """
+    restaurant = database.create_restaurant("Baris Pasta & Pizza")
+    server = database.create_role(restaurant.id, "Server")
+    cook = database.create_role(restaurant.id, "Cook")
+    users = []
+    for index in range(0, employee_count):
+        user = database.create_user(
+            f"user{index}@c.com",
+            "password",
+            f"Employee {index}",
+            hours_limit=hours_limit,
+            admin=False,
+        )
+        database.add_user_to_restaurant(user, restaurant)
+        users.append(user)
+    return (restaurant, server, cook, users)
+
+
+def add_availability(database, user, restaurant, day_of_week, priority=1, **kwargs):
+    """kwargs - start_time, end_time (default 9:00 to 17:00), start_date, end_date"""
+    return database.create_availability(
+        user=user,
+        restaurant=restaurant,
+        day_of_week=day_of_week,
+        start_time=kwargs.get("start_time", 9 * 60),
+        end_time=kwargs.get("end_time", 17 * 60),
+        start_date=kwargs.get("start_date", START_DATE),
+        end_date=kwargs.get("end_date", END_DATE),
+        priority=priority,
+        note=None,
+    )
+
+
+def add_shift(database, restaurant, day_of_week, roles=(), **kwargs):
+    """roles - [(Role, number needed), ...]
+    kwargs - start_time, end_time (default 9:00 to 17:00), start_date, end_date, priority
+    """
+    shift = database.create_shift(
+        restaurant=restaurant,
+        day_of_week=day_of_week,
+        start_time=kwargs.get("start_time", 9 * 60),
+        end_time=kwargs.get("end_time", 17 * 60),
+        start_date=kwargs.get("start_date", START_DATE),
+        end_date=kwargs.get("end_date", END_DATE),
+        priority=kwargs.get("priority", 1),
+    )
+    for role, number in roles:
+        database.add_role_to_shift(shift, role, number)
+    return shift
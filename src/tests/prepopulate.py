@@ -19,6 +19,13 @@ ROLES = [
 def load(storage_url):
     database = model.Database(storage_url)
 
+    with database.transaction():
+        load_data(database)
+
+    database.close()
+
+
+def load_data(database):
     for user in USERS:
         database.create_user(**user)
 
@@ -37,8 +44,3 @@ def load(storage_url):
                 user = database.find_user(user_info['email'])
                 if restaurant_entry.gm_id != user.id:
                     database.add_user_to_restaurant(user, restaurant_entry)
-
-
-    database.close()
-
-
@@ -0,0 +1,166 @@
+#!/user/bin/env python3
+
+""" Testing the availability index
+"""
+
+import datetime
+import random
+import sys
+import time
+import unittest
+
+import availability
+import model
+from tests.fixtures import MONDAY, STORAGE_URL
+from tests.fixtures import add_availability, create_restaurant, open_db
+
+
+def brute_force(availabilities, date, start, end, level):
+    """user ids that can work every 15 minute slot of start to end on date"""
+    found = set()
+    for user_id in {a.user_id for a in availabilities}:
+        rows = [
+            a
+            for a in availabilities
+            if a.user_id == user_id
+            and a.day_of_week == date.weekday()
+            and a.start_date <= date <= a.end_date
+        ]
+        slots = range(start // 15, -(-end // 15))
+        if all(
+            not any(
+                r.priority == 4 and r.start_time < s * 15 + 15 and r.end_time > s * 15
+                for r in rows
+            )
+            and any(
+                r.priority <= level
+                and r.start_time <= s * 15
+                and r.end_time >= s * 15 + 15
+                for r in rows
+            )
+            for s in slots
+        ):
+            found.add(user_id)
+    return found
+
+
+class TestAvailabilityIndex(unittest.TestCase):
+    def test_matches_brute_force(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, _, _, users = create_restaurant(database, 30)
+        randomizer = random.Random(7)
+        with database.transaction():
+            for user in users:
+                for _ in range(0, 6):
+                    start = randomizer.randrange(0, 20 * 60, 5)
+                    add_availability(
+                        database,
+                        user,
+                        restaurant,
+                        randomizer.randrange(0, 7),
+                        start_time=start,
+                        end_time=randomizer.randrange(start + 30, 24 * 60, 5),
+                        priority=randomizer.randint(1, 4),
+                        start_date=MONDAY
+                        + datetime.timedelta(days=randomizer.randrange(-7, 7)),
+                    )
+        index = availability.AvailabilityIndex(database)
+        rows = database.get_availabilities(restaurant.id)
+        for day in range(0, 14):
+            date = MONDAY + datetime.timedelta(days=day)
+            for start in range(6 * 60, 20 * 60, 150):
+                for level in availability.LEVELS:
+                    self.assertEqual(
+                        index.available(restaurant.id, date, start, start + 240, level),
+                        brute_force(rows, date, start, start + 240, level),
+                        f"{date} {start} level {level}",
+                    )
+
+    def test_levels(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, _, _, users = create_restaurant(database, 4)
+        add_availability(database, users[0], restaurant, 0, priority=1)
+        add_availability(database, users[1], restaurant, 0, priority=2)
+        add_availability(database, users[2], restaurant, 0, priority=3)
+        add_availability(database, users[3], restaurant, 0, priority=4)
+        add_availability(
+            database,
+            users[0],
+            restaurant,
+            0,
+            priority=2,
+            start_time=17 * 60,
+            end_time=18 * 60,
+        )
+        index = availability.AvailabilityIndex(database)
+        self.assertEqual(
+            index.levels(restaurant.id, MONDAY, 10 * 60, 12 * 60),
+            {users[0].id: 1, users[1].id: 2, users[2].id: 3},
+        )
+        self.assertEqual(
+            index.levels(restaurant.id, MONDAY, 16 * 60, 18 * 60), {users[0].id: 2}
+        )
+        self.assertEqual(index.levels(restaurant.id, MONDAY, 8 * 60, 12 * 60), {})
+
+    def test_incremental_update(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, _, _, users = create_restaurant(database, 2)
+        add_availability(database, users[0], restaurant, 1)
+        index = availability.AvailabilityIndex(database)
+        tuesday = MONDAY + datetime.timedelta(days=1)
+        self.assertEqual(
+            index.available(restaurant.id, tuesday, 600, 700), {users[0].id}
+        )
+        added = add_availability(database, users[1], restaurant, 1, priority=2)
+        self.assertEqual(
+            index.available(restaurant.id, tuesday, 600, 700),
+            {users[0].id, users[1].id},
+        )
+        self.assertEqual(
+            index.available(restaurant.id, tuesday, 600, 700, 1), {users[0].id}
+        )
+        added.priority = 4
+        database.flush()
+        self.assertEqual(
+            index.available(restaurant.id, tuesday, 600, 700), {users[0].id}
+        )
+
+    def test_changed_by_another_process(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        restaurant, _, _, users = create_restaurant(database, 2)
+        add_availability(database, users[0], restaurant, 1)
+        index = availability.AvailabilityIndex(model.Database(STORAGE_URL % (name)))
+        tuesday = MONDAY + datetime.timedelta(days=1)
+        self.assertEqual(
+            index.available(restaurant.id, tuesday, 600, 700), {users[0].id}
+        )
+        add_availability(database, users[1], restaurant, 1)
+        time.sleep(model.VERSION_POLL_SECONDS)  # another process' change is polled for
+        self.assertEqual(
+            index.levels(restaurant.id, tuesday, 600, 700),
+            {users[0].id: 1, users[1].id: 1},
+        )
+
+    def test_past_midnight(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, _, _, users = create_restaurant(database, 2)
+        add_availability(
+            database, users[0], restaurant, 6, start_time=18 * 60, end_time=3 * 60
+        )
+        add_availability(
+            database, users[1], restaurant, 6, start_time=18 * 60, end_time=23 * 60
+        )
+        index = availability.AvailabilityIndex(database)
+        sunday = MONDAY + datetime.timedelta(days=6)
+        self.assertEqual(
+            index.available(restaurant.id, sunday, 20 * 60, 2 * 60), {users[0].id}
+        )
+        self.assertEqual(
+            index.available(restaurant.id, sunday, 19 * 60, 22 * 60),
+            {users[0].id, users[1].id},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+#!/user/bin/env python3
+
+""" Testing the benchmark data generator
+"""
+
+import datetime
+import sys
+import unittest
+
+from bench import generate
+from tests.fixtures import open_db
+
+
+class TestGenerate(unittest.TestCase):
+    def test_seeded(self):
+        sizes = generate.Sizes(employees=20, availabilities=3, shifts=7)
+        start = datetime.date(2022, 1, 5)
+        first = list(generate.records([1, 2], sizes, seed=5, start=start))
+        self.assertEqual(
+            first, list(generate.records([1, 2], sizes, seed=5, start=start))
+        )
+        self.assertNotEqual(
+            first, list(generate.records([1, 2], sizes, seed=6, start=start))
+        )
+
+    def test_imports(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant_ids = [database.create_restaurant(f"R{r}").id for r in range(0, 3)]
+        sizes = generate.Sizes(employees=30, availabilities=2, shifts=14)
+        counts = database.bulk_import(generate.records(restaurant_ids, sizes))
+        self.assertEqual(counts["user"], 30)
+        self.assertEqual(counts["availability"], 60)
+        self.assertEqual(counts["shift"], 42)
+
+
+if __name__ == "__main__":
+    unittest.main()
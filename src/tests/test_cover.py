@@ -0,0 +1,215 @@
+#!/user/bin/env python3
+
+""" Testing shift cover ranking
+"""
+
+import datetime
+import sys
+import time
+import unittest
+
+import availability
+import cover
+import model
+import solver
+from tests import fixtures
+from tests.fixtures import END_DATE, MONDAY, START_DATE, STORAGE_URL
+from tests.fixtures import add_availability, open_db
+
+
+def add_shift(database, restaurant, day_of_week, role, **kwargs):
+    """a shift needing one of the role, ending at 13:00 unless given"""
+    kwargs.setdefault("end_time", 13 * 60)
+    return fixtures.add_shift(database, restaurant, day_of_week, [(role, 1)], **kwargs)
+
+
+def schedule(database, restaurant, assignments):
+    database.replace_draft_shifts(
+        restaurant.id,
+        MONDAY,
+        MONDAY + datetime.timedelta(days=7),
+        [
+            solver.Assignment(
+                MONDAY + datetime.timedelta(days=s.day_of_week), s.id, r.id, u.id
+            )._asdict()
+            for s, r, u in assignments
+        ],
+    )
+    return {
+        (s.shift_id, s.user_id): s
+        for s in database.get_scheduled_shifts(
+            restaurant.id, MONDAY, MONDAY + datetime.timedelta(days=7)
+        )
+    }
+
+
+def ranked(index, scheduled):
+    return [c.user_id for c in index.candidates(scheduled)]
+
+
+class TestCover(unittest.TestCase):
+    def test_ranking(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = fixtures.create_restaurant(
+            database, 5, hours_limit=10.0
+        )
+        monday = add_shift(database, restaurant, 0, server)
+        overlapping = add_shift(database, restaurant, 0, server, start_time=12 * 60)
+        tuesday = add_shift(database, restaurant, 1, server, end_time=17 * 60)
+        for user, priority in zip(users, [1, 3, 1, 2, 4]):
+            add_availability(database, user, restaurant, 0, priority)
+        scheduled = schedule(
+            database,
+            restaurant,
+            [
+                (monday, server, users[0]),
+                (overlapping, server, users[2]),
+                (tuesday, server, users[3]),
+            ],
+        )
+        index = cover.CoverIndex(database, availability.AvailabilityIndex(database))
+        needs_cover = scheduled[(monday.id, users[0].id)]
+        # 2 is already working, 3 has 8 of 10 hours used, 4 cannot work
+        self.assertEqual(ranked(index, needs_cover), [users[1].id, users[3].id])
+        candidates = index.candidates(needs_cover)
+        self.assertFalse(candidates[0].over_limit)
+        self.assertEqual(candidates[0].hours_remaining, 10.0)
+        self.assertTrue(candidates[1].over_limit)
+
+    def test_invalidation(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = fixtures.create_restaurant(
+            database, 3, hours_limit=10.0
+        )
+        monday = add_shift(database, restaurant, 0, server)
+        for user in users:
+            add_availability(database, user, restaurant, 0, 1)
+        scheduled = schedule(database, restaurant, [(monday, server, users[0])])
+        index = cover.CoverIndex(database, availability.AvailabilityIndex(database))
+        needs_cover = scheduled[(monday.id, users[0].id)]
+        self.assertEqual(ranked(index, needs_cover), [users[1].id, users[2].id])
+
+        for preference in database.get_role_preferences(restaurant.id):
+            if preference.user_id == users[2].id:
+                preference.gm_priority = 0.0
+        database.flush()
+        self.assertEqual(ranked(index, needs_cover), [users[2].id, users[1].id])
+
+        later = add_shift(database, restaurant, 0, server, start_time=10 * 60)
+        scheduled = schedule(
+            database,
+            restaurant,
+            [(monday, server, users[0]), (later, server, users[2])],
+        )
+        needs_cover = scheduled[(monday.id, users[0].id)]
+        self.assertEqual(ranked(index, needs_cover), [users[1].id])
+
+    def test_drafts_of_other_shifts(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = fixtures.create_restaurant(
+            database, 2, hours_limit=10.0
+        )
+        monday = add_shift(database, restaurant, 0, server)
+        tuesday = add_shift(database, restaurant, 1, server)
+        for user in users:
+            add_availability(database, user, restaurant, 0, 1)
+        scheduled = schedule(database, restaurant, [(monday, server, users[0])])
+        index = cover.CoverIndex(database, availability.AvailabilityIndex(database))
+        needs_cover = scheduled[(monday.id, users[0].id)]
+        self.assertEqual(index.candidates(needs_cover)[0].hours_remaining, 10.0)
+
+        # the first drafts of the Tuesday shift, which the cached week has not seen
+        database.update_draft_shifts(
+            restaurant.id,
+            [],
+            [
+                solver.Assignment(
+                    MONDAY + datetime.timedelta(days=1),
+                    tuesday.id,
+                    server.id,
+                    users[1].id,
+                )._asdict()
+            ],
+        )
+        self.assertEqual(index.candidates(needs_cover)[0].hours_remaining, 6.0)
+
+    def test_changed_by_another_process(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        restaurant, server, _, users = fixtures.create_restaurant(
+            database, 3, hours_limit=10.0
+        )
+        monday = add_shift(database, restaurant, 0, server)
+        tuesday = add_shift(database, restaurant, 1, server)
+        for user in users:
+            add_availability(database, user, restaurant, 0, 1)
+        scheduled = schedule(database, restaurant, [(monday, server, users[0])])
+        other = model.Database(STORAGE_URL % (name))
+        index = cover.CoverIndex(other, availability.AvailabilityIndex(other))
+        needs_cover = scheduled[(monday.id, users[0].id)]
+        self.assertEqual(ranked(index, needs_cover), [users[1].id, users[2].id])
+
+        scheduled = schedule(
+            database,
+            restaurant,
+            [(monday, server, users[0]), (tuesday, server, users[1])],
+        )
+        time.sleep(model.VERSION_POLL_SECONDS)  # another process' change is polled for
+        candidates = index.candidates(needs_cover)
+        self.assertEqual([c.user_id for c in candidates], [users[2].id, users[1].id])
+        self.assertEqual(candidates[1].hours_remaining, 6.0)
+
+        for preference in database.get_role_preferences(restaurant.id):
+            if preference.user_id == users[1].id:
+                preference.gm_priority = 0.0
+        database.flush()
+        time.sleep(model.VERSION_POLL_SECONDS)
+        self.assertEqual(ranked(index, needs_cover), [users[1].id, users[2].id])
+
+    def test_bulk_imported_users(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = fixtures.create_restaurant(
+            database, 2, hours_limit=10.0
+        )
+        monday = add_shift(database, restaurant, 0, server)
+        for user in users:
+            add_availability(database, user, restaurant, 0, 1)
+        scheduled = schedule(database, restaurant, [(monday, server, users[0])])
+        index = cover.CoverIndex(database, availability.AvailabilityIndex(database))
+        needs_cover = scheduled[(monday.id, users[0].id)]
+        self.assertEqual(ranked(index, needs_cover), [users[1].id])
+
+        counts = database.bulk_import(
+            [
+                (
+                    "user",
+                    {
+                        "email": "imported@c.com",
+                        "name": "Imported",
+                        "password": "password",
+                        "restaurant_id": restaurant.id,
+                    },
+                ),
+                (
+                    "availability",
+                    {
+                        "email": "imported@c.com",
+                        "restaurant_id": restaurant.id,
+                        "day_of_week": 0,
+                        "start_time": 8 * 60,
+                        "end_time": 22 * 60,
+                        "start_date": START_DATE,
+                        "end_date": END_DATE,
+                        "priority": 1,
+                        "note": None,
+                    },
+                ),
+            ]
+        )
+        self.assertEqual(counts["user"], 1)
+        imported = database.find_user("imported@c.com")
+        self.assertEqual(ranked(index, needs_cover), [imported.id, users[1].id])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+#!/user/bin/env python3
+
+""" Testing schedule export
+"""
+
+import csv
+import datetime
+import json
+import os
+import sys
+import unittest
+
+import export
+import identity
+import model
+import scheduling
+import solver
+from tests.fixtures import MONDAY, STORAGE_URL, UI_PATH, remove_db
+
+
+def open_app(test_function_name, monday=MONDAY):
+    """An app with a restaurant whose gm and two employees each have a published
+    shift on monday, the late one ends after midnight"""
+    remove_db(test_function_name)
+    app = scheduling.create_app(
+        STORAGE_URL % (test_function_name),
+        UI_PATH,
+        os.path.join(UI_PATH, "template"),
+    )
+    database = model.Database(STORAGE_URL % (test_function_name))
+    gm = database.create_user("gm@c.com", "gm", "GM")
+    restaurant = database.create_restaurant("Baris Pasta, Pizza & Vino")
+    restaurant.gm_id = gm.id
+    server = database.create_role(restaurant.id, "Server")
+    users = []
+    for index, (start_time, end_time) in enumerate([(9 * 60, 17 * 60), (18 * 60, 60)]):
+        user = database.create_user(
+            f"user{index}@c.com", "password", f"Employee {index}"
+        )
+        database.add_user_to_restaurant(user, restaurant)
+        shift = database.create_shift(
+            restaurant=restaurant,
+            day_of_week=0,
+            start_time=start_time,
+            end_time=end_time,
+            start_date=monday,
+            end_date=monday,
+            priority=1,
+        )
+        database.add_role_to_shift(shift, server, 1)
+        database.create_availability(
+            user=user,
+            restaurant=restaurant,
+            day_of_week=0,
+            start_time=start_time,
+            end_time=end_time,
+            start_date=monday,
+            end_date=monday,
+            priority=1,
+            note=None,
+        )
+        users.append(user)
+    solver.generate_schedule(database, restaurant.id, monday, 1)
+    for scheduled in database.get_scheduled_shifts(
+        restaurant.id, monday, monday + datetime.timedelta(days=1)
+    ):
+        scheduled.draft = False
+    database.flush()
+    return (app, restaurant.id, gm.id, [u.id for u in users])
+
+
+def get_as(app, user_id, url):
+    client = app.test_client()
+    client.set_cookie(
+        scheduling.USER_ID_COOKIE, identity.session_token(app.secret_key, user_id)
+    )
+    return client.get(url)
+
+
+class TestExport(unittest.TestCase):
+    def test_csv(self):
+        app, restaurant_id, gm_id, user_ids = open_app(sys._getframe().f_code.co_name)
+        response = get_as(
+            app,
+            gm_id,
+            f"/restaurant/{restaurant_id}/export.csv?start=2022-01-01&end=2022-01-08",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "text/csv")
+        rows = list(csv.DictReader(response.get_data(as_text=True).splitlines()))
+        self.assertEqual([int(r["user_id"]) for r in rows], user_ids)
+        self.assertEqual(rows[1]["start"], "2022-01-03 18:00")
+        self.assertEqual(rows[1]["end"], "2022-01-04 01:00")
+        self.assertEqual(rows[1]["hours"], "7.0")
+
+    def test_employee_only_exports_their_own(self):
+        app, restaurant_id, _, user_ids = open_app(sys._getframe().f_code.co_name)
+        url = (
+            f"/restaurant/{restaurant_id}/export.ndjson?start=2022-01-01&end=2022-01-08"
+        )
+        response = get_as(app, user_ids[1], url)
+        self.assertEqual(response.status_code, 200)
+        rows = [
+            json.loads(line)
+            for line in response.get_data(as_text=True).split("\n")
+            if line
+        ]
+        self.assertEqual([r["user_id"] for r in rows], [user_ids[1]])
+        self.assertEqual(
+            get_as(app, user_ids[1], url + f"&user={user_ids[0]}").status_code, 404
+        )
+        self.assertEqual(
+            get_as(app, user_ids[1], url.replace("ndjson", "xml")).status_code, 404
+        )
+
+    def test_ics(self):
+        app, restaurant_id, _, user_ids = open_app(sys._getframe().f_code.co_name)
+        response = get_as(
+            app,
+            user_ids[0],
+            f"/restaurant/{restaurant_id}/export.ics?start=2022-01-01&end=2022-01-08",
+        )
+        text = response.get_data(as_text=True)
+        self.assertEqual(response.mimetype, "text/calendar")
+        self.assertTrue(text.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertIn("X-WR-CALNAME:Baris Pasta\\, Pizza & Vino\r\n", text)
+        self.assertIn("DTSTART:20220103T090000\r\n", text)
+        self.assertEqual(text.count("BEGIN:VEVENT"), 1)
+
+    def test_feed(self):
+        name = sys._getframe().f_code.co_name
+        monday = solver.as_datetime(solver.week_start(datetime.date.today()))
+        app, restaurant_id, _, user_ids = open_app(name, monday)
+        client = app.test_client()
+        url = f"/feed/{identity.feed_token(app.secret_key, user_ids[1])}.ics"
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            "DTSTART:" + monday.strftime("%Y%m%dT180000"),
+            response.get_data(as_text=True),
+        )
+        etag = response.headers["ETag"]
+        self.assertEqual(
+            client.get(url, headers={"If-None-Match": etag}).status_code, 304
+        )
+        last_modified = response.headers["Last-Modified"]
+        self.assertEqual(
+            client.get(url, headers={"If-Modified-Since": last_modified}).status_code,
+            304,
+        )
+        self.assertEqual(client.get("/feed/forged.ics").status_code, 404)
+
+        database = model.Database(STORAGE_URL % (name))
+        other = database.get_scheduled_shifts(
+            restaurant_id, monday, monday + datetime.timedelta(days=1)
+        )
+        other = [s for s in other if s.user_id == user_ids[0]][0]
+        other.notes = "Bring a corkscrew"
+        database.flush()
+        self.assertEqual(
+            client.get(url, headers={"If-None-Match": etag}).status_code, 304
+        )
+        other.user_id = user_ids[1]
+        database.flush()
+        changed = client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+
+    def test_ics_line_folding(self):
+        line = "DESCRIPTION:" + "é" * 100
+        folded = export.ics_line(line)
+        self.assertTrue(all(len(p.encode("utf-8")) <= 75 for p in folded.split("\r\n")))
+        self.assertEqual(folded.replace("\r\n ", ""), line + "\r\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/user/bin/env python3
+
+""" Testing session tokens and the identity cache
+"""
+
+import sys
+import time
+import unittest
+
+import identity
+import model
+from tests.fixtures import STORAGE_URL, open_db
+
+SECRET_KEY = b"0123456789abcdef0123456789abcdef"
+
+
+class TestSessionToken(unittest.TestCase):
+    def test_round_trip(self):
+        token = identity.session_token(SECRET_KEY, 42)
+        self.assertEqual(identity.session_user_id(SECRET_KEY, token), 42)
+
+    def test_rejected(self):
+        token = identity.session_token(SECRET_KEY, 42)
+        self.assertIsNone(identity.session_user_id(SECRET_KEY, None))
+        self.assertIsNone(identity.session_user_id(SECRET_KEY, "42"))
+        self.assertIsNone(identity.session_user_id(SECRET_KEY, token + "x"))
+        self.assertIsNone(identity.session_user_id(b"another key", token))
+        self.assertIsNone(identity.session_user_id(SECRET_KEY, token, max_age=-1))
+
+
+class TestIdentityCache(unittest.TestCase):
+    def test_invalidated(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        identities = identity.IdentityCache(database)
+        user = database.create_user("gm@c.com", "password", "GM")
+        restaurant = database.create_restaurant("Baris Pasta & Pizza")
+        database.create_role(restaurant.id, "Server")
+        user_id, restaurant_id = user.id, restaurant.id
+
+        found = identities.get(user_id)
+        self.assertEqual(
+            found, identity.Identity(user_id, False, frozenset(), frozenset())
+        )
+        self.assertIs(identities.get(user_id), found)
+        self.assertIsNone(identities.get(user_id + 1))
+
+        database.get_restaurant(restaurant_id).gm_id = user_id
+        database.flush()
+        self.assertTrue(identity.manages(identities.get(user_id), str(restaurant_id)))
+        self.assertFalse(identity.manages(identities.get(user_id), "abc"))
+
+        database.add_user_to_restaurant(
+            database.get_user(user_id), database.get_restaurant(restaurant_id)
+        )
+        database.flush()
+        self.assertEqual(identities.get(user_id).works_at, frozenset([restaurant_id]))
+
+        database.get_user(user_id).admin = True
+        database.flush()
+        self.assertTrue(identities.get(user_id).admin)
+
+    def test_changed_by_another_process(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        identities = identity.IdentityCache(database)
+        user_id = database.create_user("gm@c.com", "password", "GM").id
+        found = identities.get(user_id)
+        database.create_user("other@c.com", "password", "Other")
+        self.assertIs(identities.get(user_id), found)  # its own change is followed
+
+        other = model.Database(STORAGE_URL % (name))
+        other.get_user(user_id).admin = True
+        other.flush()
+        time.sleep(model.VERSION_POLL_SECONDS)  # another process' change is polled for
+        self.assertTrue(identities.get(user_id).admin)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+#!/user/bin/env python3
+
+""" Testing interval lookups
+"""
+
+import collections
+import datetime
+import random
+import unittest
+
+import intervals
+
+MONDAY = datetime.date(2022, 1, 3)
+
+Shift = collections.namedtuple(
+    "Shift",
+    ["id", "day_of_week", "start_date", "end_date", "start_time", "end_time"],
+)
+
+
+def shift(shift_id, start_time, end_time, **kwargs):
+    return Shift(
+        shift_id,
+        kwargs.get("day_of_week", 0),
+        kwargs.get("start_date", datetime.datetime(2022, 1, 1)),
+        kwargs.get("end_date", datetime.datetime(2023, 1, 1)),
+        start_time,
+        end_time,
+    )
+
+
+class TestIntervalTree(unittest.TestCase):
+    def test_matches_brute_force(self):
+        randomizer = random.Random(3)
+        entries = []
+        for value in range(0, 500):
+            start = randomizer.randrange(0, 1000)
+            entries.append((start, start + randomizer.randrange(0, 50), value))
+        tree = intervals.IntervalTree(entries)
+        self.assertEqual(len(tree), 500)
+        for start in range(-10, 1060, 7):
+            end = start + randomizer.randrange(0, 20)
+            self.assertEqual(
+                sorted(tree.overlapping(start, end)),
+                sorted(v for s, e, v in entries if s <= end and e >= start),
+            )
+            self.assertEqual(
+                sorted(tree.at(start)),
+                sorted(v for s, e, v in entries if s <= start <= e),
+            )
+
+    def test_empty(self):
+        self.assertEqual(intervals.IntervalTree([]).at(5), [])
+
+
+class TestShiftIndex(unittest.TestCase):
+    def test_date_ranges(self):
+        old = shift(1, 540, 1020, end_date=datetime.datetime(2022, 1, 9))
+        new = shift(2, 540, 1020, start_date=datetime.datetime(2022, 1, 10))
+        unbounded = shift(3, 1080, 1200, start_date=None, end_date=None)
+        tuesday = shift(4, 540, 1020, day_of_week=1)
+        index = intervals.ShiftIndex([old, new, unbounded, tuesday])
+        self.assertEqual(index.in_force(MONDAY), [unbounded, old])
+        self.assertEqual(
+            index.in_force(MONDAY + datetime.timedelta(days=7)), [unbounded, new]
+        )
+        self.assertEqual(index.in_force(MONDAY + datetime.timedelta(days=2)), [])
+
+    def test_newest_wins(self):
+        morning = shift(1, 540, 780)
+        lunch = shift(2, 720, 900)
+        evening = shift(3, 900, 1200)
+        replacement = shift(4, 600, 660)
+        index = intervals.ShiftIndex([morning, lunch, evening, replacement])
+        self.assertEqual(index.on_date(MONDAY), [replacement, lunch, evening])
+
+    def test_past_midnight(self):
+        late = shift(1, 1320, 120)
+        early = shift(2, 60, 300)
+        overnight = shift(3, 1380, 1410)
+        index = intervals.ShiftIndex([late, early, overnight])
+        self.assertEqual(index.on_date(MONDAY), [early, overnight])
+        self.assertEqual(intervals.time_range(1320, 120), (1320, 1560))
+
+    def test_overnight_into_next_day(self):
+        overnight = shift(
+            1, 1320, 360, day_of_week=6, end_date=datetime.datetime(2022, 1, 10)
+        )
+        dawn = shift(2, 300, 360)
+        morning = shift(3, 360, 600)
+        index = intervals.ShiftIndex([overnight, dawn, morning])
+        self.assertEqual(index.on_date(MONDAY), [morning])
+        self.assertEqual(
+            index.on_date(MONDAY - datetime.timedelta(days=1)), [overnight]
+        )
+        # the Sunday before is no longer worked overnight
+        self.assertEqual(
+            index.on_date(MONDAY + datetime.timedelta(days=14)), [dawn, morning]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/user/bin/env python3
+
+""" Testing request and SQL instrumentation
+"""
+
+import os
+import shutil
+import sys
+import unittest
+
+import identity
+import metrics
+import model
+import scheduling
+from tests.fixtures import STORAGE_URL, UI_PATH, remove_db
+
+PROFILE_PATH = os.path.join("bin", "tests", "profiles_%s")
+
+
+def open_app(test_function_name, instrumentation):
+    remove_db(test_function_name)
+    app = scheduling.create_app(
+        STORAGE_URL % (test_function_name),
+        UI_PATH,
+        os.path.join(UI_PATH, "template"),
+        instrumentation,
+    )
+    database = model.Database(STORAGE_URL % (test_function_name))
+    admin = database.create_user("admin@c.com", "admin", "Admin", admin=True)
+    employee = database.create_user("employee@c.com", "employee", "Employee")
+    database.create_restaurant("Baris Pasta & Pizza")
+    return (app, admin.id, employee.id)
+
+
+def get_as(app, user_id, url):
+    client = app.test_client()
+    client.set_cookie(
+        scheduling.USER_ID_COOKIE, identity.session_token(app.secret_key, user_id)
+    )
+    return client.get(url)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_observe(self):
+        histogram = metrics.Histogram((0.1, 1.0))
+        for value in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [1, 3])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 6.05)
+
+
+class TestMetrics(unittest.TestCase):
+    def test_routes_and_queries(self):
+        instrumentation = metrics.Metrics()
+        app, admin_id, employee_id = open_app(
+            sys._getframe().f_code.co_name, instrumentation
+        )
+        for _ in range(0, 3):
+            self.assertEqual(get_as(app, admin_id, "/restaurant/1").status_code, 200)
+        self.assertEqual(get_as(app, employee_id, "/metrics").status_code, 404)
+        response = get_as(app, admin_id, "/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.get_data(as_text=True)
+        self.assertIn(
+            'scheduling_request_seconds_count{route="/restaurant/<restaurant_id>",'
+            + 'method="GET"} 3',
+            text,
+        )
+        self.assertIn("scheduling_slowest_query_seconds{statement=", text)
+        queries = [
+            line
+            for line in text.splitlines()
+            if line.startswith('scheduling_request_queries_total{route="/restaurant')
+        ]
+        self.assertEqual(len(queries), 1)
+        self.assertGreater(int(queries[0].split()[-1]), 3)
+
+    def test_not_enabled(self):
+        app, admin_id, _ = open_app(sys._getframe().f_code.co_name, None)
+        self.assertEqual(get_as(app, admin_id, "/metrics").status_code, 404)
+
+    def test_profile(self):
+        name = sys._getframe().f_code.co_name
+        shutil.rmtree(PROFILE_PATH % (name), ignore_errors=True)
+        instrumentation = metrics.Metrics(PROFILE_PATH % (name), 0.0)
+        app, admin_id, _ = open_app(name, instrumentation)
+        get_as(app, admin_id, "/restaurant/1")
+        profiles = os.listdir(PROFILE_PATH % (name))
+        self.assertEqual(len(profiles), 1)
+        self.assertIn("restaurant_restaurant_id", profiles[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,13 +7,17 @@
 # TODO: More find_user tests
 # TODO: Test create_role
 
+import datetime
 import model
+import sqlalchemy
+import sqlite3
+import threading
 import unittest
 import sys
+import time
 import os
-
-STORAGE_PATH = os.path.join("bin", "tests", "scheduling_%s.sqlite3")
-STORAGE_URL = f"sqlite:///{STORAGE_PATH}"
+import shutil
+from tests.fixtures import STORAGE_PATH, STORAGE_URL, open_db
 
 USERS = [
     {
@@ -70,14 +74,6 @@ RESTAURANTS = [
     "Pita Shack - Best Halal Food In Pflugerville",
     "Red Rooster's Pub & Grub",
 ]
-if not os.path.isdir(os.path.split(STORAGE_PATH)[0]):
-    os.makedirs(os.path.split(STORAGE_PATH)[0])
-
-
-def open_db(test_function_name):
-    if os.path.isfile(STORAGE_PATH % (test_function_name)):
-        os.unlink(STORAGE_PATH % (test_function_name))
-    return model.Database(STORAGE_URL % (test_function_name))
 
 
 class TestUser(unittest.TestCase):
@@ -155,6 +151,45 @@ class TestUser(unittest.TestCase):
                 f"could not find password {created[index]} created as {USERS[index]} in {user_passwords}",
             )
 
+    def test_search_users(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        for u in USERS:
+            database.create_user(**u)
+        database.create_user("Cara@c.com", "password", "Cara")
+        database.create_user("carl@d.com", "password", "Carl")
+
+        users, cursor = database.search_users("C", limit=2)
+        self.assertEqual([u.email for u in users], ["c@c.com", "Cara@c.com"])
+        users, cursor = database.search_users("C", limit=2, cursor=cursor)
+        self.assertEqual([u.email for u in users], ["carl@d.com"])
+        self.assertIsNone(cursor)
+
+        pages = []
+        cursor = None
+        while True:
+            users, cursor = database.search_users(limit=3, cursor=cursor)
+            pages.append([u.email.lower() for u in users])
+            if cursor is None:
+                break
+        emails = [e for p in pages for e in p]
+        self.assertEqual(emails, sorted(u.email.lower() for u in database.get_users()))
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+
+        for limit in (0, -1):
+            users, cursor = database.search_users(limit=limit)
+            self.assertEqual(len(users), 1)
+            self.assertIsNotNone(cursor)
+        self.assertEqual(len(database.search_users(limit=10**9)[0]), len(emails))
+
+        with sqlite3.connect(STORAGE_PATH % (name)) as connection:
+            plan = connection.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM user WHERE lower(email) >= ?"
+                + " AND lower(email) < ? ORDER BY lower(email) LIMIT 3",
+                ("c", "d"),
+            ).fetchall()
+        self.assertIn("ix_user_email_lower", " ".join(str(r) for r in plan))
+
 
 class TestRestaurant(unittest.TestCase):
     def test_create_restaurant(self):
@@ -184,5 +219,571 @@ class TestRestaurant(unittest.TestCase):
             )
 
 
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        sqlalchemy.event.listen(sqlalchemy.engine.Engine, "before_cursor_execute", self)
+        return self
+
+    def __exit__(self, *args):
+        sqlalchemy.event.remove(sqlalchemy.engine.Engine, "before_cursor_execute", self)
+
+
+def walk_restaurant_page(restaurant):
+    """touch everything restaurant.html touches"""
+    touched = [restaurant.name, restaurant.gm]
+    for role in restaurant.roles:
+        for preference in role.preferences:
+            touched.append(preference.role.name)
+            touched.append(preference.user.name)
+    for shift in restaurant.shifts:
+        for shift_role in shift.roles:
+            touched.append(shift_role.role.name)
+    return touched
+
+
+class TestRestaurantView(unittest.TestCase):
+    def populate(self, database, employee_count):
+        restaurant = database.create_restaurant(RESTAURANTS[0])
+        other = database.create_restaurant(RESTAURANTS[1])
+        roles = [database.create_role(restaurant.id, n) for n in ["Server", "Cook"]]
+        database.create_role(other.id, "Server")
+        for index in range(0, employee_count):
+            user = database.create_user(
+                f"{index}@c.com", "password", f"Employee {index}", hours_limit=40.0
+            )
+            database.add_user_to_restaurant(user, restaurant)
+            database.add_user_to_restaurant(user, other)
+            for place in [restaurant, other]:
+                database.create_availability(
+                    user=user,
+                    restaurant=place,
+                    day_of_week=index % 7,
+                    start_time=540,
+                    end_time=1020,
+                    start_date=datetime.datetime(2022, 1, 1),
+                    end_date=datetime.datetime(2023, 1, 1),
+                    priority=1,
+                    note=None,
+                )
+        for day in range(0, 7):
+            shift = database.create_shift(
+                restaurant=restaurant,
+                day_of_week=day,
+                start_time=540,
+                end_time=1020,
+                start_date=datetime.datetime(2022, 1, 1),
+                end_date=datetime.datetime(2023, 1, 1),
+                priority=1,
+            )
+            for role in roles:
+                database.add_role_to_shift(shift, role, 2)
+        database.flush()
+        return restaurant.id
+
+    def count_page_queries(self, test_name, employee_count):
+        database = open_db(test_name)
+        restaurant_id = self.populate(database, employee_count)
+        with QueryCounter() as counter:
+            restaurant = database.load_restaurant_view(restaurant_id)
+            touched = walk_restaurant_page(restaurant)
+        self.assertGreater(len(touched), employee_count)
+        return counter.count
+
+    def test_query_count_bounded(self):
+        name = sys._getframe().f_code.co_name
+        small = self.count_page_queries(name + "_small", 3)
+        large = self.count_page_queries(name + "_large", 40)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, 10)
+
+    def test_missing_restaurant(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        self.assertIsNone(database.load_restaurant_view(1))
+        self.assertIsNone(database.load_restaurant_view(None))
+
+
+def sqlite_indexes(test_function_name):
+    with sqlite3.connect(STORAGE_PATH % (test_function_name)) as connection:
+        return {
+            r[0]
+            for r in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index'"
+            )
+            if not r[0].startswith("sqlite_autoindex")
+        }
+
+
+class TestIndexes(unittest.TestCase):
+    def test_indexes_created(self):
+        name = sys._getframe().f_code.co_name
+        open_db(name)
+        indexes = sqlite_indexes(name)
+        for expected in [
+            "ix_user_email_lower",
+            "ix_shift_roles_shift_role",
+            "ix_user_role_preference_user_role",
+            "ix_scheduled_shift_date_shift",
+            "ix_user_availability_user_id",
+            "ix_user_availability_restaurant_id",
+            "ix_shift_restaurant_id",
+        ]:
+            self.assertIn(expected, indexes)
+
+    def test_find_user_uses_index(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        database.create_user(**USERS[0])
+        with sqlite3.connect(STORAGE_PATH % (name)) as connection:
+            plan = connection.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM user WHERE lower(email) = lower(?)",
+                ("U@C.com",),
+            ).fetchall()
+        self.assertIn("ix_user_email_lower", " ".join(str(r) for r in plan))
+
+    def test_missing_indexes_added(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        database.create_user(**USERS[0])
+        database.close()
+        with sqlite3.connect(STORAGE_PATH % (name)) as connection:
+            for index in sqlite_indexes(name):
+                connection.execute(f"DROP INDEX {index}")
+        self.assertEqual(sqlite_indexes(name), set())
+        database = model.Database(STORAGE_URL % (name))
+        self.assertIn("ix_user_email_lower", sqlite_indexes(name))
+        self.assertIn("ix_shift_roles_shift_role", sqlite_indexes(name))
+        self.assertIsNotNone(database.find_user(USERS[0]["email"]))
+
+    def test_duplicate_role_preference_rejected(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        user = database.create_user(**USERS[0])
+        restaurant = database.create_restaurant(RESTAURANTS[0])
+        database.create_role(restaurant.id, "Server")
+        database.add_user_to_restaurant(user, restaurant)
+        database.add_user_to_restaurant(user, restaurant)
+        self.assertEqual(len(database.get_role_preferences(restaurant.id)), 1)
+
+
+class TestSessions(unittest.TestCase):
+    def test_sessions_reaped_with_threads(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        user = database.create_user(**USERS[0])
+        # every thread is still running when the others read, so none share an ident
+        all_read = threading.Barrier(20)
+
+        def read():
+            database.get_user(user.id)
+            all_read.wait()
+
+        threads = [threading.Thread(target=read) for _ in range(0, 20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(database.sessions()["sessions"], 21)
+        self.assertEqual(database.reap(), 20)
+        self.assertEqual(database.sessions()["sessions"], 1)
+        self.assertFalse(sqlalchemy.inspect(user).detached)
+
+    def test_live_threads_keep_sessions(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        user = database.create_user(**USERS[0])
+        self.assertEqual(database.reap(), 0)
+        self.assertFalse(sqlalchemy.inspect(user).detached)
+        database = open_db(sys._getframe().f_code.co_name, idle_timeout=0.0)
+        database.get_users()
+        self.assertEqual(database.reap(), 1)
+
+    def test_remove_session(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        user_id = database.create_user(**USERS[0]).id
+        self.assertEqual(database.sessions()["sessions"], 1)
+        database.remove_session()
+        self.assertEqual(database.sessions()["sessions"], 0)
+        self.assertEqual(database.get_user(user_id).email, USERS[0]["email"])
+        self.assertEqual(database.sessions()["sessions"], 1)
+
+    def test_idle_sessions_reaped(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        database.get_users()
+        self.assertEqual(database.reap(idle_timeout=60.0), 0)
+        self.assertEqual(database.reap(idle_timeout=0.0), 1)
+        self.assertEqual(database.sessions()["sessions"], 0)
+        self.assertIn("pool", database.sessions())
+
+    def test_sqlite_pragmas(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        with database.engine().connect() as connection:
+            pragma = lambda p: connection.exec_driver_sql(f"PRAGMA {p}").scalar()
+            self.assertEqual(pragma("journal_mode"), "wal")
+            self.assertEqual(pragma("synchronous"), 1)  # NORMAL
+            self.assertEqual(pragma("busy_timeout"), 5000)
+        database.close()
+        options = model.EngineOptions(journal_mode="delete", busy_timeout=250)
+        database = model.Database(STORAGE_URL % (name), engine_options=options)
+        with database.engine().connect() as connection:
+            pragma = lambda p: connection.exec_driver_sql(f"PRAGMA {p}").scalar()
+            self.assertEqual(pragma("journal_mode"), "delete")
+            self.assertEqual(pragma("busy_timeout"), 250)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs fork")
+    def test_forked_child(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        user_id = database.create_user(**USERS[0]).id
+        self.assertEqual(database.sessions()["sessions"], 1)
+        child = os.fork()
+        if child == 0:
+            works = False
+            try:
+                works = (
+                    database.sessions()["sessions"] == 0
+                    and database.get_user(user_id).email == USERS[0]["email"]
+                    and database.check_password(
+                        database.get_user(user_id), USERS[0]["password"]
+                    )
+                )
+            finally:
+                os._exit(0 if works else 1)
+        _, status = os.waitpid(child, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        self.assertEqual(database.get_user(user_id).email, USERS[0]["email"])
+
+
+class TestBulkImport(unittest.TestCase):
+    def test_import(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant = database.create_restaurant(RESTAURANTS[0])
+        restaurant_id = restaurant.id
+        start_date = datetime.datetime(2022, 1, 1)
+        end_date = datetime.datetime(2023, 1, 1)
+        records = [
+            ("role", {"restaurant_id": restaurant_id, "name": n})
+            for n in ["Server", "Cook", "server"]
+        ]
+        records.extend(("user", dict(u, restaurant_id=restaurant_id)) for u in USERS)
+        records.append(("user", dict(USERS[0], email="U@C.COM")))
+        records.append(
+            (
+                "role_preference",
+                {
+                    "email": USERS[1]["email"],
+                    "restaurant_id": restaurant_id,
+                    "role": "cook",
+                    "priority": 7.0,
+                    "gm_priority": 3.0,
+                },
+            )
+        )
+        records.extend(
+            (
+                "availability",
+                {
+                    "email": USERS[i % len(USERS)]["email"],
+                    "restaurant_id": restaurant_id,
+                    "day_of_week": i % 7,
+                    "start_time": 540,
+                    "end_time": 1020,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "priority": 1 + i % 4,
+                },
+            )
+            for i in range(0, 1000)
+        )
+        records.append(("availability", dict(records[-1][1], email="nobody@c.com")))
+        records.append(
+            (
+                "shift",
+                {
+                    "restaurant_id": restaurant_id,
+                    "day_of_week": 4,
+                    "start_time": 540,
+                    "end_time": 1020,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "priority": 1,
+                    "roles": {"Server": 2, "Cook": 1, "Juggler": 1},
+                },
+            )
+        )
+        counts = database.bulk_import(records, batch_size=300)
+        self.assertEqual(counts["role"], 2)
+        self.assertEqual(counts["user"], len(USERS))
+        self.assertEqual(counts["availability"], 1000)
+        self.assertEqual(counts["shift"], 1)
+        self.assertEqual(counts["skipped"], 3)
+        self.assertEqual(len(database.get_users()), len(USERS))
+        self.assertEqual(len(database.get_availabilities(restaurant_id)), 1000)
+        preferences = database.get_role_preferences(restaurant_id)
+        self.assertEqual(len(preferences), 2 * len(USERS))
+        cook = [
+            p
+            for p in preferences
+            if p.role.name == "Cook" and p.user.email == USERS[1]["email"]
+        ]
+        self.assertEqual((cook[0].priority, cook[0].gm_priority), (7.0, 3.0))
+        shift_roles = database.get_shift_roles(restaurant_id)
+        self.assertEqual(
+            sorted((r.role.name, r.number) for _, r in shift_roles),
+            [("Cook", 1), ("Server", 2)],
+        )
+        self.assertTrue(
+            database.find_user(USERS[2]["email"]).password_matches(USERS[2]["password"])
+        )
+
+    def test_unknown_kind(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        with self.assertRaises(ValueError):
+            database.bulk_import([("restaurant", {"name": RESTAURANTS[0]})])
+
+
+class TestTransaction(unittest.TestCase):
+    def test_commit_once(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        other = model.Database(STORAGE_URL % (name))
+        with database.transaction():
+            restaurant = database.create_restaurant(RESTAURANTS[0])
+            database.create_role(restaurant.id, "Server")
+            database.create_role(restaurant.id, "Cook")
+            with database.transaction():
+                database.create_user(**USERS[0])
+            database.flush()
+            self.assertEqual(other.get_restaurants(), [])
+        self.assertEqual(len(other.get_restaurants()), 1)
+        self.assertIsNotNone(other.find_user(USERS[0]["email"]))
+
+    def test_rollback(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        with self.assertRaises(KeyError):
+            with database.transaction():
+                restaurant = database.create_restaurant(RESTAURANTS[0])
+                database.create_role(restaurant.id, "Server")
+                raise KeyError("oops")
+        self.assertEqual(database.get_restaurants(), [])
+        database.create_restaurant(RESTAURANTS[1])
+        self.assertEqual([r.name for r in database.get_restaurants()], [RESTAURANTS[1]])
+
+    def test_deferred_commit(self):
+        name = sys._getframe().f_code.co_name
+        open_db(name)
+        database = model.Database(STORAGE_URL % (name), deferred_commit=True)
+        other = model.Database(STORAGE_URL % (name))
+        created = [database.create_user(**u) for u in USERS]
+        self.assertTrue(all(u.id is not None for u in created))
+        self.assertEqual(other.get_users(), [])
+        database.flush()
+        self.assertEqual(len(other.get_users()), len(USERS))
+
+    def test_schedule_version(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        restaurant = database.create_restaurant(RESTAURANTS[0])
+        role = database.create_role(restaurant.id, "Server")
+        user = database.create_user(**USERS[0])
+        shift = database.create_shift(
+            restaurant,
+            0,
+            start_time=9 * 60,
+            end_time=17 * 60,
+            priority=1,
+            start_date=None,
+            end_date=None,
+        )
+        date = datetime.datetime(2022, 1, 3)
+        assignment = {
+            "date": date,
+            "shift_id": shift.id,
+            "role_id": role.id,
+            "user_id": user.id,
+        }
+        database.replace_draft_shifts(
+            restaurant.id, date, date + datetime.timedelta(days=1), [assignment]
+        )
+        self.assertEqual(database.get_schedule_version(user.id), ((0, 0), None))
+
+        other = model.Database(STORAGE_URL % (name))
+        scheduled = other.get_scheduled_shifts(
+            restaurant.id, date, date + datetime.timedelta(days=1)
+        )[0]
+        scheduled.draft = False
+        other.flush()
+        versions, modified = database.get_schedule_version(user.id)
+        self.assertEqual(versions, (1, 0))
+        self.assertIsNotNone(modified)
+
+        shift.end_time = 18 * 60
+        database.flush()
+        self.assertEqual(database.get_schedule_version(user.id)[0], (1, 1))
+
+    def test_scheduled_minutes(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        restaurant = database.create_restaurant(RESTAURANTS[0])
+        role = database.create_role(restaurant.id, "Server")
+        joe, john = [database.create_user(**u) for u in USERS[:2]]
+        shift = database.create_shift(
+            restaurant,
+            0,
+            start_time=18 * 60,
+            end_time=60,
+            priority=1,
+            start_date=None,
+            end_date=None,
+        )
+        monday = datetime.datetime(2022, 1, 3)
+        week = (monday, monday + datetime.timedelta(days=7))
+        database.replace_draft_shifts(
+            restaurant.id,
+            *week,
+            [
+                {"date": d, "shift_id": shift.id, "role_id": role.id, "user_id": joe.id}
+                for d in [monday, monday + datetime.timedelta(days=6)]
+            ],
+        )
+        self.assertEqual(
+            database.get_scheduled_minutes(restaurant.id, *week),
+            {(joe.id, monday): (0, 14 * 60)},
+        )
+        self.assertEqual(
+            database.get_hours_remaining(restaurant.id, joe.id, monday), 26
+        )
+
+        with database.transaction():
+            first, last = sorted(
+                database.get_scheduled_shifts(restaurant.id, *week),
+                key=lambda s: s.date,
+            )
+            first.draft = False
+            last.user_id = john.id
+        self.assertEqual(
+            database.get_scheduled_minutes(restaurant.id, *week),
+            {(joe.id, monday): (7 * 60, 0), (john.id, monday): (0, 7 * 60)},
+        )
+        database.update_draft_shifts(restaurant.id, [last.id], [])
+        self.assertEqual(
+            database.get_hours_remaining(restaurant.id, john.id, monday), 10
+        )
+
+        shift.end_time = 2 * 60
+        database.flush()
+        self.assertEqual(
+            database.get_scheduled_minutes(restaurant.id, *week)[(joe.id, monday)],
+            (8 * 60, 0),
+        )
+        self.assertEqual(database.reconcile_scheduled_minutes(), 0)
+
+        with model.Database(STORAGE_URL % (name)).engine().begin() as connection:
+            connection.execute(
+                model.ScheduledMinutes.__table__.update().values(minutes=1)
+            )
+        self.assertEqual(database.reconcile_scheduled_minutes(restaurant.id), 1)
+        self.assertEqual(
+            database.get_hours_remaining(restaurant.id, joe.id, monday), 32
+        )
+
+
+class TestDataVersions(unittest.TestCase):
+    def test_bumped(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        published = []
+        database.subscribe(published.append)
+        restaurant = database.create_restaurant(RESTAURANTS[0])
+        tables = ("role", "user_role_preference")
+        before = database.get_data_versions(tables, [restaurant.id])
+        self.assertEqual(set(before.values()), {0})
+        anywhere = database.get_data_versions(tables)
+
+        database.create_role(restaurant.id, "Server")
+        database.add_user_to_restaurant(database.create_user(**USERS[0]), restaurant)
+        after = database.get_data_versions(tables, [restaurant.id])
+        self.assertEqual(after[(restaurant.id, "role")], 1)
+        self.assertEqual(after[(restaurant.id, "user_role_preference")], 1)
+        self.assertEqual(after[(model.UNMATCHED, "role")], 0)
+        self.assertEqual(
+            database.get_data_versions(tables)[(model.ANYWHERE, "role")], 1
+        )
+
+        followed = dict(before)
+        for changes in published:
+            model.follow_versions(followed, changes)
+            model.follow_versions(anywhere, changes)
+        self.assertEqual(followed, after)
+        self.assertEqual(anywhere, database.get_data_versions(tables))
+        # the changes anywhere are summed up, not kept in a row every commit updates
+        self.assertEqual(
+            database.get_data_versions(tables, [model.ANYWHERE])[
+                (model.ANYWHERE, "role")
+            ],
+            0,
+        )
+
+        other = model.Database(STORAGE_URL % (name))
+        other.get_role_preferences(restaurant.id)[0].priority = 5
+        other.flush()
+        key = (restaurant.id, "user_role_preference")
+        # read again only once the last read is model.VERSION_POLL_SECONDS old
+        self.assertEqual(database.get_data_versions(tables, [restaurant.id])[key], 1)
+        time.sleep(model.VERSION_POLL_SECONDS)
+        self.assertEqual(database.get_data_versions(tables, [restaurant.id])[key], 2)
+
+
+class TestReplicas(unittest.TestCase):
+    def test_reads_routed(self):
+        name = sys._getframe().f_code.co_name
+        replica_name = name + "_replica"
+        open_db(name).close()
+        shutil.copy(STORAGE_PATH % (name), STORAGE_PATH % (replica_name))
+        database = model.Database(
+            STORAGE_URL % (name), replica_urls=[STORAGE_URL % (replica_name)]
+        )
+
+        user_id = database.create_user(**USERS[0]).id
+        self.assertTrue(database.wrote())
+        self.assertEqual(database.get_user(user_id).email, USERS[0]["email"])
+        database.remove_session()
+
+        # the replica has not caught up
+        self.assertFalse(database.wrote())
+        self.assertIsNone(database.find_user(USERS[0]["email"]))
+        self.assertEqual(len(database.get_users()), 0)
+        database.use_primary()
+        self.assertEqual(database.find_user(USERS[0]["email"]).id, user_id)
+        database.remove_session()
+
+        shutil.copy(STORAGE_PATH % (name), STORAGE_PATH % (replica_name))
+        self.assertEqual(database.find_user(USERS[0]["email"]).id, user_id)
+        self.assertEqual(len(database.engines()), 2)
+
+    def test_one_replica_per_session(self):
+        name = sys._getframe().f_code.co_name
+        behind, caught_up = name + "_behind", name + "_caught_up"
+        open_db(name).close()
+        shutil.copy(STORAGE_PATH % (name), STORAGE_PATH % (behind))
+        database = model.Database(
+            STORAGE_URL % (name),
+            replica_urls=[STORAGE_URL % (caught_up), STORAGE_URL % (behind)],
+        )
+        database.create_user(**USERS[0])
+        database.remove_session()
+        shutil.copy(STORAGE_PATH % (name), STORAGE_PATH % (caught_up))
+
+        seen = []
+        for _ in range(0, 2):
+            seen.append(
+                {database.find_user(USERS[0]["email"]) is None for _ in range(0, 4)}
+            )
+            database.remove_session()
+        self.assertEqual(seen, [{False}, {True}])
+
+
 if __name__ == "__main__":
     unittest.main()
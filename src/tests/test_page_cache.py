@@ -0,0 +1,115 @@
+#!/user/bin/env python3
+
+""" Testing rendered page caching
+"""
+
+import datetime
+import os
+import sys
+import time
+import unittest
+
+import identity
+import model
+import scheduling
+from tests.fixtures import STORAGE_URL, UI_PATH, remove_db
+
+
+def open_app(test_function_name):
+    remove_db(test_function_name)
+    app = scheduling.create_app(
+        STORAGE_URL % (test_function_name),
+        UI_PATH,
+        os.path.join(UI_PATH, "template"),
+    )
+    database = model.Database(STORAGE_URL % (test_function_name))
+    gm = database.create_user("gm@c.com", "gm", "GM")
+    restaurant = database.create_restaurant("Baris Pasta & Pizza")
+    restaurant.gm_id = gm.id
+    database.flush()
+    client = app.test_client()
+    client.set_cookie(
+        scheduling.USER_ID_COOKIE, identity.session_token(app.secret_key, gm.id)
+    )
+    return (client, restaurant.id)
+
+
+class TestPageCache(unittest.TestCase):
+    def test_not_modified(self):
+        client, restaurant_id = open_app(sys._getframe().f_code.co_name)
+        url = f"/restaurant/{restaurant_id}"
+        first = client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+        again = client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.headers["ETag"], etag)
+        self.assertEqual(client.get(url).get_data(), first.get_data())
+
+        client.post(f"/restaurant/{restaurant_id}/add_role", data={"name": "Sommelier"})
+        changed = client.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+        self.assertIn("Sommelier", changed.get_data(as_text=True))
+
+    def test_changed_by_another_process(self):
+        name = sys._getframe().f_code.co_name
+        client, restaurant_id = open_app(name)
+        other = scheduling.create_app(
+            STORAGE_URL % (name),
+            UI_PATH,
+            os.path.join(UI_PATH, "template"),
+            secret_key=client.application.secret_key,
+        ).test_client()
+        other.set_cookie(
+            scheduling.USER_ID_COOKIE,
+            client.get_cookie(scheduling.USER_ID_COOKIE).value,
+        )
+        url = f"/restaurant/{restaurant_id}"
+        etag = other.get(url).headers["ETag"]
+
+        client.post(f"/restaurant/{restaurant_id}/add_role", data={"name": "Sommelier"})
+        time.sleep(model.VERSION_POLL_SECONDS)  # another process' change is polled for
+        changed = other.get(url, headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn("Sommelier", changed.get_data(as_text=True))
+
+    def test_open_ended_shift(self):
+        name = sys._getframe().f_code.co_name
+        client, restaurant_id = open_app(name)
+        database = model.Database(STORAGE_URL % (name))
+        database.create_shift(
+            restaurant=database.get_restaurant(restaurant_id),
+            day_of_week=0,
+            start_time=9 * 60,
+            end_time=17 * 60,
+            start_date=datetime.datetime(2022, 1, 1),
+            end_date=None,
+            priority=1,
+        )
+        page = client.get(f"/restaurant/{restaurant_id}")
+        self.assertEqual(page.status_code, 200)
+        self.assertIn("end_date=None", page.get_data(as_text=True))
+
+    def test_user_page_limit(self):
+        name = sys._getframe().f_code.co_name
+        client, _ = open_app(name)
+        database = model.Database(STORAGE_URL % (name))
+        database.search_users("gm@")[0][0].admin = True
+        database.create_user("cook@c.com", "cook", "Cook")
+        database.flush()
+        for limit, count in (("0", 1), ("-5", 1), ("abc", 2)):
+            page = client.get("/users", query_string={"limit": limit}).get_json()
+            self.assertEqual(len(page["users"]), count)
+        page = client.get("/users", query_string={"limit": "0"}).get_json()
+        self.assertIn("limit=1&", page["next"])
+        self.assertIsNone(client.get(page["next"]).get_json()["next"])
+
+    def test_missing_restaurant(self):
+        client, _ = open_app(sys._getframe().f_code.co_name)
+        self.assertEqual(client.get("/restaurant/1000").status_code, 404)
+        self.assertEqual(client.get("/restaurant/abc").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
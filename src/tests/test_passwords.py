@@ -0,0 +1,63 @@
+#!/user/bin/env python3
+
+""" Testing password hashing
+"""
+
+import sys
+import unittest
+
+import model
+import passwords
+from tests.fixtures import STORAGE_URL, open_db
+
+CHEAP_SCRYPT = passwords.Scrypt(n=2**4)
+
+
+class TestPasswordHasher(unittest.TestCase):
+    def test_hash_and_verify(self):
+        for scheme in (CHEAP_SCRYPT, passwords.Pbkdf2(10)):
+            hasher = passwords.PasswordHasher(scheme)
+            stored = hasher.hash("setec astronomy")
+            self.assertTrue(stored.startswith(scheme.name + "$"))
+            self.assertNotEqual(stored, hasher.hash("setec astronomy"))
+            self.assertTrue(hasher.verify("setec astronomy", stored))
+            self.assertFalse(hasher.verify("too many secrets", stored))
+            self.assertFalse(hasher.needs_rehash(stored))
+            self.assertFalse(hasher.verify("setec astronomy", "scrypt$n=16$bad"))
+            hasher.close()
+
+    def test_needs_rehash(self):
+        hasher = passwords.PasswordHasher(CHEAP_SCRYPT)
+        stronger = passwords.PasswordHasher(passwords.Scrypt(n=2**5))
+        stored = hasher.hash("let me in")
+        self.assertTrue(stronger.needs_rehash(stored))
+        self.assertTrue(stronger.verify("let me in", stored))
+        legacy = passwords.legacy_hash("let me in")
+        self.assertTrue(hasher.verify("let me in", legacy))
+        self.assertTrue(hasher.needs_rehash(legacy))
+
+
+class TestCheckPassword(unittest.TestCase):
+    def test_rehash_on_login(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name, hasher=passwords.PasswordHasher(CHEAP_SCRYPT))
+        user_id = database.create_user("a@c.com", "password", "A").id
+        database.close()
+
+        stronger = passwords.Scrypt(n=2**5)
+        database = model.Database(
+            STORAGE_URL % (name), hasher=passwords.PasswordHasher(stronger)
+        )
+        self.assertFalse(database.check_password(database.get_user(user_id), "wrong"))
+        self.assertTrue(
+            database.get_user(user_id).password_hash.startswith("scrypt$n=16,")
+        )
+        self.assertTrue(database.check_password(database.get_user(user_id), "password"))
+        database.remove_session()
+        rehashed = database.get_user(user_id).password_hash
+        self.assertTrue(rehashed.startswith("scrypt$" + stronger.parameters() + "$"))
+        self.assertTrue(database.check_password(database.get_user(user_id), "password"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+#!/user/bin/env python3
+
+""" Testing shift expansion
+"""
+
+import datetime
+import sys
+import time
+import unittest
+
+import model
+import shift_calendar
+from tests.fixtures import MONDAY, STORAGE_URL
+from tests.fixtures import add_shift, open_db
+
+
+def shift_ids(calendar, restaurant, start, days):
+    return [
+        [s.id for s in shifts]
+        for _, shifts in calendar.expand_shifts(restaurant.id, start, days)[1]
+    ]
+
+
+class TestShiftCalendar(unittest.TestCase):
+    def test_expand(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant = database.create_restaurant("Baris Pasta & Pizza")
+        server = database.create_role(restaurant.id, "Server")
+        old = add_shift(database, restaurant, 0)
+        database.add_role_to_shift(old, server, 2)
+        evening = add_shift(database, restaurant, 0, start_time=17 * 60, end_time=60)
+        new = add_shift(
+            database,
+            restaurant,
+            0,
+            start_time=10 * 60,
+            end_time=14 * 60,
+            start_date=datetime.datetime(2022, 1, 10),
+        )
+        late = add_shift(database, restaurant, 6, start_time=23 * 60, end_time=0)
+        calendar = shift_calendar.ShiftCalendar(database)
+        self.assertEqual(
+            shift_ids(calendar, restaurant, MONDAY, 8),
+            [[old.id, evening.id], [], [], [], [], [], [late.id], [new.id, evening.id]],
+        )
+        _, expanded = calendar.expand_shifts(restaurant.id, MONDAY, 1)
+        self.assertEqual(
+            shift_calendar.as_json(*expanded[0])["shifts"][0]["roles"],
+            [{"id": server.id, "role": "Server", "number": 2}],
+        )
+
+    def test_version(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant = database.create_restaurant("Baris Pasta & Pizza")
+        server = database.create_role(restaurant.id, "Server")
+        first = add_shift(database, restaurant, 0)
+        calendar = shift_calendar.ShiftCalendar(database)
+        version, _ = calendar.expand_shifts(restaurant.id, MONDAY, 1)
+        self.assertEqual(shift_ids(calendar, restaurant, MONDAY, 1), [[first.id]])
+
+        database.add_role_to_shift(first, server, 1)
+        self.assertGreater(calendar.version(restaurant.id), version)
+        _, expanded = calendar.expand_shifts(restaurant.id, MONDAY, 1)
+        self.assertEqual(len(expanded[0][1][0].roles), 1)
+
+        second = add_shift(database, restaurant, 0, start_time=17 * 60)
+        self.assertEqual(
+            shift_ids(calendar, restaurant, MONDAY, 1), [[first.id, second.id]]
+        )
+
+    def test_changed_by_another_process(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        restaurant = database.create_restaurant("Baris Pasta & Pizza")
+        server = database.create_role(restaurant.id, "Server")
+        calendar = shift_calendar.ShiftCalendar(model.Database(STORAGE_URL % (name)))
+        self.assertEqual(shift_ids(calendar, restaurant, MONDAY, 1), [[]])
+
+        shift = add_shift(database, restaurant, 0)
+        database.add_role_to_shift(shift, server, 1)
+        time.sleep(model.VERSION_POLL_SECONDS)  # another process' change is polled for
+        _, expanded = calendar.expand_shifts(restaurant.id, MONDAY, 1)
+        self.assertEqual([len(s.roles) for s in expanded[0][1]], [1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/user/bin/env python3
+
+""" Testing the restaurant snapshot
+"""
+
+import pickle
+import sys
+import unittest
+
+import snapshot
+from tests.fixtures import START_DATE
+from tests.fixtures import add_availability, add_shift, create_restaurant, open_db
+
+
+def create_scenario(database):
+    """a restaurant with a server and a cook role, a shift needing two servers and a
+    cook on Mondays, employee 0 (40 hour limit) available Monday evenings past
+    midnight and employee 1 (no limit) available all Monday"""
+    restaurant, server, cook, users = create_restaurant(database, 2)
+    users[1].hours_limit = None
+    database.flush()
+    shift = add_shift(database, restaurant, 0, [(server, 2), (cook, 1)], end_date=None)
+    for index, (start_time, end_time) in enumerate([(18 * 60, 60), (0, 23 * 60 + 59)]):
+        add_availability(
+            database,
+            users[index],
+            restaurant,
+            0,
+            index + 1,
+            start_time=start_time,
+            end_time=end_time,
+        )
+    return (restaurant, server, cook, shift, users)
+
+
+class TestSnapshot(unittest.TestCase):
+    def test_load(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, cook, shift, users = create_scenario(database)
+        loaded = snapshot.RestaurantSnapshot.load(database, restaurant.id)
+
+        self.assertEqual(list(loaded.user_ids), [u.id for u in users])
+        self.assertEqual(loaded.names, ["Employee 0", "Employee 1"])
+        self.assertEqual(loaded.limit(users[0].id), 40 * 60)
+        self.assertIsNone(loaded.limit(users[1].id))
+        self.assertIsNone(loaded.employee(users[1].id + 1))
+        self.assertEqual(loaded.roles_of(users[0].id), {server.id, cook.id})
+        self.assertEqual(
+            [u for _, _, u, _ in loaded.candidates(server.id)], [u.id for u in users]
+        )
+        self.assertEqual(loaded.candidates(cook.id + 1), [])
+        self.assertEqual(
+            loaded.demand(shift.id),
+            [snapshot.Demand(server.id, 2), snapshot.Demand(cook.id, 1)],
+        )
+        self.assertEqual(loaded.shift_times(shift.id), (9 * 60, 17 * 60))
+        (row,) = loaded.shift_rows()
+        self.assertEqual(
+            (row.id, row.start_date, row.end_date), (shift.id, START_DATE, None)
+        )
+
+        evening = loaded.availabilities(loaded.employee(users[0].id), 0)
+        self.assertEqual(len(evening), 1)
+        self.assertEqual(
+            (
+                loaded.availability_start[evening[0]],
+                loaded.availability_end[evening[0]],
+            ),
+            (18 * 60, 25 * 60),
+        )
+        self.assertEqual(len(loaded.availabilities(loaded.employee(users[0].id), 1)), 0)
+
+    def test_pickle(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, shift, users = create_scenario(database)
+        loaded = snapshot.RestaurantSnapshot.load(database, restaurant.id)
+        copied = pickle.loads(pickle.dumps(loaded))
+
+        self.assertEqual(copied.candidates(server.id), loaded.candidates(server.id))
+        self.assertEqual(copied.demand(shift.id), loaded.demand(shift.id))
+        self.assertEqual(copied.limit(users[0].id), loaded.limit(users[0].id))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,218 @@
+#!/user/bin/env python3
+
+""" Testing schedule generation
+"""
+
+import datetime
+import sys
+import unittest
+
+import batch
+import solver
+from tests.fixtures import MONDAY, STORAGE_URL
+from tests.fixtures import add_availability, add_shift, create_restaurant, open_db
+
+
+class TestSolver(unittest.TestCase):
+    def test_fills_available(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 3)
+        add_shift(database, restaurant, 0, [(server, 2)])
+        add_availability(database, users[0], restaurant, 0, 2)
+        add_availability(database, users[1], restaurant, 0, 4)
+        add_availability(database, users[2], restaurant, 0, 1)
+        result = solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        self.assertEqual(
+            sorted(a.user_id for a in result.assignments), [users[0].id, users[2].id]
+        )
+        self.assertEqual(result.unfilled, [])
+        scheduled = database.get_scheduled_shifts(
+            restaurant.id, MONDAY, MONDAY + datetime.timedelta(days=7)
+        )
+        self.assertEqual(len(scheduled), 2)
+        self.assertTrue(all(s.draft for s in scheduled))
+
+    def test_unfilled(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, cook, users = create_restaurant(database, 2)
+        add_shift(database, restaurant, 1, [(server, 1), (cook, 1)])
+        add_availability(database, users[0], restaurant, 1, 1)
+        result = solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        self.assertEqual(len(result.assignments), 1)
+        self.assertEqual(len(result.unfilled), 1)
+        self.assertEqual(result.unfilled[0].count, 1)
+
+    def test_no_double_booking(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 1)
+        add_shift(database, restaurant, 2, [(server, 1)])
+        add_shift(
+            database, restaurant, 2, [(server, 1)], start_time=12 * 60, end_time=20 * 60
+        )
+        add_availability(database, users[0], restaurant, 2, 1, end_time=20 * 60)
+        result = solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        self.assertEqual(len(result.assignments), 1)
+
+    def test_hours_limit(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 1, hours_limit=20.0)
+        for day in range(0, 7):
+            add_shift(database, restaurant, day, [(server, 1)])
+            add_availability(database, users[0], restaurant, day, 1)
+        result = solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        self.assertEqual(len(result.assignments), 2)
+
+    def test_hours_limit_counts_whole_week(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 1, hours_limit=20.0)
+        for day in range(0, 7):
+            add_shift(database, restaurant, day, [(server, 1)])
+            add_availability(database, users[0], restaurant, day, 1)
+        solver.generate_schedule(database, restaurant.id, MONDAY, 2)
+        wednesday = MONDAY + datetime.timedelta(days=2)
+        result = solver.generate_schedule(database, restaurant.id, wednesday, 5)
+        self.assertEqual(result.assignments, [])
+
+    def test_regenerate_replaces_drafts(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 2)
+        add_shift(database, restaurant, 0, [(server, 1)])
+        add_availability(database, users[0], restaurant, 0, 1)
+        add_availability(database, users[1], restaurant, 0, 2)
+        solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        scheduled = database.get_scheduled_shifts(
+            restaurant.id, MONDAY, MONDAY + datetime.timedelta(days=7)
+        )
+        self.assertEqual([s.user_id for s in scheduled], [users[0].id])
+
+    def test_gm_priority(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 2)
+        add_shift(database, restaurant, 0, [(server, 1)])
+        add_availability(database, users[0], restaurant, 0, 1)
+        add_availability(database, users[1], restaurant, 0, 1)
+        for preference in database.get_role_preferences(restaurant.id):
+            if preference.role_id == server.id:
+                preference.gm_priority = (
+                    1.0 if preference.user_id == users[1].id else 2.0
+                )
+        database.flush()
+        result = solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        self.assertEqual([a.user_id for a in result.assignments], [users[1].id])
+
+    def test_repair_availability(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 2)
+        for day in (0, 1):
+            add_shift(database, restaurant, day, [(server, 1)])
+            add_availability(database, users[0], restaurant, day, 1)
+            add_availability(database, users[1], restaurant, day, 2)
+        solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        before = database.get_scheduled_shifts(
+            restaurant.id, MONDAY, MONDAY + datetime.timedelta(days=7)
+        )
+        tuesday = [s.id for s in before if s.date.weekday() == 1]
+        add_availability(database, users[0], restaurant, 0, solver.CANNOT_WORK)
+        repair = solver.repair_schedule(
+            database,
+            restaurant.id,
+            [solver.AvailabilityChanged(users[0].id, 0)],
+            MONDAY,
+        )
+        self.assertEqual([s.user_id for s in repair.removed], [users[0].id])
+        self.assertEqual([a.user_id for a in repair.added], [users[1].id])
+        after = database.get_scheduled_shifts(
+            restaurant.id, MONDAY, MONDAY + datetime.timedelta(days=7)
+        )
+        self.assertEqual(
+            sorted((s.date.weekday(), s.user_id) for s in after),
+            [(0, users[1].id), (1, users[0].id)],
+        )
+        self.assertEqual([s.id for s in after if s.date.weekday() == 1], tuesday)
+
+    def test_repair_demand(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 3)
+        shift = add_shift(database, restaurant, 0, [(server, 1)])
+        for index, user in enumerate(users):
+            add_availability(database, user, restaurant, 0, index + 1)
+        solver.generate_schedule(database, restaurant.id, MONDAY, 7)
+        database.add_role_to_shift(shift, server, 1)
+        database.flush()
+        repair = solver.repair_schedule(
+            database, restaurant.id, [solver.DemandChanged(shift.id, server.id)], MONDAY
+        )
+        self.assertEqual(repair.removed, [])
+        self.assertEqual([a.user_id for a in repair.added], [users[1].id])
+
+    def test_repair_only_changed_slots(self):
+        database = open_db(sys._getframe().f_code.co_name)
+        restaurant, server, _, users = create_restaurant(database, 2)
+        monday = add_shift(database, restaurant, 0, [(server, 1)])
+        add_shift(database, restaurant, 1, [(server, 1)])
+        for day in (0, 1):
+            add_availability(database, users[0], restaurant, day, 1)
+            add_availability(database, users[1], restaurant, day, 2)
+        solver.generate_schedule(database, restaurant.id, MONDAY, 28)
+        next_monday = MONDAY + datetime.timedelta(days=7)
+        add_availability(
+            database,
+            users[0],
+            restaurant,
+            0,
+            solver.CANNOT_WORK,
+            start_date=next_monday,
+            end_date=next_monday,
+        )
+        changed = solver.AvailabilityChanged(users[0].id, 0, next_monday, next_monday)
+        inputs, drafts = solver.load_inputs(
+            database, restaurant.id, MONDAY, MONDAY + datetime.timedelta(days=28)
+        )
+        dates = sorted({solver.as_date(s.date) for s in drafts})
+        self.assertEqual(len(dates), 8)
+        self.assertEqual(
+            solver.affected_slots(inputs, dates, drafts, [changed]),
+            {(next_monday.date(), monday.id, server.id)},
+        )
+        self.assertEqual(
+            solver.affected_slots(
+                inputs, dates, drafts, [solver.DemandChanged(monday.id, server.id)]
+            ),
+            {(d, monday.id, server.id) for d in dates if d.weekday() == 0},
+        )
+
+        repair = solver.repair_schedule(database, restaurant.id, [changed], MONDAY)
+        self.assertEqual(
+            [(s.date, s.user_id) for s in repair.removed], [(next_monday, users[0].id)]
+        )
+        self.assertEqual(
+            [(a.date, a.user_id) for a in repair.added], [(next_monday, users[1].id)]
+        )
+
+    def test_generate_all(self):
+        name = sys._getframe().f_code.co_name
+        database = open_db(name)
+        restaurant_ids = []
+        for _ in range(0, 3):
+            restaurant, server, _, users = create_restaurant(database, 1)
+            add_shift(database, restaurant, 0, [(server, 2)])
+            add_availability(database, users[0], restaurant, 0, 1)
+            restaurant_ids.append(restaurant.id)
+        reported = []
+        finished = batch.generate_all(
+            STORAGE_URL % (name), MONDAY, workers=2, report=reported.append
+        )
+        self.assertEqual(finished, reported)
+        self.assertEqual(sorted(g.restaurant_id for g in finished), restaurant_ids)
+        self.assertTrue(all(g.error is None for g in finished))
+        self.assertEqual({(g.assigned, g.unfilled) for g in finished}, {(1, 1)})
+        for restaurant_id in restaurant_ids:
+            scheduled = database.get_scheduled_shifts(
+                restaurant_id, MONDAY, MONDAY + datetime.timedelta(days=7)
+            )
+            self.assertEqual(len(scheduled), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
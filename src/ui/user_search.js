@@ -0,0 +1,78 @@
+
+/*
+    GET /users?prefix=jo&limit=50&cursor=joe%40c.com
+{
+    "users": [ // in email order
+        {
+            "id": 3,
+            "name": "Joe",
+            "email": "joe@c.com"
+        }
+    ],
+    "next": "/users?prefix=jo&limit=50&cursor=june%40c.com" // null on the last page
+}
+*/
+
+/*
+    Add users to a list (<ul> gets an <li> per user, <select> an <option>).
+*/
+function appendUsers (users, list) {
+    for (let userIndex = 0; userIndex < users.length; ++userIndex) {
+        const user = users[userIndex];
+        const item = document.createElement(list.tagName === 'SELECT' ? 'option' : 'li');
+
+        item.value = user.id;
+        item.textContent = user.name + ' (' + user.email + ')';
+        list.appendChild(item);
+    }
+}
+
+/*
+    Show the next page url on the more button (hidden if there are no more users).
+*/
+function updateMore (next, moreId) {
+    if (moreId) {
+        const more = document.getElementById(moreId);
+
+        more.dataset.next = next || '';
+        more.hidden = !next;
+    }
+}
+
+let latestSearch = 0;
+
+/*
+    Replace the users in a list with the first page of users whose email starts with prefix.
+*/
+function searchUsers (prefix, listId, moreId) {
+    const search = ++latestSearch;
+
+    fetch('/users?prefix=' + encodeURIComponent(prefix), { credentials: 'same-origin' })
+        .then(response => response.json())
+        .then(page => {
+            if (search !== latestSearch) {
+                return; // the admin has typed more since
+            }
+            const list = document.getElementById(listId);
+
+            list.replaceChildren();
+            appendUsers(page.users, list);
+            updateMore(page.next, moreId);
+        });
+}
+
+/*
+    Add the next page of users to a list.
+*/
+function moreUsers (listId, moreId) {
+    const next = document.getElementById(moreId).dataset.next;
+
+    if (next) {
+        fetch(next, { credentials: 'same-origin' })
+            .then(response => response.json())
+            .then(page => {
+                appendUsers(page.users, document.getElementById(listId));
+                updateMore(page.next, moreId);
+            });
+    }
+}